@@ -0,0 +1,189 @@
+"""Batch analysis of FEN positions over a process pool with an on-disk result cache; run with python -m Chess.Analysis"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from Chess import ChessEngine, SmartMoveFinder, TranspositionTable as TT, UciEngine
+
+DEFAULT_DEPTH = 4
+_workerTable = None
+
+
+def readFens(stream):
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+'''
+Search of one position in a worker. Each worker process keeps its own transposition table between positions.
+With profile the result carries the search's SearchStats, timers included.
+'''
+def analyzePosition(task):
+    global _workerTable
+    fen, depth, nodes, hashMB, profile = task
+    if _workerTable is None:
+        _workerTable = TT.TranspositionTable(hashMB)
+    try:
+        gs = ChessEngine.GameState(fen)
+    except (ValueError, KeyError, IndexError) as e:
+        return {"fen": fen, "error": "bad FEN: %s" % e}
+    finder = SmartMoveFinder.MoveFinder(None, depth or SmartMoveFinder.MAX_DEPTH, nodes, _workerTable)
+    finder.profile = profile
+    start = time.perf_counter()
+    move = finder.search(gs)
+    elapsed = time.perf_counter() - start
+    result = {"fen": fen, "depth": finder.depth, "nodes": finder.nodes, "time": round(elapsed, 3)}
+    if profile:
+        result["stats"] = finder.stats.toDict()
+    if move is None:
+        result.update({"bestmove": None, "score": None, "mate": 0 if gs.inCheck else None, "pv": []})
+        return result
+    score = UciEngine.scoreToUci(finder.score).split()
+    result["bestmove"] = UciEngine.moveToUci(move)
+    result["score"] = finder.score
+    result["mate"] = int(score[1]) if score[0] == "mate" else None
+    result["pv"] = [UciEngine.moveToUci(pvMove) for pvMove in finder.principalVariation(gs, finder.depth)] \
+        or [result["bestmove"]]
+    return result
+
+
+class AnalysisCache():
+    '''
+    SQLite table of results keyed by (Zobrist key, depth, node limit), so a rerun over the same
+    positions with the same limits skips the search. Keys are stored as signed 64-bit integers.
+    '''
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS analysis (key INTEGER, depth INTEGER, nodes INTEGER, "
+                        "result TEXT, PRIMARY KEY (key, depth, nodes))")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def positionKey(fen):
+        key = ChessEngine.GameState(fen).zobristKey
+        return key - (1 << 64) if key >= 1 << 63 else key
+
+    def get(self, key, depth, nodes):
+        row = self.db.execute("SELECT result FROM analysis WHERE key = ? AND depth = ? AND nodes = ?",
+                              (key, depth or 0, nodes or 0)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, depth, nodes, result):
+        self.db.execute("INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?)",
+                        (key, depth or 0, nodes or 0, json.dumps(result)))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+'''
+Yields a result dict per FEN, in input order, searching to depth plies or for nodes nodes.
+FENs are read lazily and at most two per worker are in flight, so input of any size streams through.
+Results found in cache (an AnalysisCache) are yielded without searching and marked "cached".
+With profile every search is timed and its stats added to the result; the cache is then bypassed.
+'''
+def analyze(fens, depth=None, nodes=None, workers=1, cache=None, hashMB=TT.DEFAULT_SIZE_MB, commitEvery=100,
+            profile=False):
+    if depth is None and nodes is None:
+        depth = DEFAULT_DEPTH
+    pending = collections.deque()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    if profile:
+        cache = None
+    stored = 0
+
+    def collect(entry):
+        nonlocal stored
+        key, asyncResult, result = entry
+        if asyncResult is not None:
+            result = asyncResult.get()
+        if result.get("cached"):
+            return result
+        if cache is not None and key is not None and "error" not in result:
+            cache.put(key, depth, nodes, result)
+            stored += 1
+            if stored % commitEvery == 0:
+                cache.commit()
+        result["cached"] = False
+        return result
+
+    try:
+        for fen in fens:
+            key = None
+            cached = None
+            if cache is not None:
+                try:
+                    key = AnalysisCache.positionKey(fen)
+                    cached = cache.get(key, depth, nodes)
+                except (ValueError, KeyError, IndexError):
+                    key = None
+            if cached is not None:
+                cached.update({"fen": fen, "cached": True})
+                pending.append((key, None, cached))
+            elif pool is None:
+                pending.append((key, None, analyzePosition((fen, depth, nodes, hashMB, profile))))
+            else:
+                pending.append((key, pool.apply_async(analyzePosition, ((fen, depth, nodes, hashMB, profile),)), None))
+            while pending and (pending[0][1] is None or len(pending) > workers * 2):
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if cache is not None:
+            cache.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze FEN positions and write JSON lines")
+    parser.add_argument("input", nargs="?", default="-", help="file with one FEN per line, - for stdin")
+    parser.add_argument("--output", default="-", help="JSONL output file, - for stdout")
+    limits = parser.add_mutually_exclusive_group()
+    limits.add_argument("--depth", type=int, help="plies to search each position (default %d)" % DEFAULT_DEPTH)
+    limits.add_argument("--nodes", type=int, help="nodes to search each position")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cache", help="SQLite file caching results between runs")
+    parser.add_argument("--hash", type=int, default=TT.DEFAULT_SIZE_MB, help="table size per worker in MB")
+    parser.add_argument("--profile", action="store_true", help="add search counters and timings to each result")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    cache = AnalysisCache(args.cache) if args.cache else None
+    count = 0
+    start = time.perf_counter()
+    try:
+        for result in analyze(readFens(source), args.depth, args.nodes, args.workers, cache, args.hash,
+                              profile=args.profile):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            count += 1
+    finally:
+        if cache is not None:
+            cache.close()
+        if out is not sys.stdout:
+            out.close()
+        if source is not sys.stdin:
+            source.close()
+    elapsed = time.perf_counter() - start
+    sys.stderr.write("%d positions in %.2fs (%.1f/s)%s\n" % (count, elapsed, count / elapsed if elapsed else 0,
+                     ", %d from cache" % cache.hits if cache is not None else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
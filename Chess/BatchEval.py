@@ -0,0 +1,168 @@
+"""Batch encoding of positions into NumPy arrays and vectorized material and piece-square scoring; run with python -m Chess.BatchEval"""
+import argparse
+import sys
+import time
+try:
+    import numpy as np
+except ImportError as e: #numpy is an optional dependency needed only here, see requirements.txt
+    raise ImportError("Chess.BatchEval requires numpy, which is optional for the rest of the engine: "
+                      "pip install numpy") from e
+from Chess import Evaluation
+
+'''
+Positions are first turned into an (N, 64) uint8 array of piece indices, squares in board order
+(sq = row * 8 + col, a8 first) and EMPTY where there is no piece. Everything else, from expanding the
+digits of the FEN board fields on, is done with whole-batch NumPy operations: the only per-position
+Python work is splitting each FEN at its first space and taking the length of its board field.
+'''
+PIECES = ("wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK") #plane order
+FEN_PIECES = "PNBRQKpnbrqk"
+EMPTY = len(PIECES)
+#Per FEN byte: the piece index it stands for (255 if none), and how many squares it covers
+_LOOKUP = np.full(256, 255, dtype=np.uint8)
+_WIDTHS = np.ones(256, dtype=np.intp)
+_WIDTHS[ord("/")] = 0
+for _n in range(1, 9):
+    _LOOKUP[ord(str(_n))] = EMPTY
+    _WIDTHS[ord(str(_n))] = _n
+for _index, _char in enumerate(FEN_PIECES):
+    _LOOKUP[ord(_char)] = _index
+
+#Flattened (EMPTY + 1) x 64 tables indexed by piece * 64 + sq, so empty squares read a row of zeros
+MG_TABLE = np.zeros((EMPTY + 1) * 64, dtype=np.int32)
+EG_TABLE = np.zeros((EMPTY + 1) * 64, dtype=np.int32)
+PHASE_TABLE = np.zeros((EMPTY + 1) * 64, dtype=np.int32)
+for _index, _piece in enumerate(PIECES):
+    MG_TABLE[_index * 64:_index * 64 + 64] = Evaluation.MG_SCORES[_piece]
+    EG_TABLE[_index * 64:_index * 64 + 64] = Evaluation.EG_SCORES[_piece]
+    PHASE_TABLE[_index * 64:_index * 64 + 64] = Evaluation.PHASE[_piece]
+_SQUARES = np.arange(64, dtype=np.int32)
+_SQUARE_BITS = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+
+'''
+(squares, whiteToMove) for a sequence of FEN strings: the (N, 64) piece index array and an (N,) bool array.
+Raises ValueError naming the first FEN without exactly 8 ranks of 8 squares or with an unknown piece.
+'''
+def encodeFens(fens):
+    fields = [fen.partition(" ") for fen in fens]
+    count = len(fields)
+    text = np.frombuffer("".join([field[0] for field in fields]).encode("ascii", "replace"), dtype=np.uint8)
+    widths = _WIDTHS[text]
+    ends = np.cumsum([len(field[0]) for field in fields], dtype=np.intp)
+    slashes = np.flatnonzero(text == ord("/"))
+    badRanks = np.diff(np.searchsorted(slashes, ends), prepend=0) != 7
+    if badRanks.any():
+        bad = int(np.argmax(badRanks))
+        raise ValueError("FEN %d does not have 8 ranks: %r" % (bad, fens[bad]))
+    #slashes cover no squares, so the running total at each slash and at each FEN's last byte closes a rank;
+    #column 0 is where the previous FEN left off
+    covered = np.cumsum(widths)
+    totals = np.zeros((count, 9), dtype=covered.dtype)
+    totals[:, 1:8] = covered[slashes].reshape(count, 7)
+    totals[:, 8] = covered[ends - 1]
+    totals[1:, 0] = totals[:-1, 8]
+    badWidths = (np.diff(totals, axis=1) != 8).any(axis=1)
+    if badWidths.any():
+        bad = int(np.argmax(badWidths))
+        raise ValueError("FEN %d has a rank that is not 8 squares wide: %r" % (bad, fens[bad]))
+    squares = np.repeat(_LOOKUP[text], widths).reshape(len(fields), 64)
+    if (squares == 255).any():
+        bad = int(np.nonzero((squares == 255).any(axis=1))[0][0])
+        raise ValueError("FEN %d has an unknown piece: %r" % (bad, fens[bad]))
+    return squares, np.array([field[2][:1] != "b" for field in fields], dtype=bool)
+
+'''
+As encodeFens, for GameStates (or anything with board and whiteToMove)
+'''
+def encodeStates(states):
+    chars = {piece: FEN_PIECES[index] for index, piece in enumerate(PIECES)}
+    chars["--"] = "1" #any digit reads as EMPTY
+    text = "".join(chars[square] for gs in states for row in gs.board for square in row).encode("ascii")
+    squares = _LOOKUP[np.frombuffer(text, dtype=np.uint8)].reshape(-1, 64)
+    return squares, np.array([gs.whiteToMove for gs in states], dtype=bool)
+
+'''
+(N, 12, 8, 8) uint8 one-hot planes in PIECES order, rows from rank 8 down as on the board
+'''
+def toPlanes(squares):
+    planes = (squares[:, None, :] == np.arange(EMPTY, dtype=np.uint8)[None, :, None])
+    return planes.astype(np.uint8).reshape(len(squares), EMPTY, 8, 8)
+
+'''
+(N, 12) uint64 bitboards in PIECES order, bit sq = row * 8 + col as in BitboardEngine
+'''
+def toBitboards(squares):
+    bitboards = np.zeros((len(squares), EMPTY), dtype=np.uint64)
+    for index in range(EMPTY):
+        bitboards[:, index] = np.where(squares == index, _SQUARE_BITS, np.uint64(0)).sum(axis=1, dtype=np.uint64)
+    return bitboards
+
+'''
+Tapered material and piece-square score of each position, the same value Evaluation.taper gives for
+gs.mgScore, gs.egScore and gs.phase: white positive, or from the side to move when whiteToMove is given.
+Returns (N,) int64.
+'''
+def evaluate(squares, whiteToMove=None):
+    index = squares.astype(np.int32) * 64 + _SQUARES
+    mg = MG_TABLE.take(index).sum(axis=1, dtype=np.int64)
+    eg = EG_TABLE.take(index).sum(axis=1, dtype=np.int64)
+    phase = np.minimum(PHASE_TABLE.take(index).sum(axis=1, dtype=np.int64), Evaluation.MAX_PHASE)
+    score = (mg * phase + eg * (Evaluation.MAX_PHASE - phase)) // Evaluation.MAX_PHASE
+    if whiteToMove is not None:
+        score = np.where(whiteToMove, score, -score)
+    return score
+
+
+def evaluateFens(fens):
+    squares, whiteToMove = encodeFens(fens)
+    return evaluate(squares, whiteToMove)
+
+
+def readChunks(stream, size):
+    chunk = []
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            chunk.append(line)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encode and score FEN positions in batches")
+    parser.add_argument("input", nargs="?", default="-", help="file with one FEN per line, - for stdin")
+    parser.add_argument("--output", help=".npz file for bitboards, side to move and scores")
+    parser.add_argument("--planes", action="store_true", help="also save N x 12 x 8 x 8 planes")
+    parser.add_argument("--chunk", type=int, default=100000, help="positions encoded per batch")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    results = {"bitboards": [], "whiteToMove": [], "scores": []}
+    if args.planes:
+        results["planes"] = []
+    count = 0
+    start = time.perf_counter()
+    try:
+        for chunk in readChunks(source, args.chunk):
+            squares, whiteToMove = encodeFens(chunk)
+            results["bitboards"].append(toBitboards(squares))
+            results["whiteToMove"].append(whiteToMove)
+            results["scores"].append(evaluate(squares, whiteToMove))
+            if args.planes:
+                results["planes"].append(toPlanes(squares))
+            count += len(chunk)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    elapsed = time.perf_counter() - start
+    if args.output and count:
+        np.savez(args.output, **{name: np.concatenate(parts) for name, parts in results.items()})
+    sys.stderr.write("%d positions in %.2fs (%.0f/s)\n" % (count, elapsed, count / elapsed if elapsed else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
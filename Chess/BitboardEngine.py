@@ -0,0 +1,624 @@
+"""Bitboard backed alternative to ChessEngine.GameState; same makeMove/undoMove/getValidMoves API"""
+from Chess.ChessEngine import Move, computeZobristKey, computePawnKey, ZOBRIST_PIECES, ZOBRIST_BLACK_TO_MOVE, \
+    ZOBRIST_CASTLING, ZOBRIST_ENPASSANT, WKS, WQS, BKS, BQS, CASTLE_RIGHTS_MASK, PROMOTION_PIECES, START_FEN, \
+    parseFen, makeFen, enpassantSquare
+from Chess.Evaluation import MG_SCORES, EG_SCORES, PHASE, computePieceSquare
+
+'''
+Squares are indexed row * 8 + col, so bit 0 is a8 and bit 63 is h1, matching the row/col layout of board
+'''
+FULL = (1 << 64) - 1
+PIECES = ("wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (2, -1), (2, 1), (1, -2), (1, 2), (-1, -2), (-1, 2))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def _stepTable(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for dRow, dCol in offsets:
+            endRow, endCol = row + dRow, col + dCol
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                bb |= 1 << (endRow * 8 + endCol)
+        table.append(bb)
+    return table
+
+
+def _rayTable(direction):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for i in range(1, 8):
+            endRow, endCol = row + direction[0] * i, col + direction[1] * i
+            if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                break
+            bb |= 1 << (endRow * 8 + endCol)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _stepTable(KNIGHT_OFFSETS)
+KING_ATTACKS = _stepTable(KING_OFFSETS)
+#PAWN_ATTACKS["w"][sq] are the squares a white pawn on sq attacks
+PAWN_ATTACKS = {"w": _stepTable(((-1, -1), (-1, 1))), "b": _stepTable(((1, -1), (1, 1)))}
+#Directions moving towards higher square indexes stop at the lowest blocker, the rest at the highest
+ROOK_RAYS = [(_rayTable(d), d[0] * 8 + d[1] > 0) for d in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(_rayTable(d), d[0] * 8 + d[1] > 0) for d in BISHOP_DIRECTIONS]
+
+
+'''
+Index of the blocker nearest the start of a ray, -1 if there is none
+'''
+def _nearest(blockers, positive):
+    if not blockers:
+        return -1
+    if positive:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+def _slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def rookAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, ROOK_RAYS)
+
+
+def bishopAttacks(sq, occupied):
+    return _slidingAttacks(sq, occupied, BISHOP_RAYS)
+
+
+def iterBits(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+class BitboardGameState():
+    def __init__(self, fen=START_FEN):
+        self.loadFen(fen)
+
+    def loadFen(self, fen):
+        self.board, self.whiteToMove, self.currentCastlingRights, self.enpassantPossible, \
+            self.halfmoveClock, self.fullmoveNumber = parseFen(fen)
+        self.moveLog = []
+        self.whiteKingLocation = ()
+        self.blackKingLocation = ()
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col] == "wK":
+                    self.whiteKingLocation = (row, col)
+                elif self.board[row][col] == "bK":
+                    self.blackKingLocation = (row, col)
+        self.checkMate = False
+        self.staleMate = False
+        self.inCheck = False
+        self.syncBitboards()
+        self.zobristKey = computeZobristKey(self)
+        self.pawnKey = computePawnKey(self)
+        self.mgScore, self.egScore, self.phase = computePieceSquare(self.board)
+        self.pieceCount = sum(piece != "--" for boardRow in self.board for piece in boardRow) #kings included
+        self.undoLog = []
+
+    def getFen(self):
+        return makeFen(self.board, self.whiteToMove, self.currentCastlingRights, self.enpassantPossible,
+                       self.halfmoveClock, self.fullmoveNumber)
+
+    '''
+    Rebuilds the twelve piece sets and the occupancy masks from board
+    '''
+    def syncBitboards(self):
+        self.pieces = {piece: 0 for piece in PIECES}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    self.pieces[piece] |= 1 << (row * 8 + col)
+        self.occupancy = {"w": 0, "b": 0}
+        for piece, bb in self.pieces.items():
+            self.occupancy[piece[0]] |= bb
+
+    '''
+    Every board change goes through here, so it also keeps the hash, the evaluation terms and pieceCount current
+    '''
+    def _setPiece(self, row, col, piece):
+        sq = row * 8 + col
+        bit = 1 << sq
+        old = self.board[row][col]
+        if old != "--":
+            self.pieces[old] ^= bit
+            self.occupancy[old[0]] ^= bit
+            self.zobristKey ^= ZOBRIST_PIECES[old][sq]
+            self.mgScore -= MG_SCORES[old][sq]
+            self.egScore -= EG_SCORES[old][sq]
+            self.phase -= PHASE[old]
+            self.pieceCount -= 1
+            if old[1] == "P":
+                self.pawnKey ^= ZOBRIST_PIECES[old][sq]
+        if piece != "--":
+            self.pieces[piece] |= bit
+            self.occupancy[piece[0]] |= bit
+            self.zobristKey ^= ZOBRIST_PIECES[piece][sq]
+            self.mgScore += MG_SCORES[piece][sq]
+            self.egScore += EG_SCORES[piece][sq]
+            self.phase += PHASE[piece]
+            self.pieceCount += 1
+            if piece[1] == "P":
+                self.pawnKey ^= ZOBRIST_PIECES[piece][sq]
+        self.board[row][col] = piece
+
+    def makeMove(self, move):
+        if self.board[move.startRow][move.startCol] != '--':
+            self.undoLog.append((self.currentCastlingRights, self.enpassantPossible, self.zobristKey, self.halfmoveClock))
+            if move.pieceMoved[1] == "P" or move.pieceCaptured != "--":
+                self.halfmoveClock = 0
+            else:
+                self.halfmoveClock += 1
+            if not self.whiteToMove:
+                self.fullmoveNumber += 1
+            self.zobristKey ^= ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_CASTLING[self.currentCastlingRights]
+            if self.enpassantPossible != ():
+                self.zobristKey ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+            self._setPiece(move.startRow, move.startCol, "--")
+            self._setPiece(move.endRow, move.endCol, move.pieceMoved)
+            self.moveLog.append(move)
+            self.whiteToMove = not self.whiteToMove
+            if move.pieceMoved == "wK":
+                self.whiteKingLocation = (move.endRow, move.endCol)
+            elif move.pieceMoved == "bK":
+                self.blackKingLocation = (move.endRow, move.endCol)
+
+            #Pawn Promotion
+            if move.isPawnPromotion:
+                self._setPiece(move.endRow, move.endCol, move.pieceMoved[0] + move.promotionChoice)
+
+            #En Passant
+            if move.isEnpassantMove:
+                self._setPiece(move.startRow, move.endCol, "--")
+
+            if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:
+                self.enpassantPossible = enpassantSquare(self.board, (move.startRow + move.endRow) // 2, move.endRow,
+                                                         move.endCol, "w" if self.whiteToMove else "b")
+                if self.enpassantPossible != ():
+                    self.zobristKey ^= ZOBRIST_ENPASSANT[move.startCol]
+            else:
+                self.enpassantPossible = ()
+
+            # Castle Move
+            if move.isCastleMove:
+                if move.endCol - move.startCol == 2:
+                    self._setPiece(move.endRow, move.endCol - 1, self.board[move.endRow][move.endCol + 1])
+                    self._setPiece(move.endRow, move.endCol + 1, "--")
+                else:
+                    self._setPiece(move.endRow, move.endCol + 1, self.board[move.endRow][move.endCol - 2])
+                    self._setPiece(move.endRow, move.endCol - 2, "--")
+
+            #Castle Rights Updates
+            self.currentCastlingRights &= CASTLE_RIGHTS_MASK[move.startRow * 8 + move.startCol] \
+                & CASTLE_RIGHTS_MASK[move.endRow * 8 + move.endCol]
+            self.zobristKey ^= ZOBRIST_CASTLING[self.currentCastlingRights]
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog.pop()
+            self._setPiece(move.startRow, move.startCol, move.pieceMoved)
+            self._setPiece(move.endRow, move.endCol, move.pieceCaptured)
+            self.whiteToMove = not self.whiteToMove
+            if move.pieceMoved == "wK":
+                self.whiteKingLocation = (move.startRow, move.startCol)
+            if move.pieceMoved == "bK":
+                self.blackKingLocation = (move.startRow, move.startCol)
+
+            #Undo en Passant
+            if move.isEnpassantMove:
+                self._setPiece(move.endRow, move.endCol, "--")
+                self._setPiece(move.startRow, move.endCol, move.pieceCaptured)
+            #Undo Castle Move
+            if move.isCastleMove:
+                if move.endCol - move.startCol == 2:
+                    self._setPiece(move.endRow, move.endCol + 1, self.board[move.endRow][move.endCol - 1])
+                    self._setPiece(move.endRow, move.endCol - 1, "--")
+                else:
+                    self._setPiece(move.endRow, move.endCol - 2, self.board[move.endRow][move.endCol + 1])
+                    self._setPiece(move.endRow, move.endCol + 1, "--")
+            #Undo Castling Rights, en passant square, hash and move counters
+            self.currentCastlingRights, self.enpassantPossible, self.zobristKey, self.halfmoveClock = self.undoLog.pop()
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
+
+    '''
+    How many times the current position has occurred in this game, including now
+    '''
+    def repetitionCount(self):
+        count = 1
+        for entry in self.undoLog:
+            if entry[2] == self.zobristKey:
+                count += 1
+        return count
+
+    '''
+    True if any piece of colour byColour attacks sq given the occupancy occupied
+    '''
+    def sqAttackedBy(self, sq, byColour, occupied=None):
+        if occupied is None:
+            occupied = self.occupancy["w"] | self.occupancy["b"]
+        pieces = self.pieces
+        defender = "b" if byColour == "w" else "w"
+        if PAWN_ATTACKS[defender][sq] & pieces[byColour + "P"]:
+            return True
+        if KNIGHT_ATTACKS[sq] & pieces[byColour + "N"]:
+            return True
+        if KING_ATTACKS[sq] & pieces[byColour + "K"]:
+            return True
+        queens = pieces[byColour + "Q"]
+        if rookAttacks(sq, occupied) & (pieces[byColour + "R"] | queens):
+            return True
+        if bishopAttacks(sq, occupied) & (pieces[byColour + "B"] | queens):
+            return True
+        return False
+
+    def sqUnderAttack(self, row, col):
+        enemyColour = "b" if self.whiteToMove else "w"
+        return self.sqAttackedBy(row * 8 + col, enemyColour)
+
+    def kingInCheck(self, colour):
+        king = self.pieces[colour + "K"]
+        if not king:
+            return False
+        enemyColour = "b" if colour == "w" else "w"
+        return self.sqAttackedBy(king.bit_length() - 1, enemyColour)
+
+    '''
+    Squares attacked by colour with the other side's king taken off the board, so that king cannot
+    step back along the ray of a slider checking it
+    '''
+    def attackedBy(self, colour):
+        pieces = self.pieces
+        occupied = (self.occupancy["w"] | self.occupancy["b"]) ^ pieces[("b" if colour == "w" else "w") + "K"]
+        attacked = 0
+        for sq in iterBits(pieces[colour + "P"]):
+            attacked |= PAWN_ATTACKS[colour][sq]
+        for sq in iterBits(pieces[colour + "N"]):
+            attacked |= KNIGHT_ATTACKS[sq]
+        for sq in iterBits(pieces[colour + "K"]):
+            attacked |= KING_ATTACKS[sq]
+        queens = pieces[colour + "Q"]
+        for sq in iterBits(pieces[colour + "R"] | queens):
+            attacked |= rookAttacks(sq, occupied)
+        for sq in iterBits(pieces[colour + "B"] | queens):
+            attacked |= bishopAttacks(sq, occupied)
+        return attacked
+
+    '''
+    (check mask, {pinned square: pin mask}) for the side to move, and sets inCheck. A non-king move must
+    land in the check mask: every square out of check, the checker or a square between it and the king
+    in single check, nowhere in double check. A pinned piece must also stay on its pin mask, the ray from
+    the king up to and including the pinner.
+    '''
+    def checksAndPins(self, allyColour, enemyColour, kingSq):
+        pieces = self.pieces
+        own = self.occupancy[allyColour]
+        occupied = own | self.occupancy[enemyColour]
+        queens = pieces[enemyColour + "Q"]
+        checkers = (KNIGHT_ATTACKS[kingSq] & pieces[enemyColour + "N"]) | \
+            (PAWN_ATTACKS[allyColour][kingSq] & pieces[enemyColour + "P"])
+        checkMask = checkers
+        pins = {}
+        for rays, sliders in ((ROOK_RAYS, pieces[enemyColour + "R"] | queens),
+                              (BISHOP_RAYS, pieces[enemyColour + "B"] | queens)):
+            for table, positive in rays:
+                ray = table[kingSq]
+                if not ray & sliders:
+                    continue
+                blockers = ray & occupied
+                first = _nearest(blockers, positive)
+                if sliders >> first & 1:
+                    checkers |= 1 << first
+                    checkMask |= ray ^ table[first]
+                elif own >> first & 1:
+                    second = _nearest(blockers ^ (1 << first), positive)
+                    if second >= 0 and sliders >> second & 1:
+                        pins[first] = ray ^ table[second]
+        self.inCheck = checkers != 0
+        if not checkers:
+            return FULL, pins
+        if checkers & (checkers - 1):
+            return 0, pins
+        return checkMask, pins
+
+    '''
+    (inCheck, pins, checkMask) for the side to move, from checksAndPins; the counterpart of
+    GameState.checkForPinsAndChecks that getValidMoves and the staged generator start from
+    '''
+    def checkForPinsAndChecks(self):
+        allyColour = "w" if self.whiteToMove else "b"
+        enemyColour = "b" if self.whiteToMove else "w"
+        kingSq = self.pieces[allyColour + "K"].bit_length() - 1
+        checkMask, pins = self.checksAndPins(allyColour, enemyColour, kingSq)
+        return self.inCheck, pins, checkMask
+
+    def getValidMoves(self):
+        inCheck, pins, checkMask = self.checkForPinsAndChecks()
+        moves = self._legalMoves(checkMask, pins, attacked=self.attackedBy("b" if self.whiteToMove else "w"))
+        if len(moves) == 0:
+            if inCheck:
+                self.checkMate = True
+            else:
+                self.staleMate = True
+        else:
+            self.checkMate = False
+            self.staleMate = False
+        return moves
+
+    '''
+    Legal captures and promotions (en passant included) of the side to move
+    '''
+    def getCaptureMoves(self):
+        inCheck, pins, checkMask = self.checkForPinsAndChecks()
+        return self._legalMoves(checkMask, pins, quiets=False)
+
+    '''
+    Legal moves that neither capture nor promote, castling included. Unlike GameState's these need no
+    further legality test.
+    '''
+    def getQuietMoves(self):
+        inCheck, pins, checkMask = self.checkForPinsAndChecks()
+        return self._legalMoves(checkMask, pins, captures=False)
+
+    '''
+    Same stages as GameState.generateMovesStaged: hash move, captures and promotions, killers, quiet moves.
+    Every stage is generated legal from the check and pin masks, so nothing is tested after generation.
+    '''
+    def generateMovesStaged(self, hashMove=None, capturesOnly=False, orderKey=None, killers=()):
+        inCheck, pins, checkMask = self.checkForPinsAndChecks()
+
+        #the legal move of this position equal to target, or None
+        def findMove(target):
+            startSq = target.startRow * 8 + target.startCol
+            if not self.occupancy["w" if self.whiteToMove else "b"] >> startSq & 1:
+                return None
+            for move in self._legalMoves(checkMask, pins, fromMask=1 << startSq):
+                if move == target:
+                    return move
+            return None
+
+        tried = set()
+        if hashMove is not None:
+            move = findMove(hashMove)
+            if move is not None and (not capturesOnly or move.pieceCaptured != "--" or move.isPawnPromotion):
+                tried.add(move.moveID)
+                yield move
+
+        captures = self._legalMoves(checkMask, pins, quiets=False)
+        if orderKey is not None:
+            captures.sort(key=orderKey, reverse=True)
+        for move in captures:
+            if move.moveID not in tried:
+                yield move
+        if capturesOnly:
+            return
+
+        for killer in killers:
+            if killer is not None and killer.moveID not in tried:
+                move = findMove(killer)
+                if move is not None and move.pieceCaptured == "--" and not move.isPawnPromotion:
+                    tried.add(move.moveID)
+                    yield move
+
+        quiets = self._legalMoves(checkMask, pins, captures=False)
+        if orderKey is not None:
+            quiets.sort(key=orderKey, reverse=True)
+        for move in quiets:
+            if move.moveID not in tried:
+                yield move
+
+    '''
+    Legal moves straight from the attack sets, cut down by the check and pin masks of
+    checkForPinsAndChecks: captures and promotions when captures is set, the rest when quiets is set,
+    of the pieces on fromMask only. Only en passant, which takes two pawns off a rank at once, is tried
+    on the bitboards before it is accepted. attacked, the enemy's attack set, saves a query per king
+    move when the caller already has it.
+    '''
+    def _legalMoves(self, checkMask, pins, captures=True, quiets=True, fromMask=FULL, attacked=None):
+        moves = []
+        board = self.board
+        pieces = self.pieces
+        allyColour = "w" if self.whiteToMove else "b"
+        enemyColour = "b" if self.whiteToMove else "w"
+        own = self.occupancy[allyColour]
+        enemy = self.occupancy[enemyColour]
+        occupied = own | enemy
+        empty = ~occupied & FULL
+        targets = (enemy if captures else 0) | (empty if quiets else 0)
+
+        if checkMask:
+            #Pawns
+            pawns = pieces[allyColour + "P"] & fromMask
+            if allyColour == "w":
+                single = (pawns >> 8) & empty
+                double = ((single & (0xFF << 40)) >> 8) & empty
+                step, backRow = -8, 0
+            else:
+                single = (pawns << 8) & FULL & empty
+                double = ((single & (0xFF << 16)) << 8) & empty
+                step, backRow = 8, 7
+            promotions = single & (0xFF << backRow * 8)
+            pushes = (promotions if captures else 0) | (single ^ promotions if quiets else 0)
+            for sq in iterBits(pushes & checkMask):
+                if sq - step not in pins or pins[sq - step] >> sq & 1:
+                    self._addPawnMove(divmod(sq - step, 8), divmod(sq, 8), backRow, moves)
+            if quiets:
+                for sq in iterBits(double & checkMask):
+                    if sq - 2 * step not in pins or pins[sq - 2 * step] >> sq & 1:
+                        moves.append(Move(divmod(sq - 2 * step, 8), divmod(sq, 8), board))
+            if captures:
+                epSq = -1
+                if self.enpassantPossible != ():
+                    epSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+                for sq in iterBits(pawns):
+                    startSq = divmod(sq, 8)
+                    for target in iterBits(PAWN_ATTACKS[allyColour][sq] & enemy & checkMask & pins.get(sq, FULL)):
+                        self._addPawnMove(startSq, divmod(target, 8), backRow, moves)
+                    if epSq >= 0 and PAWN_ATTACKS[allyColour][sq] >> epSq & 1:
+                        move = Move(startSq, divmod(epSq, 8), board, enPassant=True)
+                        self._makePseudo(move)
+                        if not self.kingInCheck(allyColour):
+                            moves.append(move)
+                        self._undoPseudo(move)
+
+            #Pieces
+            pieceTargets = targets & checkMask
+            queens = pieces[allyColour + "Q"]
+            for sq in iterBits(pieces[allyColour + "N"] & fromMask):
+                if sq not in pins:
+                    self._addMoves(sq, KNIGHT_ATTACKS[sq] & pieceTargets, moves)
+            for sq in iterBits((pieces[allyColour + "B"] | queens) & fromMask):
+                self._addMoves(sq, bishopAttacks(sq, occupied) & pieceTargets & pins.get(sq, FULL), moves)
+            for sq in iterBits((pieces[allyColour + "R"] | queens) & fromMask):
+                self._addMoves(sq, rookAttacks(sq, occupied) & pieceTargets & pins.get(sq, FULL), moves)
+
+        #King
+        king = pieces[allyColour + "K"] & fromMask
+        if king:
+            kingSq = king.bit_length() - 1
+            kingTargets = KING_ATTACKS[kingSq] & targets
+            if attacked is not None:
+                self._addMoves(kingSq, kingTargets & ~attacked, moves)
+            else:
+                for target in iterBits(kingTargets):
+                    if not self.sqAttackedBy(target, enemyColour, occupied ^ king):
+                        moves.append(Move(divmod(kingSq, 8), divmod(target, 8), board))
+            if quiets and not self.inCheck:
+                kingRow, kingCol = divmod(kingSq, 8)
+                self.getCastleMoves(kingRow, kingCol, moves, allyColour, attacked)
+        return moves
+
+    '''
+    Bitboard-only make/unmake used for en passant legality tests; board, logs and rights are left untouched
+    '''
+    def _makePseudo(self, move):
+        pieces = self.pieces
+        occupancy = self.occupancy
+        start = 1 << (move.startRow * 8 + move.startCol)
+        end = 1 << (move.endRow * 8 + move.endCol)
+        pieces[move.pieceMoved] ^= start | end
+        occupancy[move.pieceMoved[0]] ^= start | end
+        if move.pieceCaptured != "--":
+            captured = 1 << (move.startRow * 8 + move.endCol) if move.isEnpassantMove else end
+            pieces[move.pieceCaptured] ^= captured
+            occupancy[move.pieceCaptured[0]] ^= captured
+
+    def _undoPseudo(self, move):
+        self._makePseudo(move)
+
+    def getAllPossibleMoves(self):
+        moves = []
+        board = self.board
+        allyColour = "w" if self.whiteToMove else "b"
+        enemyColour = "b" if self.whiteToMove else "w"
+        own = self.occupancy[allyColour]
+        enemy = self.occupancy[enemyColour]
+        occupied = own | enemy
+        empty = ~occupied & FULL
+        pieces = self.pieces
+
+        #Pawns
+        pawns = pieces[allyColour + "P"]
+        if allyColour == "w":
+            single = (pawns >> 8) & empty
+            double = ((single & (0xFF << 40)) >> 8) & empty
+            step, backRow = -8, 0
+        else:
+            single = (pawns << 8) & FULL & empty
+            double = ((single & (0xFF << 16)) << 8) & empty
+            step, backRow = 8, 7
+        for sq in iterBits(single):
+            startSq = divmod(sq - step, 8)
+            endSq = divmod(sq, 8)
+            self._addPawnMove(startSq, endSq, backRow, moves)
+        for sq in iterBits(double):
+            moves.append(Move(divmod(sq - 2 * step, 8), divmod(sq, 8), board))
+        epBit = 0
+        if self.enpassantPossible != ():
+            epBit = 1 << (self.enpassantPossible[0] * 8 + self.enpassantPossible[1])
+        for sq in iterBits(pawns):
+            startSq = divmod(sq, 8)
+            targets = PAWN_ATTACKS[allyColour][sq] & (enemy | epBit)
+            for target in iterBits(targets):
+                endSq = divmod(target, 8)
+                if 1 << target == epBit:
+                    moves.append(Move(startSq, endSq, board, enPassant=True))
+                else:
+                    self._addPawnMove(startSq, endSq, backRow, moves)
+
+        #Pieces
+        notOwn = ~own & FULL
+        for sq in iterBits(pieces[allyColour + "N"]):
+            self._addMoves(sq, KNIGHT_ATTACKS[sq] & notOwn, moves)
+        for sq in iterBits(pieces[allyColour + "B"]):
+            self._addMoves(sq, bishopAttacks(sq, occupied) & notOwn, moves)
+        for sq in iterBits(pieces[allyColour + "R"]):
+            self._addMoves(sq, rookAttacks(sq, occupied) & notOwn, moves)
+        for sq in iterBits(pieces[allyColour + "Q"]):
+            self._addMoves(sq, (rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)) & notOwn, moves)
+        for sq in iterBits(pieces[allyColour + "K"]):
+            self._addMoves(sq, KING_ATTACKS[sq] & notOwn, moves)
+        return moves
+
+    def _addMoves(self, sq, targets, moves):
+        startSq = divmod(sq, 8)
+        for target in iterBits(targets):
+            moves.append(Move(startSq, divmod(target, 8), self.board))
+
+    def _addPawnMove(self, startSq, endSq, backRow, moves):
+        if endSq[0] == backRow:
+            for piece in PROMOTION_PIECES:
+                moves.append(Move(startSq, endSq, self.board, promotionChoice=piece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
+    '''
+    Castling moves for the king on row, col. attacked is the enemy's attack set; without it only the
+    two squares the king crosses are asked about.
+    '''
+    def getCastleMoves(self, row, col, moves, allyColour, attacked=None):
+        if allyColour == "w":
+            kingSide, queenSide = self.currentCastlingRights & WKS, self.currentCastlingRights & WQS
+        else:
+            kingSide, queenSide = self.currentCastlingRights & BKS, self.currentCastlingRights & BQS
+        if not (kingSide or queenSide):
+            return
+        sq = row * 8 + col
+        enemyColour = "b" if allyColour == "w" else "w"
+
+        def crossesAttack(first):
+            if attacked is not None:
+                return attacked >> first & 3
+            return self.sqAttackedBy(first, enemyColour) or self.sqAttackedBy(first + 1, enemyColour)
+
+        if kingSide and self.board[row][col + 1] == "--" and self.board[row][col + 2] == "--":
+            if not crossesAttack(sq + 1):
+                moves.append(Move((row, col), (row, col + 2), self.board, isCastleMove=True))
+        if queenSide and self.board[row][col - 1] == "--" and self.board[row][col - 2] == "--" \
+                and self.board[row][col - 3] == "--":
+            if not crossesAttack(sq - 2):
+                moves.append(Move((row, col), (row, col - 2), self.board, isCastleMove=True))
@@ -1,37 +1,254 @@
 """Stores information of current game state; determining validity of moves at cur state"""
-import copy
+import random
+from Chess.Evaluation import MG_SCORES, EG_SCORES, PHASE, computePieceSquare
+
+'''
+Castling rights are a 4-bit int; CASTLE_RIGHTS_MASK[sq] clears the rights lost when a move starts
+or ends on sq (a king or rook leaving home, or a rook being captured there)
+'''
+WKS = 1
+WQS = 2
+BKS = 4
+BQS = 8
+ALL_CASTLING = WKS | WQS | BKS | BQS
+CASTLE_RIGHTS_MASK = [ALL_CASTLING] * 64
+CASTLE_RIGHTS_MASK[0] = ALL_CASTLING & ~BQS
+CASTLE_RIGHTS_MASK[4] = ALL_CASTLING & ~(BKS | BQS)
+CASTLE_RIGHTS_MASK[7] = ALL_CASTLING & ~BKS
+CASTLE_RIGHTS_MASK[56] = ALL_CASTLING & ~WQS
+CASTLE_RIGHTS_MASK[60] = ALL_CASTLING & ~(WKS | WQS)
+CASTLE_RIGHTS_MASK[63] = ALL_CASTLING & ~WKS
+PROMOTION_PIECES = ("Q", "R", "B", "N")
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+'''
+Zobrist keys: one per piece per square (square = row * 8 + col), side to move, the 16 castling
+right combinations and the en passant file. Seeded so keys are identical across runs and processes.
+'''
+_zobristRandom = random.Random(0x5EED)
+ZOBRIST_PIECES = {colour + piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                  for colour in "wb" for piece in "PNBRQK"}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [_zobristRandom.getrandbits(64) for _ in range(16)]
+ZOBRIST_ENPASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)]
+
+def _targetTable(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        table.append(tuple((row + dRow, col + dCol) for dRow, dCol in offsets
+                           if 0 <= row + dRow < 8 and 0 <= col + dCol < 8))
+    return table
+
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+#Squares a knight/king on sq reaches, which are also the squares it can be attacked from
+KNIGHT_TARGETS = _targetTable(((-2, -1), (-2, 1), (2, -1), (2, 1), (1, -2), (1, 2), (-1, -2), (-1, 2)))
+KING_TARGETS = _targetTable(ROOK_DIRECTIONS + BISHOP_DIRECTIONS)
+#PAWN_TARGETS["w"][sq] are the squares a white pawn on sq attacks
+PAWN_TARGETS = {"w": _targetTable(((-1, -1), (-1, 1))), "b": _targetTable(((1, -1), (1, 1)))}
+SLIDER_DIRECTIONS = {"R": ROOK_DIRECTIONS, "B": BISHOP_DIRECTIONS, "Q": ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+
+'''
+Full Zobrist key of a position; makeMove/undoMove keep gs.zobristKey up to date incrementally instead
+'''
+def computeZobristKey(gs):
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece != "--":
+                key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+    if not gs.whiteToMove:
+        key ^= ZOBRIST_BLACK_TO_MOVE
+    key ^= ZOBRIST_CASTLING[gs.currentCastlingRights]
+    if gs.enpassantPossible != ():
+        key ^= ZOBRIST_ENPASSANT[gs.enpassantPossible[1]]
+    return key
+
+'''
+Zobrist key of the pawns alone, which keys Evaluation's pawn structure cache
+'''
+def computePawnKey(gs):
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = gs.board[row][col]
+            if piece[1] == "P":
+                key ^= ZOBRIST_PIECES[piece][row * 8 + col]
+    return key
+
+
+'''
+En passant square (skippedRow, col) left by a double pawn push that ended on (endRow, col), or () when no
+pawn of capturer stands beside it to take. An en passant square nobody can use is left out everywhere, so
+the same position always has the same Zobrist key and FEN whichever move order reached it.
+'''
+def enpassantSquare(board, skippedRow, endRow, col, capturer):
+    pawn = capturer + "P"
+    if (col > 0 and board[endRow][col - 1] == pawn) or (col < 7 and board[endRow][col + 1] == pawn):
+        return (skippedRow, col)
+    return ()
+
+
+'''
+Looks outwards from the target square for attackers of colour on board: sliding pieces along the eight
+rays, then knights, pawns and the king from lookup tables. ignore is a square treated as empty.
+'''
+def sqAttackedBy(board, row, col, colour, ignore=None):
+    for directions, slider in ((ROOK_DIRECTIONS, "R"), (BISHOP_DIRECTIONS, "B")):
+        for dRow, dCol in directions:
+            endRow, endCol = row + dRow, col + dCol
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                piece = board[endRow][endCol]
+                if piece != "--" and (endRow, endCol) != ignore:
+                    if piece[0] == colour and (piece[1] == slider or piece[1] == "Q"):
+                        return True
+                    break
+                endRow += dRow
+                endCol += dCol
+    sq = row * 8 + col
+    for endRow, endCol in KNIGHT_TARGETS[sq]:
+        if board[endRow][endCol] == colour + "N":
+            return True
+    for endRow, endCol in KING_TARGETS[sq]:
+        if board[endRow][endCol] == colour + "K":
+            return True
+    #a pawn of colour attacks sq from the squares a pawn of the other colour on sq would attack
+    for endRow, endCol in PAWN_TARGETS["b" if colour == "w" else "w"][sq]:
+        if board[endRow][endCol] == colour + "P":
+            return True
+    return False
+
+
+'''
+Splits a FEN string into (board, whiteToMove, castling rights, en passant square, halfmove clock, fullmove number).
+Raises ValueError if it is malformed, or if it is not a position a game can reach as far as the move
+generators rely on: each side needs exactly one king and the side not to move must not be in check.
+'''
+def parseFen(fen):
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError("FEN needs at least 4 fields: %r" % fen)
+    board = []
+    for rank in fields[0].split("/"):
+        row = []
+        for ch in rank:
+            if ch.isdigit():
+                row.extend(["--"] * int(ch))
+            elif ch.upper() in "PNBRQK":
+                row.append(("w" if ch.isupper() else "b") + ch.upper())
+            else:
+                raise ValueError("bad piece %r in FEN %r" % (ch, fen))
+        if len(row) != 8:
+            raise ValueError("rank %r of FEN %r is not 8 squares" % (rank, fen))
+        board.append(row)
+    if len(board) != 8 or fields[1] not in ("w", "b"):
+        raise ValueError("bad FEN %r" % fen)
+    kings = [(row, col, board[row][col][0]) for row in range(8) for col in range(8) if board[row][col][1] == "K"]
+    if sorted(colour for _, _, colour in kings) != ["b", "w"]:
+        raise ValueError("FEN %r needs exactly one king of each colour" % fen)
+    for row, col, colour in kings:
+        if colour != fields[1] and sqAttackedBy(board, row, col, fields[1]):
+            raise ValueError("side not to move is in check in FEN %r" % fen)
+    castling = 0
+    for ch, right in (("K", WKS), ("Q", WQS), ("k", BKS), ("q", BQS)):
+        if ch in fields[2]:
+            castling |= right
+    enpassant = ()
+    if fields[3] != "-":
+        if len(fields[3]) != 2 or fields[3][0] not in Move.filesToCols or fields[3][1] not in Move.ranksToRows:
+            raise ValueError("bad en passant square %r in FEN %r" % (fields[3], fen))
+        row, col = Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]]
+        if row in (2, 5):
+            enpassant = enpassantSquare(board, row, row + 1 if fields[1] == "w" else row - 1, col, fields[1])
+    halfmove = int(fields[4]) if len(fields) > 4 else 0
+    fullmove = int(fields[5]) if len(fields) > 5 else 1
+    return board, fields[1] == "w", castling, enpassant, halfmove, fullmove
+
+
+def makeFen(board, whiteToMove, castling, enpassant, halfmove, fullmove):
+    ranks = []
+    for row in board:
+        rank = ""
+        empty = 0
+        for square in row:
+            if square == "--":
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            rank += square[1] if square[0] == "w" else square[1].lower()
+        ranks.append(rank + (str(empty) if empty else ""))
+    rights = "".join(ch for ch, right in (("K", WKS), ("Q", WQS), ("k", BKS), ("q", BQS)) if castling & right)
+    square = Move.colsToFiles[enpassant[1]] + Move.rowsToRanks[enpassant[0]] if enpassant != () else "-"
+    return "%s %s %s %s %d %d" % ("/".join(ranks), "w" if whiteToMove else "b", rights or "-", square, halfmove, fullmove)
+
 
 class GameState():
-    def __init__(self):
-        self.board = [
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
+    def __init__(self, fen=START_FEN):
 
         self.moveFunction = {"P": self.getPawnMoves, "R": self.getRookMoves,
                              "N": self.getKnightMoves, "B": self.getBishopMoves,
                              "Q": self.getQueenMoves, "K": self.getKingMoves}
-        self.whiteToMove = True
+        self.loadFen(fen)
+
+    '''
+    Replaces the position with the one described by fen and clears the move history
+    '''
+    def loadFen(self, fen):
+        board, self.whiteToMove, self.currentCastlingRights, self.enpassantPossible, \
+            self.halfmoveClock, self.fullmoveNumber = parseFen(fen)
+        self.board = board
         self.moveLog =[]
-        self.whiteKingLocation = (7, 4)
-        self.blackKingLocation = (0, 4)
+        self.whiteKingLocation = ()
+        self.blackKingLocation = ()
+        for row in range(8):
+            for col in range(8):
+                if board[row][col] == "wK":
+                    self.whiteKingLocation = (row, col)
+                elif board[row][col] == "bK":
+                    self.blackKingLocation = (row, col)
         self.checkMate = False
         self.staleMate = False
         self.inCheck = False
         self.pins = []
         self.checks = []
-        self.enpassantPossible = () #coordinates for square where enpassant possible
-        self.currentCastlingRights = CastleRights(True, True, True, True)
-        self.castleRightLog = [CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
-                                            self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)]
+        self.zobristKey = computeZobristKey(self)
+        self.pawnKey = computePawnKey(self)
+        self.mgScore, self.egScore, self.phase = computePieceSquare(board) #see Evaluation.evaluate
+        self.pieceCount = sum(piece != "--" for boardRow in board for piece in boardRow) #kings included
+        #(castling rights, en passant square, zobrist key, halfmove clock, mgScore, egScore, phase, pawn key,
+        #piece count) before each move in moveLog
+        self.undoLog = []
+        self.attackMapCache = (None, 0)
+
+    def getFen(self):
+        return makeFen(self.board, self.whiteToMove, self.currentCastlingRights, self.enpassantPossible,
+                       self.halfmoveClock, self.fullmoveNumber)
 
     def makeMove(self, move):
         if self.board[move.startRow][move.startCol] != '--':
+            self.undoLog.append((self.currentCastlingRights, self.enpassantPossible, self.zobristKey, self.halfmoveClock,
+                                 self.mgScore, self.egScore, self.phase, self.pawnKey, self.pieceCount))
+            if move.pieceMoved[1] == "P" or move.pieceCaptured != "--":
+                self.halfmoveClock = 0
+            else:
+                self.halfmoveClock += 1
+            if not self.whiteToMove:
+                self.fullmoveNumber += 1
+            startSq = move.startRow * 8 + move.startCol
+            endSq = move.endRow * 8 + move.endCol
+            key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PIECES[move.pieceMoved][startSq]
+            key ^= ZOBRIST_CASTLING[self.currentCastlingRights]
+            if self.enpassantPossible != ():
+                key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+            mg = self.mgScore - MG_SCORES[move.pieceMoved][startSq]
+            eg = self.egScore - EG_SCORES[move.pieceMoved][startSq]
+            if move.pieceMoved[1] == "P":
+                self.pawnKey ^= ZOBRIST_PIECES[move.pieceMoved][startSq]
             self.board[move.startRow][move.startCol] = "--"
             self.board[move.endRow][move.endCol] = move.pieceMoved
             self.moveLog.append(move)
@@ -43,31 +260,54 @@ class GameState():
 
             #Pawn Promotion
             if move.isPawnPromotion:
-                promotedPiece = input("Promoto to Q, R, B or N")
-                self.board[move.endRow][move.endCol] = move.pieceMoved[0] + promotedPiece
+                self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
+                self.phase += PHASE[self.board[move.endRow][move.endCol]]
+            placed = self.board[move.endRow][move.endCol]
+            key ^= ZOBRIST_PIECES[placed][endSq]
+            if placed[1] == "P":
+                self.pawnKey ^= ZOBRIST_PIECES[placed][endSq]
+            mg += MG_SCORES[placed][endSq]
+            eg += EG_SCORES[placed][endSq]
 
             #En Passant
-            if move.isEnpassantMove:
-                self.board[move.startRow][move.endCol] = "--"
+            if move.pieceCaptured != "--":
+                capturedSq = move.startRow * 8 + move.endCol if move.isEnpassantMove else endSq
+                if move.isEnpassantMove:
+                    self.board[move.startRow][move.endCol] = "--"
+                key ^= ZOBRIST_PIECES[move.pieceCaptured][capturedSq]
+                mg -= MG_SCORES[move.pieceCaptured][capturedSq]
+                eg -= EG_SCORES[move.pieceCaptured][capturedSq]
+                self.phase -= PHASE[move.pieceCaptured]
+                self.pieceCount -= 1
+                if move.pieceCaptured[1] == "P":
+                    self.pawnKey ^= ZOBRIST_PIECES[move.pieceCaptured][capturedSq]
 
             if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol)
+                self.enpassantPossible = enpassantSquare(self.board, (move.startRow + move.endRow) // 2, move.endRow,
+                                                         move.endCol, "w" if self.whiteToMove else "b")
+                if self.enpassantPossible != ():
+                    key ^= ZOBRIST_ENPASSANT[move.startCol]
             else:
                 self.enpassantPossible = ()
 
             # Castle Move
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2:
-                    self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]
-                    self.board[move.endRow][move.endCol + 1] = "--"
+                    rookFrom, rookTo = move.endCol + 1, move.endCol - 1
                 else:
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]
-                    self.board[move.endRow][move.endCol - 2] = "--"
+                    rookFrom, rookTo = move.endCol - 2, move.endCol + 1
+                rook = self.board[move.endRow][rookFrom]
+                self.board[move.endRow][rookTo] = rook
+                self.board[move.endRow][rookFrom] = "--"
+                key ^= ZOBRIST_PIECES[rook][move.endRow * 8 + rookFrom] ^ ZOBRIST_PIECES[rook][move.endRow * 8 + rookTo]
+                mg += MG_SCORES[rook][move.endRow * 8 + rookTo] - MG_SCORES[rook][move.endRow * 8 + rookFrom]
+                eg += EG_SCORES[rook][move.endRow * 8 + rookTo] - EG_SCORES[rook][move.endRow * 8 + rookFrom]
 
             #Castle Rights Updates
-            self.updateCastleRights(move)
-            self.castleRightLog.append(CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
-                                            self.currentCastlingRights.wqs, self.currentCastlingRights.bqs))
+            self.currentCastlingRights &= CASTLE_RIGHTS_MASK[startSq] & CASTLE_RIGHTS_MASK[endSq]
+            self.zobristKey = key ^ ZOBRIST_CASTLING[self.currentCastlingRights]
+            self.mgScore = mg
+            self.egScore = eg
 
     def undoMove(self):
         if len(self.moveLog) != 0:
@@ -84,15 +324,12 @@ class GameState():
             if move.isEnpassantMove:
                 self.board[move.endRow][move.endCol] = "--"
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            #Undo 2 square pawn advance
-            if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
 
-            #Undo Castling Rights
-            self.castleRightLog.pop()
-            castle_rights = copy.deepcopy(self.castleRightLog[-1])
-            self.currentCastlingRights = castle_rights
+            #Undo Castling Rights, en passant square, hashes, move counters and evaluation
+            self.currentCastlingRights, self.enpassantPossible, self.zobristKey, self.halfmoveClock, \
+                self.mgScore, self.egScore, self.phase, self.pawnKey, self.pieceCount = self.undoLog.pop()
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
             #Undo Castle Move
             if move.isCastleMove:
                 if move.endCol - move.startCol == 2:
@@ -102,29 +339,17 @@ class GameState():
                     self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol + 1]
                     self.board[move.endRow][move.endCol+1] = "--"
 
-    def updateCastleRights(self, move):
-        if move.pieceMoved == "wK":
-            self.currentCastlingRights.wks = False
-            self.currentCastlingRights.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRights.bks = False
-            self.currentCastlingRights.bqs = False
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0:
-                    self.currentCastlingRights.wqs = False
-                elif move.startCol == 7:
-                    self.currentCastlingRights.wks = False
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0:
-                    self.currentCastlingRights.bqs = False
-                elif move.startCol == 7:
-                    self.currentCastlingRights.bks = False
+    '''
+    How many times the current position has occurred in this game, including now
+    '''
+    def repetitionCount(self):
+        count = 1
+        for entry in self.undoLog:
+            if entry[2] == self.zobristKey:
+                count += 1
+        return count
 
     def getValidMoves(self):
-        for log in self.castleRightLog:
-            print(log.wks, log.wqs, log.bks, log.bqs)
         moves = []
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
         if self.whiteToMove:
@@ -139,18 +364,11 @@ class GameState():
                 check = self.checks[0]
                 checkRow = check[0]
                 checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]
-                validSquares = []
-                if pieceChecking[1] == "N":
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1,8):
-                        validSquare = (kingRow * check[2] * i, kingCol * check[3] * i)
-                        validSquares.append(validSquare)
-                        if validSquares[0] == checkRow and validSquare[1] == checkCol:
-                            break
+                validSquares = self.getCheckBlockSquares(kingRow, kingCol, check)
                 for i in range(len(moves) -1, -1, -1):
                     if moves[i].pieceMoved[1] != "K":
+                        if moves[i].isEnpassantMove and (moves[i].startRow, moves[i].endCol) == (checkRow, checkCol):
+                            continue #en passant removes the checking pawn
                         if not (moves[i].endRow, moves[i].endCol) in validSquares:
                             moves.remove(moves[i])
             else:
@@ -170,6 +388,188 @@ class GameState():
 
         return moves
 
+    '''
+    Squares a non-king move must land on to answer a single check: the checker itself and,
+    for sliding checkers, every square between it and the king
+    '''
+    def getCheckBlockSquares(self, kingRow, kingCol, check):
+        checkRow, checkCol = check[0], check[1]
+        if self.board[checkRow][checkCol][1] == "N":
+            return [(checkRow, checkCol)]
+        validSquares = []
+        for i in range(1, 8):
+            validSquare = (kingRow + check[2] * i, kingCol + check[3] * i)
+            validSquares.append(validSquare)
+            if validSquare[0] == checkRow and validSquare[1] == checkCol:
+                break
+        return validSquares
+
+    '''
+    Staged move generator for the search. Yields hashMove first (if it is legal here), then captures
+    and promotions, then the killers that are quiet moves here, then the remaining quiet moves, each
+    generated stage sorted by orderKey (highest first) when given.
+    Each stage is generated only when the one before it runs out, so a cutoff in the caller skips the
+    rest of the work, and capturesOnly never generates a quiet move. Moves are pseudo-legal until
+    checked against the pins and checks of the position as they are about to be yielded.
+    hashMove and each killer only cost generating the moves of the piece on their start square.
+    Sets inCheck for the position before the first move is yielded.
+    '''
+    def generateMovesStaged(self, hashMove=None, capturesOnly=False, orderKey=None, killers=()):
+        inCheck, pins, checks = self.checkForPinsAndChecks()
+        self.inCheck = inCheck
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        pinned = {(pin[0], pin[1]): (pin[2], pin[3]) for pin in pins}
+        validSquares = None
+        checker = None
+        if len(checks) == 1:
+            validSquares = self.getCheckBlockSquares(kingRow, kingCol, checks[0])
+            checker = (checks[0][0], checks[0][1])
+        doubleCheck = len(checks) > 1
+
+        def isLegal(move):
+            if move.pieceMoved[1] == "K":
+                return True #king destinations are already tested against the attackers
+            if doubleCheck:
+                return False
+            pin = pinned.get((move.startRow, move.startCol))
+            if pin is not None and pin[0] * (move.endCol - move.startCol) != pin[1] * (move.endRow - move.startRow):
+                return False
+            if validSquares is not None:
+                if move.isEnpassantMove and (move.startRow, move.endCol) == checker:
+                    return True
+                return (move.endRow, move.endCol) in validSquares
+            return True
+
+        #the pseudo-legal move of this position equal to target, or None
+        def findMove(target):
+            piece = self.board[target.startRow][target.startCol]
+            if piece[0] != ("w" if self.whiteToMove else "b"):
+                return None
+            pieceMoves = []
+            self.pins = []
+            self.moveFunction[piece[1]](target.startRow, target.startCol, pieceMoves)
+            if piece[1] == "K" and not inCheck:
+                self.getCastleMoves(kingRow, kingCol, pieceMoves, None)
+            for move in pieceMoves:
+                if move == target:
+                    return move
+            return None
+
+        tried = set()
+        if hashMove is not None:
+            move = findMove(hashMove)
+            if move is not None and (not capturesOnly or move.pieceCaptured != "--" or move.isPawnPromotion) \
+                    and isLegal(move):
+                tried.add(move.moveID)
+                yield move
+
+        captures = self.getCaptureMoves()
+        if orderKey is not None:
+            captures.sort(key=orderKey, reverse=True)
+        for move in captures:
+            if move.moveID not in tried and isLegal(move):
+                yield move
+        if capturesOnly:
+            return
+
+        for killer in killers:
+            if killer is not None and killer.moveID not in tried:
+                move = findMove(killer)
+                if move is not None and move.pieceCaptured == "--" and not move.isPawnPromotion and isLegal(move):
+                    tried.add(move.moveID)
+                    yield move
+
+        quiets = self.getQuietMoves()
+        if not inCheck:
+            self.getCastleMoves(kingRow, kingCol, quiets, None)
+        if orderKey is not None:
+            quiets.sort(key=orderKey, reverse=True)
+        for move in quiets:
+            if move.moveID not in tried and isLegal(move):
+                yield move
+
+    '''
+    Pseudo-legal captures and promotions of the side to move, without generating any quiet move.
+    King moves are already checked against the attackers of their target square.
+    '''
+    def getCaptureMoves(self):
+        moves = []
+        board = self.board
+        allyColour, enemyColour = ("w", "b") if self.whiteToMove else ("b", "w")
+        moveAmount, backRow = (-1, 0) if self.whiteToMove else (1, 7)
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece[0] != allyColour:
+                    continue
+                sq = row * 8 + col
+                if piece[1] == "P":
+                    if row + moveAmount == backRow and board[backRow][col] == "--":
+                        self.addPawnMove((row, col), (backRow, col), backRow, moves)
+                    for endRow, endCol in PAWN_TARGETS[allyColour][sq]:
+                        if board[endRow][endCol][0] == enemyColour:
+                            self.addPawnMove((row, col), (endRow, endCol), backRow, moves)
+                        elif (endRow, endCol) == self.enpassantPossible and not self.enpassantExposesKing(row, col, endCol):
+                            moves.append(Move((row, col), (endRow, endCol), board, enPassant=True))
+                elif piece[1] == "N":
+                    for endRow, endCol in KNIGHT_TARGETS[sq]:
+                        if board[endRow][endCol][0] == enemyColour:
+                            moves.append(Move((row, col), (endRow, endCol), board))
+                elif piece[1] == "K":
+                    for endRow, endCol in KING_TARGETS[sq]:
+                        if board[endRow][endCol][0] == enemyColour and \
+                                not self.sqAttackedBy(endRow, endCol, enemyColour, (row, col)):
+                            moves.append(Move((row, col), (endRow, endCol), board))
+                else:
+                    for dRow, dCol in SLIDER_DIRECTIONS[piece[1]]:
+                        endRow, endCol = row + dRow, col + dCol
+                        while 0 <= endRow < 8 and 0 <= endCol < 8:
+                            target = board[endRow][endCol]
+                            if target != "--":
+                                if target[0] == enemyColour:
+                                    moves.append(Move((row, col), (endRow, endCol), board))
+                                break
+                            endRow += dRow
+                            endCol += dCol
+        return moves
+
+    '''
+    Pseudo-legal moves of the side to move that neither capture nor promote, castling aside.
+    King moves are already checked against the attackers of their target square.
+    '''
+    def getQuietMoves(self):
+        moves = []
+        board = self.board
+        allyColour, enemyColour = ("w", "b") if self.whiteToMove else ("b", "w")
+        moveAmount, startRow, backRow = (-1, 6, 0) if self.whiteToMove else (1, 1, 7)
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece[0] != allyColour:
+                    continue
+                sq = row * 8 + col
+                if piece[1] == "P":
+                    if row + moveAmount != backRow and board[row + moveAmount][col] == "--":
+                        moves.append(Move((row, col), (row + moveAmount, col), board))
+                        if row == startRow and board[row + 2 * moveAmount][col] == "--":
+                            moves.append(Move((row, col), (row + 2 * moveAmount, col), board))
+                elif piece[1] == "N":
+                    for endRow, endCol in KNIGHT_TARGETS[sq]:
+                        if board[endRow][endCol] == "--":
+                            moves.append(Move((row, col), (endRow, endCol), board))
+                elif piece[1] == "K":
+                    for endRow, endCol in KING_TARGETS[sq]:
+                        if board[endRow][endCol] == "--" and not self.sqAttackedBy(endRow, endCol, enemyColour, (row, col)):
+                            moves.append(Move((row, col), (endRow, endCol), board))
+                else:
+                    for dRow, dCol in SLIDER_DIRECTIONS[piece[1]]:
+                        endRow, endCol = row + dRow, col + dCol
+                        while 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == "--":
+                            moves.append(Move((row, col), (endRow, endCol), board))
+                            endRow += dRow
+                            endCol += dCol
+        return moves
+
     '''
     Determines if another player is in check, a list of pins and list of checks
     '''
@@ -237,14 +637,54 @@ class GameState():
     Determines if enemy can attack square row, column
     '''
     def sqUnderAttack(self, row, col):
-        self.whiteToMove = not self.whiteToMove
-        opponentMoves = self.getAllPossibleMoves()
-        for move in opponentMoves:
-            if move.endRow == row and move.endCol == col:
-                self.whiteToMove = not self.whiteToMove
-                return True
-        self.whiteToMove = not self.whiteToMove
-        return False
+        return self.sqAttackedBy(row, col, "b" if self.whiteToMove else "w")
+
+    '''
+    Whether colour attacks square row, column; see sqAttackedBy
+    '''
+    def sqAttackedBy(self, row, col, colour, ignore=None):
+        return sqAttackedBy(self.board, row, col, colour, ignore)
+
+    '''
+    Bitmap (bit row * 8 + col) of every square the opponent attacks, computed with the side to move's
+    king taken off the board so squares behind it along a checking ray count as attacked.
+    Cached per position by zobristKey for king move and castling legality.
+    '''
+    def getAttackMap(self):
+        if self.attackMapCache[0] == self.zobristKey:
+            return self.attackMapCache[1]
+        board = self.board
+        allyColour, enemyColour = ("w", "b") if self.whiteToMove else ("b", "w")
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        attacked = 0
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece[0] != enemyColour:
+                    continue
+                sq = row * 8 + col
+                if piece[1] == "P":
+                    targets = PAWN_TARGETS[enemyColour][sq]
+                elif piece[1] == "N":
+                    targets = KNIGHT_TARGETS[sq]
+                elif piece[1] == "K":
+                    targets = KING_TARGETS[sq]
+                else:
+                    targets = []
+                    directions = ROOK_DIRECTIONS if piece[1] == "R" else BISHOP_DIRECTIONS if piece[1] == "B" \
+                        else ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+                    for dRow, dCol in directions:
+                        endRow, endCol = row + dRow, col + dCol
+                        while 0 <= endRow < 8 and 0 <= endCol < 8:
+                            targets.append((endRow, endCol))
+                            if board[endRow][endCol] != "--" and (endRow, endCol) != (kingRow, kingCol):
+                                break
+                            endRow += dRow
+                            endCol += dCol
+                for endRow, endCol in targets:
+                    attacked |= 1 << (endRow * 8 + endCol)
+        self.attackMapCache = (self.zobristKey, attacked)
+        return attacked
 
     def getAllPossibleMoves(self):
         moves = []
@@ -277,32 +717,53 @@ class GameState():
             backRow = 7
             enemyColour = "w"
 
-        pawnPromotion = False
         if self.board[row + moveAmount][col] == "--":            #1 square move
-            if not piecePinned or pinDirection == (moveAmount,0):
-                if row + moveAmount == backRow:
-                    pawnPromotion = True
-                moves.append(Move((row,col),(row+moveAmount,col), self.board,pawnPromotion = pawnPromotion))
+            if not piecePinned or pinDirection in ((moveAmount, 0), (-moveAmount, 0)):
+                self.addPawnMove((row, col), (row + moveAmount, col), backRow, moves)
                 if row == startRow and self.board[row+2*moveAmount][col] == "--":
                     moves.append(Move((row,col), (row+2*moveAmount, col), self.board))
         if col - 1 >= 0:
-            if not piecePinned or pinDirection == (moveAmount, -1):
+            if not piecePinned or pinDirection in ((moveAmount, -1), (-moveAmount, 1)):
                 if self.board[row + moveAmount][col - 1][0] == enemyColour:
-                    if row + moveAmount == backRow:
-                        pawnPromotion = True
-                    moves.append(Move((row,col), (row + moveAmount, col-1), self.board, pawnPromotion = pawnPromotion))
-                if (row + moveAmount, col  -1) == self.enpassantPossible:
+                    self.addPawnMove((row, col), (row + moveAmount, col - 1), backRow, moves)
+                if (row + moveAmount, col  -1) == self.enpassantPossible and not self.enpassantExposesKing(row, col, col - 1):
                     moves.append(Move((row,col),(row + moveAmount, col - 1), self.board, enPassant=True))
 
         if col + 1 <= 7:
-            if not piecePinned or pinDirection == (moveAmount, -1):
+            if not piecePinned or pinDirection in ((moveAmount, 1), (-moveAmount, -1)):
                 if self.board[row + moveAmount][col+1][0] == enemyColour:
-                    if row + moveAmount == backRow:
-                        pawnPromotion = True
-                    moves.append(Move((row,col), (row + moveAmount, col+1), self.board, pawnPromotion = pawnPromotion))
-                if (row + moveAmount ,col+1) == self.enpassantPossible:
+                    self.addPawnMove((row, col), (row + moveAmount, col + 1), backRow, moves)
+                if (row + moveAmount ,col+1) == self.enpassantPossible and not self.enpassantExposesKing(row, col, col + 1):
                     moves.append(Move((row, col), (row + moveAmount, col + 1), self.board, enPassant=True))
 
+    '''
+    A pawn reaching the back rank gives one move per promotion piece
+    '''
+    def addPawnMove(self, startSq, endSq, backRow, moves):
+        if endSq[0] == backRow:
+            for piece in PROMOTION_PIECES:
+                moves.append(Move(startSq, endSq, self.board, promotionChoice=piece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
+    '''
+    En passant takes two pawns off the king's rank at once, which the pin scan cannot see
+    '''
+    def enpassantExposesKing(self, row, col, capturedCol):
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if kingRow != row:
+            return False
+        enemyColour = "b" if self.whiteToMove else "w"
+        step = 1 if col > kingCol else -1
+        c = kingCol + step
+        while 0 <= c < 8:
+            if c != col and c != capturedCol:
+                piece = self.board[row][c]
+                if piece != "--":
+                    return piece[0] == enemyColour and piece[1] in ("R", "Q")
+            c += step
+        return False
+
     def getRookMoves(self, row ,col, moves):
         piecePinned = False
         pinDirection = ()
@@ -349,8 +810,8 @@ class GameState():
                 endRow = row + d[0] * i
                 endCol = col + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
-                        if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                            endPiece = self.board[endRow][endCol]
+                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                        endPiece = self.board[endRow][endCol]
                         if endPiece == "--":
                             moves.append(Move((row, col), (endRow, endCol), self.board))
                         elif endPiece[0] == enemyColour:
@@ -386,58 +847,37 @@ class GameState():
         self.getBishopMoves(r, c, moves)
 
     def getKingMoves(self, row, col, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
         allyColour = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = row + rowMoves[i]
-            endCol = col + colMoves[i]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColour:
-                    if allyColour == "w":
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                    if allyColour == "w":
-                        self.whiteKingLocation = (row, col)
-                    else:
-                        self.blackKingLocation = (row, col)
+        attacked = self.getAttackMap()
+        for endRow, endCol in KING_TARGETS[row * 8 + col]:
+            if self.board[endRow][endCol][0] != allyColour and not attacked >> (endRow * 8 + endCol) & 1:
+                moves.append(Move((row, col), (endRow, endCol), self.board))
 
     def getCastleMoves(self, row, col, moves, allyColour):
-        if self.sqUnderAttack(row, col):
+        if self.getAttackMap() >> (row * 8 + col) & 1:
             return
-        if (self.whiteToMove and self.currentCastlingRights.wks) or (not self.whiteToMove and self.currentCastlingRights.bks):
+        if self.currentCastlingRights & (WKS if self.whiteToMove else BKS):
             self.getKingSideCastleMoves(row, col, moves, allyColour)
-        if (self.whiteToMove and self.currentCastlingRights.wqs) or (not self.whiteToMove and self.currentCastlingRights.bqs):
+        if self.currentCastlingRights & (WQS if self.whiteToMove else BQS):
             self.getQueenSideCastleMoves(row, col, moves, allyColour)
 
 
     def getKingSideCastleMoves(self, row, col, moves, allyColour):
         if self.board[row][col+1] == "--"  and self.board[row][col+2] == "--":
-            if not self.sqUnderAttack(row, col + 1) and not self.sqUnderAttack(row,col+2):
+            if not self.getAttackMap() >> (row * 8 + col + 1) & 3:
                 moves.append(Move((row,col), (row, col+2), self.board, isCastleMove=True))
-                print("hello")
 
     def getQueenSideCastleMoves(self, row, col, moves, allyColour):
         if self.board[row][col-1] == "--"  and self.board[row][col-2] == "--" and self.board[row][col-3] == "--":
-            if not self.sqUnderAttack(row, col - 1) and not self.sqUnderAttack(row,col-2):
+            if not self.getAttackMap() >> (row * 8 + col - 2) & 3:
                 moves.append(Move((row,col), (row, col-2), self.board, isCastleMove=True))
 
 
 
 
-class CastleRights():
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
-
 class Move():
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "isPawnPromotion",
+                 "promotionChoice", "isEnpassantMove", "isCastleMove", "moveID")
     #dictionary to map values to ranks and files
     ranksToRows = {"1":7, "2":6, "3":5, "4":4,
                    "5":3, "6":2, "7":1, "8":0}
@@ -446,21 +886,24 @@ class Move():
                    "e":4, "f":5, "g":6, "h":7}
     colsToFiles = {v:k for k,v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, pawnPromotion= False, enPassant = False, isCastleMove = False):
+    def __init__(self, startSq, endSq, board, enPassant = False, isCastleMove = False, promotionChoice = None):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
         self.endRow = endSq[0]
         self.endCol = endSq[1]
         self.pieceMoved = board[self.startRow][self.startCol]
         self.pieceCaptured = board[self.endRow][self.endCol]
-        #Pawn Promotion
-        self.isPawnPromotion = pawnPromotion
+        #Pawn Promotion, to a queen unless promotionChoice says otherwise
+        self.isPawnPromotion = self.pieceMoved[1] == "P" and self.endRow in (0, 7)
+        self.promotionChoice = (promotionChoice or "Q") if self.isPawnPromotion else None
         #En passant
         self.isEnpassantMove = enPassant
         self.isCastleMove = isCastleMove
         if self.isEnpassantMove:
             self.pieceCaptured = "wP" if self.pieceMoved == "bP" else "bP"
         self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        if self.isPawnPromotion:
+            self.moveID += 10000 * (PROMOTION_PIECES.index(self.promotionChoice) + 1)
 
     def __eq__(self, other):
         if isinstance(other, Move):
@@ -468,7 +911,8 @@ class Move():
         return False
 
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        return notation + self.promotionChoice.lower() if self.isPawnPromotion else notation
 
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
\ No newline at end of file
@@ -1,13 +1,22 @@
 """ Main driver file for user input to handle user input and game states"""
 
+import copy
+import queue
+import threading
 import pygame as p
-from Chess import ChessEngine, SmartMoveFinder
+from Chess import ChessEngine, SmartMoveFinder, BitboardEngine
 
 WIDTH = HEIGHT = 512
 DIMENSION = 8
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15
+BOARD_COLOURS = [p.Color("white"), p.Color("gray")]
 IMAGES = {}
+USE_BITBOARDS = False #Play on the bitboard backed GameState instead of the string grid one
+AI_TIME_LIMIT = 1.0 #Seconds the AI may search per move
+PONDER = True #Search the expected reply while the human thinks
+PLAYER_ONE = True #If a human plays white, then true; if the AI does, false
+PLAYER_TWO = False #Same as above but for black
 
 def loadImages():
     pieces = ["wP", "wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR",
@@ -15,22 +24,63 @@ def loadImages():
     for piece in pieces:
         IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
 
+def newGameState():
+    return BitboardEngine.BitboardGameState() if USE_BITBOARDS else ChessEngine.GameState()
+
+'''
+Picker squares for move's promotion piece: the pieces of PROMOTION_PIECES in a column running from the
+promotion square towards the middle of the board
+'''
+def promotionChoices(move):
+    step = 1 if move.endRow == 0 else -1
+    return {(move.endRow + step * i, move.endCol): move.pieceMoved[0] + piece
+            for i, piece in enumerate(ChessEngine.PROMOTION_PIECES)}
+
+'''
+Runs the AI search on a copy of the game in a background thread; the move is put on returnQueue
+'''
+def startAISearch(gs, validMoves):
+    finder = SmartMoveFinder.MoveFinder(AI_TIME_LIMIT, tt=SmartMoveFinder.getSharedTable(), book=SmartMoveFinder.getSharedBook(),
+                                        tablebases=SmartMoveFinder.getSharedTablebases())
+    returnQueue = queue.Queue()
+    searchState = copy.deepcopy(gs)
+    thread = threading.Thread(target=lambda: returnQueue.put(finder.search(searchState, validMoves)), daemon=True)
+    thread.start()
+    return finder, returnQueue
+
+'''
+Starts pondering on the reply finder predicts to its own move, or returns None when it has no prediction
+'''
+def startPonder(gs, finder):
+    predicted = SmartMoveFinder.predictReply(gs, finder)
+    if predicted is None:
+        return None
+    ponderFinder = SmartMoveFinder.MoveFinder(None, tt=SmartMoveFinder.getSharedTable(), book=SmartMoveFinder.getSharedBook(),
+                                              tablebases=SmartMoveFinder.getSharedTablebases())
+    return SmartMoveFinder.Ponder(gs, predicted, ponderFinder)
+
 def main():
     p.init()
     screen = p.display.set_mode((WIDTH, HEIGHT))
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
-    gs = ChessEngine.GameState()
+    gs = newGameState()
     validMoves = gs.getValidMoves()
     moveMade = False #Flag for when valid move is made
     animate = False
     loadImages()
+    renderer = BoardRenderer(screen)
     running = True
     sqSelected = ()
     playerClicks = [] #stores two tuples: [(6,4), (4,4)] for position
     gameOver = False
-    playerOne = True #If human is white, then true else false
-    playerTwo = False #Same as above but for black
+    playerOne = PLAYER_ONE
+    playerTwo = PLAYER_TWO
+    aiFinder = None #search running in the background, None while the AI is not thinking
+    aiQueue = None
+    ponder = None #Ponder running while the human thinks
+    ponderFrom = None #finder of the AI move just played, to predict the reply from
+    promotionPicker = None #{(row, col): piece} shown while the human picks what a pawn promotes to
     while running:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
         for e in p.event.get():
@@ -38,25 +88,50 @@ def main():
             if e.type == p.QUIT:
                 running = False
 
+            elif e.type in (p.VIDEOEXPOSE, p.ACTIVEEVENT):
+                renderer.invalidate()
+
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver and humanTurn:
-                    location = p.mouse.get_pos()
+                    location = e.pos #where the click happened, not where the mouse is now
                     col = location[0]//SQ_SIZE
                     row = location[1]//SQ_SIZE
+                    move = None
 
-                    if sqSelected == (row, col): #undo action
-                        sqSelected = ()
-                        playerClicks = [] #restarts both variables
+                    if promotionPicker is not None: #a click on the picker chooses the piece, anywhere else cancels
+                        if (row, col) in promotionPicker:
+                            move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board,
+                                                    promotionChoice=promotionPicker[(row, col)][1])
+                        else:
+                            sqSelected = ()
+                            playerClicks = []
+                        promotionPicker = None
 
                     else:
-                        sqSelected = (row, col)
-                        playerClicks.append(sqSelected) #append both first and second clicks
+                        if sqSelected == (row, col): #undo action
+                            sqSelected = ()
+                            playerClicks = [] #restarts both variables
+
+                        else:
+                            sqSelected = (row, col)
+                            playerClicks.append(sqSelected) #append both first and second clicks
+
+                        if len(playerClicks) == 2:
+                            move = ChessEngine.Move(playerClicks[0],playerClicks[1],gs.board)
+                            if move.isPawnPromotion and move in validMoves:
+                                promotionPicker = promotionChoices(move) #the move waits for a piece to be picked
+                                move = None
 
-                    if len(playerClicks) == 2:
-                        move = ChessEngine.Move(playerClicks[0],playerClicks[1],gs.board)
+                    if move is not None:
                         for i in range(len(validMoves)):
                             if move == validMoves[i]:
                                 gs.makeMove(validMoves[i])
+                                if ponder is not None:
+                                    if move == ponder.predicted: #ponder hit: its search becomes the AI's
+                                        aiFinder, aiQueue = ponder.hit(AI_TIME_LIMIT)
+                                    else:
+                                        ponder.stop()
+                                    ponder = None
                                 moveMade = True
                                 animate = True
                                 sqSelected = ()
@@ -65,13 +140,23 @@ def main():
                             playerClicks = [sqSelected]
 
             elif e.type == p.KEYDOWN:
+                if promotionPicker is not None and e.key in (p.K_ESCAPE, p.K_z, p.K_r):
+                    promotionPicker = None
+                    sqSelected = ()
+                    playerClicks = []
+                if aiFinder is not None and e.key in (p.K_z, p.K_r):
+                    aiFinder.stop() #its result is dropped along with aiQueue
+                    aiFinder = None
+                if ponder is not None and e.key in (p.K_z, p.K_r):
+                    ponder.stop()
+                    ponder = None
                 if e.key == p.K_z:
                     gs.undoMove()
                     moveMade = True
                     animate = False
                     gameOver = False
                 if e.key == p.K_r:
-                    gs = ChessEngine.GameState()
+                    gs = newGameState()
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
                     playerClicks = []
@@ -80,104 +165,205 @@ def main():
                     gameOver = False
 
         #AI MOVE FINDER
-        if not gameOver and not humanTurn:
-            AIMove = SmartMoveFinder.findRandomMove(validMoves)
-            gs.makeMove(AIMove)
-            moveMade = True
-            animate = True
+        if not gameOver and not humanTurn and not moveMade:
+            if aiFinder is None:
+                aiFinder, aiQueue = startAISearch(gs, validMoves)
+            elif not aiQueue.empty():
+                AIMove = aiQueue.get()
+                ponderFrom = aiFinder if PONDER else None
+                aiFinder = None
+                gs.makeMove(AIMove)
+                moveMade = True
+                animate = True
 
 
         if moveMade:
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+                renderer.animateMove(gs.moveLog[-1], gs.board, clock)
             validMoves = gs.getValidMoves()
             moveMade = False
             animate = False
+            if ponderFrom is not None and validMoves and ((gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)):
+                ponder = startPonder(gs, ponderFrom)
+            ponderFrom = None
 
-        drawGameState(screen, gs, validMoves, sqSelected)
-
+        text = None
         if gs.checkMate:
             gameOver = True
-            if gs.whiteToMove:
-                drawText(screen, "Black wins by checkmate!")
-            else:
-                drawText(screen, "White wins by checkmate!")
-
+            text = "Black wins by checkmate!" if gs.whiteToMove else "White wins by checkmate!"
         elif gs.staleMate:
             gameOver = True
-            drawText(screen, "Stalemate!")
+            text = "Stalemate!"
+        changed = renderer.draw(gs, validMoves, sqSelected, text, promotionPicker)
 
         clock.tick(MAX_FPS)
-        p.display.flip()
+        #Idle: nothing moved and the AI is not about to, so sleep until the next event
+        if running and not changed and aiFinder is None and (gameOver or humanTurn):
+            p.event.post(p.event.wait())
 
-'''
-Highlights squares selected and moves for selected piece
-'''
-def highlightSquares(screen, gs, validMoves, sqSelected):
-    if sqSelected != ():
-        row, col = sqSelected
-        if gs.board[row][col][0] == ("w" if gs.whiteToMove else "b"):
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100)
-            s.fill(p.Color('blue'))
-            screen.blit(s, (col*SQ_SIZE, row*SQ_SIZE))
-            s.fill(p.Color("yellow"))
-            for move in validMoves:
-                if move.startRow == row and move.startCol == col:
-                    screen.blit(s, (SQ_SIZE * move.endCol, SQ_SIZE * move.endRow))
-
-
-def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen)
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board)
-
-def drawBoard(screen):
-    global colors
-    colors = [p.Color("white"), p.Color("gray")]
-    for row in range(DIMENSION):
-        for column in range(DIMENSION):
-            color = colors[((row+column) % 2)]
-            p.draw.rect(screen, color, p.Rect(column*SQ_SIZE,row*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
-
-def drawPieces(screen, board):
-    for row in range(DIMENSION):
-        for column in range(DIMENSION):
-            piece = board[row][column]
-            if piece != "--":
-                screen.blit(IMAGES[piece], p.Rect(column*SQ_SIZE, row*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+class BoardRenderer():
+    '''
+    Draws the game onto screen, repainting only what changed since the last frame. The squares are
+    rendered once into a background surface; each square remembers the piece and highlight it was last
+    drawn with, and only squares whose piece or highlight differ are repainted and passed to
+    display.update. draw() returns False when nothing changed, so the caller can go idle.
+    Fonts and rendered text are cached.
+    '''
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = p.Surface((WIDTH, HEIGHT))
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                p.draw.rect(self.background, BOARD_COLOURS[(row + col) % 2], squareRect(row, col))
+        self.highlights = {}
+        for name, colour, alpha in (("selected", "blue", 100), ("target", "yellow", 100), ("picker", "white", 220)):
+            surface = p.Surface((SQ_SIZE, SQ_SIZE))
+            surface.set_alpha(alpha)
+            surface.fill(p.Color(colour))
+            self.highlights[name] = surface
+        self.fonts = {}
+        self.texts = {}
+        self.shown = {} #(row, col) -> (piece, highlight) as last drawn
+        self.shownText = None
+        self.invalidate()
 
-'''
-Animating the piece
-'''
-def animateMove(move, screen, board, clock):
-    global colors
-    coords = []
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
-    framesPerSquare = 7 if (abs(dR) + abs(dC) < 6) else 4
-    frameCount = (abs(dR) + abs(dC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        row, col = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
-        if move.pieceCaptured != "--":
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
-        clock.tick(60)
-
-def drawText(screen, text):
-    font = p.font.SysFont("Helvitca", 32, True, False)
-    textObject = font.render(text, 0, p.Color("grey"))
-    textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2)
-    screen.blit(textObject, textLocation)
-    textObject = font.render(text, 0, p.Color("black"))
-    screen.blit(textObject, textLocation.move(2,2))
+    '''
+    Forces the next draw to repaint everything, e.g. after the window was covered
+    '''
+    def invalidate(self):
+        self.shown = {}
+        self.shownText = None
+        self.fullRedraw = True
+
+    def font(self, name, size, bold=False, italic=False):
+        key = (name, size, bold, italic)
+        if key not in self.fonts:
+            self.fonts[key] = p.font.SysFont(name, size, bold, italic)
+        return self.fonts[key]
+
+    def renderText(self, text, colour):
+        key = (text, colour)
+        if key not in self.texts:
+            self.texts[key] = self.font("Helvitca", 32, True).render(text, 0, p.Color(colour))
+        return self.texts[key]
+
+    def textLocation(self, text):
+        textObject = self.renderText(text, "grey")
+        return p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2)
+
+    def textRect(self, text):
+        textLocation = self.textLocation(text)
+        return textLocation.union(textLocation.move(2, 2)).clip(p.Rect(0, 0, WIDTH, HEIGHT))
+
+    def drawSquare(self, row, col, piece, highlight):
+        rect = squareRect(row, col)
+        self.screen.blit(self.background, rect, rect)
+        if highlight is not None:
+            self.screen.blit(self.highlights[highlight], rect)
+        if piece != "--":
+            self.screen.blit(IMAGES[piece], rect)
+        return rect
+
+    '''
+    Squares to highlight: the selected piece of the side to move and where it can go
+    '''
+    def squareHighlights(self, gs, validMoves, sqSelected):
+        highlights = {}
+        if sqSelected != ():
+            row, col = sqSelected
+            if gs.board[row][col][0] == ("w" if gs.whiteToMove else "b"):
+                highlights[(row, col)] = "selected"
+                for move in validMoves:
+                    if move.startRow == row and move.startCol == col:
+                        highlights[(move.endRow, move.endCol)] = "target"
+        return highlights
+
+    '''
+    Brings the screen up to date with the board, the selection, text (None for no message) and
+    picker, the {(row, col): piece} promotion choices drawn over the board while one is being picked
+    '''
+    def draw(self, gs, validMoves, sqSelected, text=None, picker=None):
+        highlights = self.squareHighlights(gs, validMoves, sqSelected)
+        dirty = []
+        textArea = self.textRect(text) if text is not None else None
+        if text != self.shownText and self.shownText is not None:
+            oldArea = self.textRect(self.shownText)
+            for square in list(self.shown):
+                if squareRect(*square).colliderect(oldArea):
+                    del self.shown[square]
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                if picker is not None and (row, col) in picker:
+                    state = (picker[(row, col)], "picker")
+                else:
+                    state = (gs.board[row][col], highlights.get((row, col)))
+                if self.shown.get((row, col)) != state:
+                    self.shown[(row, col)] = state
+                    dirty.append(self.drawSquare(row, col, *state))
+        if textArea is not None and (text != self.shownText or textArea.collidelist(dirty) != -1):
+            self.drawText(text)
+            dirty.append(textArea)
+        self.shownText = text
+        if self.fullRedraw:
+            p.display.flip()
+            self.fullRedraw = False
+            return True
+        if dirty:
+            p.display.update(dirty)
+        return bool(dirty)
+
+    def drawText(self, text):
+        textLocation = self.textLocation(text)
+        self.screen.blit(self.renderText(text, "grey"), textLocation)
+        self.screen.blit(self.renderText(text, "black"), textLocation.move(2, 2))
+
+    '''
+    Slides move's piece from its start to its end square. The board is the one after the move, so the
+    end square shows the captured piece until the animation is over. Each frame only repaints the
+    squares under the piece's previous and new position.
+    '''
+    def animateMove(self, move, board, clock):
+        endSquare = (move.endRow, move.endCol)
+        dirty = []
+        for (row, col), (piece, highlight) in list(self.shown.items()):
+            if highlight is not None:
+                self.shown[(row, col)] = (piece, None)
+                dirty.append(self.drawSquare(row, col, piece, None))
+        self.shown[(move.startRow, move.startCol)] = (board[move.startRow][move.startCol], None)
+        self.shown[endSquare] = (move.pieceCaptured, None)
+        dirty.append(self.drawSquare(move.startRow, move.startCol, *self.shown[(move.startRow, move.startCol)]))
+        dirty.append(self.drawSquare(move.endRow, move.endCol, *self.shown[endSquare]))
+        p.display.update(dirty)
+        dR = move.endRow - move.startRow
+        dC = move.endCol - move.startCol
+        framesPerSquare = 7 if (abs(dR) + abs(dC) < 6) else 4
+        frameCount = (abs(dR) + abs(dC)) * framesPerSquare
+        previous = None
+        for frame in range(frameCount + 1):
+            row, col = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
+            spriteRect = p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+            dirty = [spriteRect]
+            if previous is not None:
+                self.restore(previous)
+                dirty.append(previous)
+            self.screen.blit(IMAGES[move.pieceMoved], spriteRect)
+            p.display.update(dirty)
+            previous = spriteRect
+            clock.tick(60)
+        del self.shown[endSquare] #the next draw puts the moved piece there
+
+    '''
+    Repaints the squares under rect as they were last drawn
+    '''
+    def restore(self, rect):
+        for row in range(max(0, rect.top // SQ_SIZE), min(DIMENSION, (rect.bottom - 1) // SQ_SIZE + 1)):
+            for col in range(max(0, rect.left // SQ_SIZE), min(DIMENSION, (rect.right - 1) // SQ_SIZE + 1)):
+                piece, highlight = self.shown.get((row, col), ("--", None))
+                self.drawSquare(row, col, piece, highlight)
+
+
+def squareRect(row, col):
+    return p.Rect(col * SQ_SIZE, row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
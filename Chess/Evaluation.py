@@ -0,0 +1,284 @@
+"""Tapered material and piece-square evaluation plus pawn structure and mobility terms"""
+
+'''
+Piece-square tables are written from white's side with a8 first, the same square order as board
+(sq = row * 8 + col). Black reads them mirrored vertically.
+'''
+PAWN_TABLE = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0)
+PAWN_TABLE_EG = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     80,  80,  80,  80,  80,  80,  80,  80,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     30,  30,  30,  30,  30,  30,  30,  30,
+     15,  15,  15,  15,  15,  15,  15,  15,
+      5,   5,   5,   5,   5,   5,   5,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+      0,   0,   0,   0,   0,   0,   0,   0)
+KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50)
+BISHOP_TABLE = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20)
+ROOK_TABLE = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0)
+QUEEN_TABLE = (
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20)
+KING_TABLE = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20)
+KING_TABLE_EG = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50)
+
+#(middlegame, endgame) piece values and tables
+PIECE_VALUES = {"P": (100, 120), "N": (320, 300), "B": (330, 320), "R": (500, 540), "Q": (900, 950), "K": (0, 0)}
+PIECE_TABLES = {"P": (PAWN_TABLE, PAWN_TABLE_EG), "N": (KNIGHT_TABLE, KNIGHT_TABLE), "B": (BISHOP_TABLE, BISHOP_TABLE),
+                "R": (ROOK_TABLE, ROOK_TABLE), "Q": (QUEEN_TABLE, QUEEN_TABLE), "K": (KING_TABLE, KING_TABLE_EG)}
+#Game phase runs from MAX_PHASE with all pieces on the board down to 0 with only kings and pawns
+PHASE_WEIGHTS = {"P": 0, "N": 1, "B": 1, "R": 2, "Q": 4, "K": 0}
+MAX_PHASE = 24
+
+'''
+MG_SCORES[piece][sq] and EG_SCORES[piece][sq] are value plus table entry, positive for white and
+negative for black, so a position's score is the plain sum over its pieces
+'''
+MG_SCORES = {}
+EG_SCORES = {}
+for _piece, (_mgValue, _egValue) in PIECE_VALUES.items():
+    _mgTable, _egTable = PIECE_TABLES[_piece]
+    MG_SCORES["w" + _piece] = [_mgValue + _mgTable[sq] for sq in range(64)]
+    EG_SCORES["w" + _piece] = [_egValue + _egTable[sq] for sq in range(64)]
+    MG_SCORES["b" + _piece] = [-_mgValue - _mgTable[sq ^ 56] for sq in range(64)]
+    EG_SCORES["b" + _piece] = [-_egValue - _egTable[sq ^ 56] for sq in range(64)]
+PHASE = {colour + piece: weight for piece, weight in PHASE_WEIGHTS.items() for colour in "wb"}
+
+DOUBLED_PAWN = (-10, -20) #per pawn beyond the first on a file
+ISOLATED_PAWN = (-10, -15)
+#passed pawn bonus by ranks advanced from its starting rank
+PASSED_PAWN = ((0, 0), (5, 10), (10, 20), (15, 35), (25, 60), (40, 90), (60, 130), (0, 0))
+#(middlegame, endgame) per square a piece can move to
+MOBILITY = {"N": (4, 4), "B": (4, 5), "R": (2, 4), "Q": (1, 2)}
+#material and piece-square score this far outside the window is returned without the slower terms
+LAZY_MARGIN = 250
+PAWN_TABLE_ENTRIES = 1 << 14
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+SLIDER_DIRECTIONS = {"B": BISHOP_DIRECTIONS, "R": ROOK_DIRECTIONS, "Q": ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+KNIGHT_TARGETS = []
+for _sq in range(64):
+    _row, _col = divmod(_sq, 8)
+    KNIGHT_TARGETS.append(tuple((_row + dRow, _col + dCol) for dRow, dCol in
+                                ((-2, -1), (-2, 1), (2, -1), (2, 1), (1, -2), (1, 2), (-1, -2), (-1, 2))
+                                if 0 <= _row + dRow < 8 and 0 <= _col + dCol < 8))
+
+'''
+(middlegame score, endgame score, phase) of board from scratch; GameState keeps these up to date
+in makeMove/undoMove as mgScore, egScore and phase
+'''
+def computePieceSquare(board):
+    mg = eg = phase = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece != "--":
+                sq = row * 8 + col
+                mg += MG_SCORES[piece][sq]
+                eg += EG_SCORES[piece][sq]
+                phase += PHASE[piece]
+    return mg, eg, phase
+
+
+def taper(mg, eg, phase):
+    phase = min(phase, MAX_PHASE)
+    return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+'''
+Doubled, isolated and passed pawn terms as (middlegame, endgame), white positive.
+whitePawns and blackPawns are lists of (row, col).
+'''
+def pawnStructure(whitePawns, blackPawns):
+    mg = eg = 0
+    for pawns, enemies, sign in ((whitePawns, blackPawns, 1), (blackPawns, whitePawns, -1)):
+        files = [0] * 10 #padded so col - 1 and col + 1 need no bounds checks
+        for row, col in pawns:
+            files[col + 1] += 1
+        for count in files:
+            if count > 1:
+                mg += sign * DOUBLED_PAWN[0] * (count - 1)
+                eg += sign * DOUBLED_PAWN[1] * (count - 1)
+        for row, col in pawns:
+            if files[col] == 0 and files[col + 2] == 0:
+                mg += sign * ISOLATED_PAWN[0]
+                eg += sign * ISOLATED_PAWN[1]
+            passed = True
+            for enemyRow, enemyCol in enemies:
+                if abs(enemyCol - col) <= 1 and (enemyRow < row if sign == 1 else enemyRow > row):
+                    passed = False
+                    break
+            if passed:
+                advanced = 6 - row if sign == 1 else row - 1
+                mg += sign * PASSED_PAWN[advanced][0]
+                eg += sign * PASSED_PAWN[advanced][1]
+    return mg, eg
+
+
+class PawnTable():
+    '''
+    Direct-mapped cache of pawnStructure results keyed on gs.pawnKey. Pawn moves are a small share of
+    the moves searched, so sibling and nearby nodes mostly share a pawn structure and hit here.
+    '''
+    def __init__(self, entries=PAWN_TABLE_ENTRIES):
+        size = 1
+        while size * 2 <= entries:
+            size *= 2
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1], entry[2]
+        return None
+
+    def store(self, key, mg, eg):
+        self.entries[key & self.mask] = (key, mg, eg)
+
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+        self.probes = 0
+        self.hits = 0
+
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+
+#used by evaluate when no table is passed in
+sharedPawnTable = PawnTable()
+
+'''
+Squares each knight, bishop, rook and queen can move to (empty or enemy), weighted, as (middlegame, endgame).
+When pawns is a (whitePawns, blackPawns) pair of lists the pawns met on the way are appended to them as (row, col),
+so a pawn table miss gets what pawnStructure needs from the same pass over the board.
+'''
+def mobility(board, pawns=None):
+    mg = eg = 0
+    for row in range(8):
+        boardRow = board[row]
+        for col in range(8):
+            piece = boardRow[col]
+            if piece == "--":
+                continue
+            kind = piece[1]
+            if kind == "P":
+                if pawns is not None:
+                    pawns[piece[0] != "w"].append((row, col))
+                continue
+            if kind == "K":
+                continue
+            colour = piece[0]
+            count = 0
+            if kind == "N":
+                for endRow, endCol in KNIGHT_TARGETS[row * 8 + col]:
+                    if board[endRow][endCol][0] != colour:
+                        count += 1
+            else:
+                for dRow, dCol in SLIDER_DIRECTIONS[kind]:
+                    endRow, endCol = row + dRow, col + dCol
+                    while 0 <= endRow < 8 and 0 <= endCol < 8:
+                        target = board[endRow][endCol]
+                        if target == "--":
+                            count += 1
+                        else:
+                            if target[0] != colour:
+                                count += 1
+                            break
+                        endRow += dRow
+                        endCol += dCol
+            weights = MOBILITY[kind]
+            if colour == "w":
+                mg += weights[0] * count
+                eg += weights[1] * count
+            else:
+                mg -= weights[0] * count
+                eg -= weights[1] * count
+    return mg, eg
+
+'''
+Score of gs in centipawns from the side to move's point of view. Material and piece-square terms come
+from the incrementally kept gs.mgScore/egScore/phase; pawn structure and mobility need a pass over the
+board, which is skipped when alpha/beta are given and the cheap score is already LAZY_MARGIN outside them.
+Pawn structure is looked up in pawnTable (sharedPawnTable by default) first; only a miss collects the pawns.
+'''
+def evaluate(gs, alpha=None, beta=None, pawnTable=None):
+    mg, eg, phase = gs.mgScore, gs.egScore, gs.phase
+    if alpha is not None:
+        score = taper(mg, eg, phase)
+        if not gs.whiteToMove:
+            score = -score
+        if score + LAZY_MARGIN <= alpha or score - LAZY_MARGIN >= beta:
+            return score
+    if pawnTable is None:
+        pawnTable = sharedPawnTable
+    pawns = pawnTable.probe(gs.pawnKey)
+    if pawns is None:
+        whitePawns, blackPawns = [], []
+        mobilityMg, mobilityEg = mobility(gs.board, (whitePawns, blackPawns))
+        pawns = pawnStructure(whitePawns, blackPawns)
+        pawnTable.store(gs.pawnKey, *pawns)
+    else:
+        mobilityMg, mobilityEg = mobility(gs.board)
+    pawnMg, pawnEg = pawns
+    score = taper(mg + mobilityMg + pawnMg, eg + mobilityEg + pawnEg, phase)
+    return score if gs.whiteToMove else -score
@@ -0,0 +1,387 @@
+"""Packed game storage with a memory-mapped position index; run with python -m Chess.GameDatabase"""
+import argparse
+import array
+import collections
+import glob
+import heapq
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from Chess import ChessEngine, Pgn, TranspositionTable as TT
+
+'''
+A database is a directory of append-only files:
+
+    games.bin       per game a GAME_HEADER (plies, result, FEN length), the FEN when the game does not
+                    start from the initial position, then one 16-bit move (TT.encodeMove) per ply
+    games.idx       the offset of each game in games.bin as a 64-bit integer, so game n is found directly
+    seg-NNNNNN.bin  position index segments: ENTRY records sorted by Zobrist key, one for every position
+                    of every game, holding the game number, the move played from it (0 after the last
+                    move) and the ply with the game's result in its top two bits
+
+New games only ever append to games.bin and games.idx and add segments, so readers can keep their
+maps open while a build runs. A lookup binary searches each segment; compact() merges them into one.
+'''
+GAME_HEADER = struct.Struct("<HBB")
+ENTRY = struct.Struct("<QIHH")
+KEY = struct.Struct("<Q")
+OFFSET = KEY #games.idx entries
+INVALID = 0xFF #result of a game that could not be replayed; it is stored without moves
+PLY_MASK = (1 << 14) - 1
+SEGMENT_ENTRIES = 1 << 22 #entries gathered in memory before they are written as a segment
+
+
+def _mapFile(path):
+    with open(path, "rb") as stream:
+        if os.fstat(stream.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Segment():
+    def __init__(self, path):
+        self.path = path
+        self.data = _mapFile(path)
+        self.count = len(self.data) // ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    '''
+    Index of the first entry whose key is not below key
+    '''
+    def lowerBound(self, key):
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if KEY.unpack_from(self.data, mid * ENTRY.size)[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    '''
+    (game, move code, ply, result) of every entry for key
+    '''
+    def entries(self, key):
+        index = self.lowerBound(key)
+        while index < self.count:
+            entryKey, game, move, plyResult = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entryKey != key:
+                break
+            yield game, move, plyResult & PLY_MASK, plyResult >> 14
+            index += 1
+
+
+class GameDatabase():
+    '''
+    Read side of a database directory. Queries touch only the index segments (and, to read a game, its
+    own bytes in games.bin), never whole games. Call refresh() to see games appended since opening.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        self.games = b""
+        self.offsets = b""
+        self.segments = []
+        self.refresh()
+
+    def refresh(self):
+        self.close()
+        gamesPath = os.path.join(self.directory, "games.bin")
+        if not os.path.exists(gamesPath):
+            raise FileNotFoundError("no game database in %s" % self.directory)
+        self.games = _mapFile(gamesPath)
+        self.offsets = _mapFile(os.path.join(self.directory, "games.idx"))
+        self.segments = [Segment(path) for path in sorted(glob.glob(os.path.join(self.directory, "seg-*.bin")))]
+
+    def close(self):
+        for data in (self.games, self.offsets):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        for segment in self.segments:
+            segment.close()
+        self.games = self.offsets = b""
+        self.segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets) // OFFSET.size
+
+    def entries(self, key):
+        for segment in self.segments:
+            yield from segment.entries(key)
+
+    '''
+    (game, ply) of every time a game reached the position with Zobrist key key, by game number
+    '''
+    def gamesReaching(self, key, limit=None):
+        found = sorted((game, ply) for game, _, ply, _ in self.entries(key))
+        return found if limit is None else found[:limit]
+
+    '''
+    {move code: [games, white wins, black wins, draws, unfinished]} of the moves played from key's position
+    '''
+    def moveStats(self, key):
+        stats = {}
+        for _, move, _, result in self.entries(key):
+            if move:
+                counts = stats.setdefault(move, [0, 0, 0, 0, 0])
+                counts[0] += 1
+                counts[result + 1] += 1
+        return stats
+
+    '''
+    (start FEN, list of move codes, result) of game number game
+    '''
+    def readGame(self, game):
+        offset = OFFSET.unpack_from(self.offsets, game * OFFSET.size)[0]
+        plies, result, fenLength = GAME_HEADER.unpack_from(self.games, offset)
+        offset += GAME_HEADER.size
+        fen = bytes(self.games[offset:offset + fenLength]).decode() if fenLength else ChessEngine.START_FEN
+        offset += fenLength
+        moves = array.array("H", self.games[offset:offset + plies * 2])
+        if sys.byteorder != "little":
+            moves.byteswap()
+        return fen, list(moves), Pgn.RESULTS[result] if result != INVALID else None
+
+    '''
+    GameState with game number game played out, and its result
+    '''
+    def replay(self, game):
+        fen, moves, result = self.readGame(game)
+        gs = ChessEngine.GameState(fen)
+        for code in moves:
+            gs.makeMove(_legalMove(gs, code))
+        return gs, result
+
+
+def _legalMove(gs, code):
+    decoded = TT.decodeMove(code, gs.board)
+    for move in gs.getValidMoves():
+        if move == decoded:
+            return move
+    raise ValueError("stored move %d is not legal in %s" % (code, gs.getFen()))
+
+'''
+Worker side of buildDatabase: replays a batch of games numbered from firstGame and returns the length
+of each game's record, the records to append to games.bin, the batch's index entries packed and sorted,
+and the number of games that could not be replayed
+'''
+def packBatch(task):
+    firstGame, batch = task
+    records = []
+    entries = []
+    errors = 0
+    for number, (headers, movetext) in enumerate(batch):
+        game = firstGame + number
+        fen = headers.get("FEN", ChessEngine.START_FEN)
+        result = Pgn.RESULTS.index(headers["Result"]) if headers.get("Result") in Pgn.RESULTS else Pgn.RESULTS.index("*")
+        try:
+            gs = ChessEngine.GameState(fen)
+            codes = []
+            keys = []
+            for san in Pgn.sanTokens(movetext):
+                move = Pgn.parseSan(gs, san)
+                keys.append(gs.zobristKey)
+                codes.append(TT.encodeMove(move))
+                gs.makeMove(move)
+            keys.append(gs.zobristKey)
+            codes.append(0)
+            if len(codes) > PLY_MASK:
+                raise ValueError("game too long")
+        except (ValueError, KeyError, IndexError):
+            errors += 1
+            records.append(GAME_HEADER.pack(0, INVALID, 0))
+            continue
+        fenBytes = fen.encode() if fen != ChessEngine.START_FEN else b""
+        moves = array.array("H", codes[:-1])
+        if sys.byteorder != "little":
+            moves.byteswap()
+        records.append(GAME_HEADER.pack(len(moves), result, len(fenBytes)) + fenBytes + moves.tobytes())
+        entries.extend((key, game, code, ply | result << 14) for ply, (key, code) in enumerate(zip(keys, codes)))
+    entries.sort()
+    return [len(record) for record in records], b"".join(records), b"".join(ENTRY.pack(*entry) for entry in entries), errors
+
+
+def _writeSegment(directory, chunks):
+    existing = glob.glob(os.path.join(directory, "seg-*.bin"))
+    number = max((int(os.path.basename(path)[4:10]) for path in existing), default=0) + 1
+    path = os.path.join(directory, "seg-%06d.bin" % number)
+    with open(path + ".tmp", "wb") as out:
+        for entry in heapq.merge(*(ENTRY.iter_unpack(chunk) for chunk in chunks)):
+            out.write(ENTRY.pack(*entry))
+    os.replace(path + ".tmp", path)
+    return path
+
+'''
+Appends every game of the PGN files to the database in directory, creating it if needed. Games are
+replayed and packed in a process pool, in batches with at most two per worker in flight; their
+sorted index entries are merged into a new segment every segmentEntries entries.
+Returns a dict of totals.
+'''
+def buildDatabase(pgnPaths, directory, workers=1, batchSize=256, segmentEntries=SEGMENT_ENTRIES, limit=None,
+                  onProgress=None):
+    os.makedirs(directory, exist_ok=True)
+    gamesPath = os.path.join(directory, "games.bin")
+    indexPath = os.path.join(directory, "games.idx")
+    nextGame = os.path.getsize(indexPath) // 8 if os.path.exists(indexPath) else 0
+    totals = {"games": 0, "errors": 0, "positions": 0, "segments": 0}
+    start = time.perf_counter()
+
+    def games():
+        count = 0
+        for path in pgnPaths:
+            stream = Pgn.openPgn(path)
+            try:
+                for game in Pgn.readGames(stream):
+                    if limit is not None and count >= limit:
+                        return
+                    count += 1
+                    yield game
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+
+    def tasks():
+        firstGame = nextGame
+        batch = []
+        for game in games():
+            batch.append(game)
+            if len(batch) == batchSize:
+                yield firstGame, batch
+                firstGame += len(batch)
+                batch = []
+        if batch:
+            yield firstGame, batch
+
+    chunks = []
+    chunkEntries = 0
+    with open(gamesPath, "ab") as gamesOut, open(indexPath, "ab") as indexOut:
+        offset = gamesOut.tell()
+
+        def collect(result):
+            nonlocal offset, chunkEntries
+            lengths, records, entries, errors = result
+            offsets = array.array("Q")
+            for length in lengths:
+                offsets.append(offset)
+                offset += length
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            gamesOut.write(records)
+            indexOut.write(offsets.tobytes())
+            chunks.append(entries)
+            chunkEntries += len(entries) // ENTRY.size
+            totals["games"] += len(lengths)
+            totals["errors"] += errors
+            totals["positions"] += len(entries) // ENTRY.size
+            if chunkEntries >= segmentEntries:
+                flush()
+            if onProgress is not None:
+                onProgress(totals["games"], time.perf_counter() - start)
+
+        def flush():
+            nonlocal chunks, chunkEntries
+            if chunks:
+                gamesOut.flush()
+                indexOut.flush()
+                _writeSegment(directory, chunks)
+                totals["segments"] += 1
+            chunks, chunkEntries = [], 0
+
+        if workers <= 1:
+            for task in tasks():
+                collect(packBatch(task))
+        else:
+            with multiprocessing.Pool(workers) as pool:
+                pending = collections.deque()
+                for task in tasks():
+                    pending.append(pool.apply_async(packBatch, (task,)))
+                    if len(pending) >= workers * 2:
+                        collect(pending.popleft().get())
+                while pending:
+                    collect(pending.popleft().get())
+        flush()
+    totals["seconds"] = time.perf_counter() - start
+    return totals
+
+'''
+Merges all segments of the database in directory into one
+'''
+def compact(directory):
+    paths = sorted(glob.glob(os.path.join(directory, "seg-*.bin")))
+    if len(paths) < 2:
+        return len(paths)
+    segments = [Segment(path) for path in paths]
+    try:
+        merged = _writeSegment(directory, [segment.data for segment in segments])
+    finally:
+        for segment in segments:
+            segment.close()
+    for path in paths:
+        os.remove(path)
+    os.replace(merged, os.path.join(directory, "seg-000001.bin"))
+    return len(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a packed game database")
+    commands = parser.add_subparsers(dest="command")
+    build = commands.add_parser("build", help="append the games of PGN files to a database")
+    build.add_argument("database")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--workers", type=int, default=os.cpu_count())
+    build.add_argument("--limit", type=int, help="stop after this many games")
+    query = commands.add_parser("query", help="move statistics and games for a position")
+    query.add_argument("database")
+    query.add_argument("--fen", default=ChessEngine.START_FEN)
+    query.add_argument("--games", type=int, default=10, help="game numbers to list")
+    show = commands.add_parser("show", help="print a game as PGN")
+    show.add_argument("database")
+    show.add_argument("game", type=int)
+    merge = commands.add_parser("compact", help="merge the index segments into one")
+    merge.add_argument("database")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        totals = buildDatabase(args.pgn, args.database, args.workers, limit=args.limit)
+        print("%d games (%d could not be replayed), %d positions in %d segments, %.1fs"
+              % (totals["games"], totals["errors"], totals["positions"], totals["segments"], totals["seconds"]))
+    elif args.command == "query":
+        gs = ChessEngine.GameState(args.fen)
+        with GameDatabase(args.database) as db:
+            start = time.perf_counter()
+            stats = db.moveStats(gs.zobristKey)
+            reaching = db.gamesReaching(gs.zobristKey)
+            elapsed = time.perf_counter() - start
+            validMoves = gs.getValidMoves()
+            for code, (count, white, black, draws, _) in sorted(stats.items(), key=lambda item: -item[1][0]):
+                decoded = TT.decodeMove(code, gs.board)
+                move = next((move for move in validMoves if move == decoded), None)
+                print("%-8s %7d  +%d =%d -%d" % (Pgn.moveToSan(gs, move, validMoves) if move else code, count,
+                                                 white, draws, black))
+            print("%d games reach this position%s (%.1f ms)" % (len(reaching), ": " + " ".join(
+                str(game) for game, _ in reaching[:args.games]) if reaching else "", elapsed * 1000))
+    elif args.command == "show":
+        with GameDatabase(args.database) as db:
+            gs, result = db.replay(args.game)
+            sys.stdout.write(Pgn.gameToPgn(gs, {"Result": result or "*"}))
+    elif args.command == "compact":
+        print("%d segments merged" % compact(args.database))
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""Line-based TCP server hosting many games against a shared engine process pool; run with python -m Chess.GameServer"""
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from Chess import ChessEngine, SmartMoveFinder, TranspositionTable as TT, UciEngine
+from Chess.SelfPlay import rulesResult
+
+'''
+One client connection is one game. Commands, one per line:
+
+    new [white|black] [budget <seconds>] [fen <fen>]   start a game, playing the given colour (default white)
+    move <uci>                                          play a move; the engine answers with "engine <uci>"
+    go                                                  ask the engine to move again after "error busy"
+    undo                                                take back the last move of each side
+    fen | moves                                         current position, legal moves in UCI notation
+    metrics                                             server metrics as JSON
+    quit
+
+Replies start with "ok", "error", "engine", "gameover", "fen", "moves" or "metrics". Engine moves are
+searched in a process pool; each game has a budget of engine seconds spread over its moves, and when
+more than maxPending searches are queued new engine turns are refused with "error busy" until the
+queue drains.
+'''
+DEFAULT_PORT = 8765
+DEFAULT_BUDGET = 60.0 #engine seconds per game
+MAX_MOVE_TIME = 5.0
+MIN_MOVE_TIME = 0.05
+EXPECTED_MOVES = 30 #moves the remaining budget is spread over
+LATENCY_SAMPLES = 1000
+_workerTable = None
+
+
+def engineMove(task):
+    global _workerTable
+    startFen, moves, timeLimit, hashMB = task
+    if _workerTable is None:
+        _workerTable = TT.TranspositionTable(hashMB)
+    gs = ChessEngine.GameState(startFen)
+    for text in moves:
+        gs.makeMove(UciEngine.parseUciMove(gs, text))
+    finder = SmartMoveFinder.MoveFinder(timeLimit, tt=_workerTable, book=SmartMoveFinder.getSharedBook(),
+                                        tablebases=SmartMoveFinder.getSharedTablebases())
+    start = time.perf_counter()
+    move = finder.search(gs)
+    return UciEngine.moveToUci(move), finder.depth, finder.nodes, time.perf_counter() - start
+
+
+class Session():
+    def __init__(self, fen=ChessEngine.START_FEN, humanWhite=True, budget=DEFAULT_BUDGET):
+        self.startFen = fen
+        self.gs = ChessEngine.GameState(fen)
+        self.moves = []
+        self.humanWhite = humanWhite
+        self.budget = budget
+        self.validMoves = self.gs.getValidMoves()
+        self.thinking = False
+
+    def engineTurn(self):
+        return self.gs.whiteToMove != self.humanWhite and self.result() is None
+
+    '''
+    The game's result by the rules alone; unlike self-play games, a game here is never adjudicated
+    '''
+    def result(self):
+        return rulesResult(self.gs, self.validMoves)
+
+    def moveTime(self):
+        return min(MAX_MOVE_TIME, max(MIN_MOVE_TIME, self.budget / EXPECTED_MOVES))
+
+    def play(self, move):
+        self.gs.makeMove(move)
+        self.moves.append(UciEngine.moveToUci(move))
+        self.validMoves = self.gs.getValidMoves()
+
+
+class Metrics():
+    def __init__(self):
+        self.sessions = 0
+        self.sessionsTotal = 0
+        self.pending = 0
+        self.maxPending = 0
+        self.requests = 0
+        self.rejected = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES) #seconds from request to reply
+        self.waits = collections.deque(maxlen=LATENCY_SAMPLES) #seconds queued before a worker took it
+
+    def toDict(self):
+        def percentiles(samples):
+            ordered = sorted(samples)
+            if not ordered:
+                return {"p50": None, "p95": None, "max": None}
+            return {"p50": round(ordered[len(ordered) // 2], 4), "p95": round(ordered[int(len(ordered) * 0.95)], 4),
+                    "max": round(ordered[-1], 4)}
+
+        return {"sessions": self.sessions, "sessionsTotal": self.sessionsTotal, "queueDepth": self.pending,
+                "maxQueueDepth": self.maxPending, "engineRequests": self.requests, "rejected": self.rejected,
+                "latency": percentiles(self.latencies), "queueWait": percentiles(self.waits)}
+
+
+class GameServer():
+    '''
+    Every game lives in this process as a Session holding a GameState, so an idle game costs only its
+    memory. Only engine turns leave the event loop: they go to a pool of workers processes, each with
+    its own transposition table, and at most maxPending of them may be queued or running at once.
+    '''
+    def __init__(self, workers=None, maxPending=None, hashMB=TT.DEFAULT_SIZE_MB, idleTimeout=None):
+        self.workers = workers or os.cpu_count()
+        self.maxPending = maxPending or self.workers * 4
+        self.hashMB = hashMB
+        self.idleTimeout = idleTimeout
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.metrics = Metrics()
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handleClient, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handleClient(self, reader, writer):
+        self.metrics.sessions += 1
+        self.metrics.sessionsTotal += 1
+        session = Session()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idleTimeout)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+                tokens = line.decode(errors="replace").split()
+                if not tokens:
+                    continue
+                if tokens[0] == "quit":
+                    break
+                session = self.handle(session, tokens, writer, tasks)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.metrics.sessions -= 1
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    def send(self, writer, line):
+        if not writer.is_closing():
+            writer.write((line + "\n").encode())
+
+    '''
+    Runs one command for session and returns the session to use from now on
+    '''
+    def handle(self, session, tokens, writer, tasks):
+        command = tokens[0]
+        if command == "metrics":
+            self.send(writer, "metrics " + json.dumps(self.metrics.toDict()))
+        elif command == "fen":
+            self.send(writer, "fen " + session.gs.getFen())
+        elif command == "moves":
+            self.send(writer, "moves " + " ".join(UciEngine.moveToUci(move) for move in session.validMoves))
+        elif session.thinking:
+            self.send(writer, "error engine is thinking")
+        elif command == "new":
+            try:
+                session = self.newSession(tokens[1:])
+            except (ValueError, KeyError, IndexError) as e:
+                self.send(writer, "error bad new: %s" % e)
+                return session
+            self.send(writer, "ok " + session.gs.getFen())
+            self.startEngine(session, writer, tasks)
+        elif command == "move":
+            move = UciEngine.parseUciMove(session.gs, tokens[1]) if len(tokens) > 1 else None
+            if session.result() is not None or session.gs.whiteToMove != session.humanWhite:
+                self.send(writer, "error not your turn")
+            elif move is None:
+                self.send(writer, "error illegal move")
+            else:
+                session.play(move)
+                self.send(writer, "ok " + UciEngine.moveToUci(move))
+                self.sendResult(session, writer)
+                self.startEngine(session, writer, tasks)
+        elif command == "go":
+            self.startEngine(session, writer, tasks)
+        elif command == "undo":
+            while session.moves:
+                session.gs.undoMove()
+                session.moves.pop()
+                if session.gs.whiteToMove == session.humanWhite:
+                    break
+            session.validMoves = session.gs.getValidMoves()
+            self.send(writer, "ok " + session.gs.getFen())
+        else:
+            self.send(writer, "error unknown command " + command)
+        return session
+
+    def newSession(self, args):
+        humanWhite = True
+        budget = DEFAULT_BUDGET
+        fen = ChessEngine.START_FEN
+        i = 0
+        while i < len(args):
+            if args[i] in ("white", "black"):
+                humanWhite = args[i] == "white"
+            elif args[i] == "budget":
+                i += 1
+                budget = float(args[i])
+            elif args[i] == "fen":
+                fen = " ".join(args[i + 1:])
+                break
+            else:
+                raise ValueError("unknown argument " + args[i])
+            i += 1
+        return Session(fen, humanWhite, budget)
+
+    def sendResult(self, session, writer):
+        result = session.result()
+        if result is not None:
+            self.send(writer, "gameover %s %s" % result)
+
+    def startEngine(self, session, writer, tasks):
+        if not session.engineTurn():
+            return
+        if self.metrics.pending >= self.maxPending:
+            self.metrics.rejected += 1
+            self.send(writer, "error busy")
+            return
+        metrics = self.metrics
+        metrics.pending += 1
+        metrics.maxPending = max(metrics.maxPending, metrics.pending)
+        metrics.requests += 1
+        session.thinking = True
+        loop = asyncio.get_running_loop()
+        future = self.pool.submit(engineMove, (session.startFen, list(session.moves), session.moveTime(), self.hashMB))
+
+        #the pool's future finishes even when the client has gone and its task was cancelled,
+        #so the queue depth follows the workers rather than the connections
+        def searched(future):
+            try:
+                loop.call_soon_threadsafe(self.searchDone)
+            except RuntimeError: #the loop has already been closed
+                pass
+
+        future.add_done_callback(searched)
+        task = asyncio.ensure_future(self.engineTurn(session, writer, future))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def searchDone(self):
+        self.metrics.pending -= 1
+
+    '''
+    Waits for the search in future and plays its move. This is the only place session.thinking is cleared.
+    '''
+    async def engineTurn(self, session, writer, future):
+        metrics = self.metrics
+        start = time.perf_counter()
+        try:
+            text, depth, nodes, searchTime = await asyncio.wrap_future(future)
+        except Exception as e:
+            self.send(writer, "error engine failed: %s" % e)
+            return
+        finally:
+            session.thinking = False
+        latency = time.perf_counter() - start
+        metrics.latencies.append(latency)
+        metrics.waits.append(max(0.0, latency - searchTime))
+        session.budget = max(0.0, session.budget - searchTime)
+        move = UciEngine.parseUciMove(session.gs, text)
+        session.play(move)
+        self.send(writer, "engine %s depth %d nodes %d time %d" % (text, depth, nodes, searchTime * 1000))
+        self.sendResult(session, writer)
+        if not writer.is_closing():
+            await writer.drain()
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve games against the engine over line-based TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="engine processes")
+    parser.add_argument("--max-pending", type=int, help="engine turns queued or running before refusing more")
+    parser.add_argument("--hash", type=int, default=TT.DEFAULT_SIZE_MB, help="table size per worker in MB")
+    parser.add_argument("--idle-timeout", type=float, help="seconds of silence before a client is dropped")
+    args = parser.parse_args(argv)
+
+    server = GameServer(args.workers, args.max_pending, args.hash, args.idle_timeout)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
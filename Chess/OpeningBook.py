@@ -0,0 +1,216 @@
+"""Opening book probed through mmap, in the engine's own format or Polyglot's; run with python -m Chess.OpeningBook"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from Chess import ChessEngine, Pgn, Polyglot
+
+'''
+A book is a 16-byte HEADER followed by 16 big-endian byte entries: position key, move, weight and
+a learn field, sorted by key. Keys are the engine's own Zobrist keys (gs.zobristKey), so probing costs
+no hashing. A Polyglot .bin file is the same entries with no header, keyed by Polyglot.polyglotKey;
+OpeningBook reads both and buildBook writes either.
+'''
+HEADER = struct.Struct(">8sII") #magic, version, unused
+MAGIC = b"PYCHBOOK"
+VERSION = 1
+ENTRY = struct.Struct(">QHHI")
+MAX_WEIGHT = 0xFFFF
+_PROMOTION_CODES = {"N": 1, "B": 2, "R": 3, "Q": 4}
+
+'''
+Move bits, laid out as in Polyglot: to file 0-2, to rank 3-5, from file 6-8, from rank 9-11, promotion 12-14.
+Castling is written as the king taking its own rook, e1h1 rather than e1g1.
+'''
+def encodeMove(move):
+    endCol = move.endCol
+    if move.isCastleMove:
+        endCol = 7 if move.endCol > move.startCol else 0
+    code = endCol | (7 - move.endRow) << 3 | move.startCol << 6 | (7 - move.startRow) << 9
+    if move.isPawnPromotion:
+        code |= _PROMOTION_CODES[move.promotionChoice] << 12
+    return code
+
+
+class OpeningBook():
+    '''
+    The file is mapped read-only and searched in place, so opening is instant whatever its size
+    and processes that open the same book share its pages through the OS page cache.
+    A file starting with MAGIC is the engine's format; any other is read as a Polyglot book.
+    Raises ValueError for a file that is neither.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        header = self.file.read(HEADER.size)
+        if header[:len(MAGIC)] == MAGIC:
+            if len(header) < HEADER.size or HEADER.unpack(header)[1] != VERSION:
+                self.file.close()
+                raise ValueError("%s is a book of an unsupported version" % path)
+            self.offset = HEADER.size
+            self.polyglot = False
+        else:
+            self.offset = 0
+            self.polyglot = True
+        if (size - self.offset) % ENTRY.size:
+            self.file.close()
+            raise ValueError("%s is not an opening book: its size is not a whole number of entries" % path)
+        self.count = (size - self.offset) // ENTRY.size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def keyAt(self, index):
+        return ENTRY.unpack_from(self.data, self.offset + index * ENTRY.size)[0]
+
+    def positionKey(self, gs):
+        return Polyglot.polyglotKey(gs) if self.polyglot else gs.zobristKey
+
+    '''
+    (move code, weight) of every entry for key, found by binary search for the first one
+    '''
+    def entries(self, key):
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.keyAt(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        found = []
+        while low < self.count:
+            entryKey, move, weight, _ = ENTRY.unpack_from(self.data, self.offset + low * ENTRY.size)
+            if entryKey != key:
+                break
+            found.append((move, weight))
+            low += 1
+        return found
+
+    '''
+    Legal book moves for gs as (move, weight) pairs, best first
+    '''
+    def bookMoves(self, gs, validMoves=None):
+        found = self.entries(self.positionKey(gs))
+        if not found:
+            return []
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        byCode = {encodeMove(move): move for move in validMoves}
+        moves = [(byCode[code], weight) for code, weight in found if code in byCode and weight > 0]
+        return sorted(moves, key=lambda pair: pair[1], reverse=True)
+
+    '''
+    A book move for gs picked at random in proportion to its weight, or None when out of book
+    '''
+    def pickMove(self, gs, validMoves=None, rng=random):
+        moves = self.bookMoves(gs, validMoves)
+        if not moves:
+            return None
+        pick = rng.randrange(sum(weight for _, weight in moves))
+        for move, weight in moves:
+            pick -= weight
+            if pick < 0:
+                return move
+        return moves[-1][0]
+
+'''
+Writes a book from the first maxPly plies of every game in the PGN files. A move scores 2 for each
+win and 1 for each draw of the side that played it. As in Polyglot's builder, moves that scored nothing
+or were seen fewer than minCount times are dropped, and the weights of a position are scaled down
+together if any would overflow 16 bits. With polyglot the file is a Polyglot book instead.
+Returns the number of entries written.
+'''
+def buildBook(pgnPaths, outPath, maxPly=20, minCount=1, polyglot=False):
+    stats = {}
+    for path in pgnPaths:
+        stream = Pgn.openPgn(path)
+        try:
+            for headers, movetext in Pgn.readGames(stream):
+                result = headers.get("Result", "*")
+                fen = headers.get("FEN", ChessEngine.START_FEN)
+                gs = ChessEngine.GameState(fen)
+                try:
+                    for san in Pgn.sanTokens(movetext)[:maxPly]:
+                        move = Pgn.parseSan(gs, san)
+                        won = result == ("1-0" if gs.whiteToMove else "0-1")
+                        key = Polyglot.polyglotKey(gs) if polyglot else gs.zobristKey
+                        entry = stats.setdefault((key, encodeMove(move)), [0, 0])
+                        entry[0] += 1
+                        entry[1] += 2 if won else 1 if result == "1/2-1/2" else 0
+                        gs.makeMove(move)
+                except ValueError:
+                    continue
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    byKey = {}
+    for (key, move), (count, score) in stats.items():
+        if count >= minCount and score > 0:
+            byKey.setdefault(key, []).append((move, score))
+    written = 0
+    with open(outPath, "wb") as out:
+        if not polyglot:
+            out.write(HEADER.pack(MAGIC, VERSION, 0))
+        for key in sorted(byKey):
+            moves = byKey[key]
+            scale = max(1, -(-max(score for _, score in moves) // MAX_WEIGHT))
+            for move, score in sorted(moves, key=lambda pair: pair[1], reverse=True):
+                out.write(ENTRY.pack(key, move, max(1, score // scale), 0))
+                written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query an opening book")
+    commands = parser.add_subparsers(dest="command")
+    build = commands.add_parser("build", help="build a book from PGN files")
+    build.add_argument("book")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--plies", type=int, default=20, help="plies of each game to include")
+    build.add_argument("--min-count", type=int, default=1, help="drop moves played fewer times than this")
+    build.add_argument("--polyglot", action="store_true", help="write a Polyglot .bin book")
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=ChessEngine.START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print("%d entries written to %s" % (buildBook(args.pgn, args.book, args.plies, args.min_count, args.polyglot), args.book))
+    elif args.command == "probe":
+        gs = ChessEngine.GameState(args.fen)
+        try:
+            book = OpeningBook(args.book)
+        except ValueError as e:
+            sys.stderr.write("%s\n" % e)
+            return 1
+        with book:
+            moves = book.bookMoves(gs)
+            total = sum(weight for _, weight in moves)
+            for move, weight in moves:
+                print("%-8s %5d %5.1f%%" % (Pgn.moveToSan(gs, move), weight, 100.0 * weight / total))
+            if not moves:
+                print("no book moves")
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Lazy SMP search over helper processes sharing one transposition table; run with python -m Chess.ParallelSearch"""
+import argparse
+import copy
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+from Chess import ChessEngine, SmartMoveFinder, TranspositionTable as TT
+
+RESULT_POLL = 0.1 #seconds between checks that helpers still waited on are alive
+
+
+def _helperLoop(index, shmName, tableSize, tasks, results, stopEvent):
+    shm = shared_memory.SharedMemory(name=shmName)
+    buffer = shm.buf[:tableSize]
+    tt = TT.TranspositionTable(buffer=buffer)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            gs, maxDepth, maxNodes = task
+            finder = SmartMoveFinder.MoveFinder(None, maxDepth, maxNodes, tt)
+            #half the helpers run one ply ahead so the workers spread over neighbouring depths
+            finder.startDepth = 1 + index % 2
+            searching = threading.Thread(target=finder.search, args=(gs,), daemon=True)
+            searching.start()
+            #polled rather than waited on: a process killed inside Event.wait() leaves set() blocked for good
+            while not stopEvent.is_set():
+                time.sleep(SmartMoveFinder.STOP_POLL)
+            SmartMoveFinder.stopThread(finder, searching)
+            move = finder.pvMove
+            results.put((index, TT.encodeMove(move), finder.depth, finder.score, finder.nodes))
+    finally:
+        tt.release()
+        buffer.release()
+        shm.close()
+
+
+class ParallelSearch():
+    '''
+    Runs workers - 1 helper processes next to the caller's own search. All of them read and write one
+    transposition table in shared memory, so what one worker finds cuts the others' trees; helpers
+    never report a move on their own, only through the table, unless one finishes a deeper iteration
+    than the main search. The processes stay up between searches; call close() when done.
+    '''
+    def __init__(self, workers=None, sizeMB=TT.DEFAULT_SIZE_MB):
+        self.workers = max(1, workers or os.cpu_count())
+        self.tableSize = TT.tableBytes(sizeMB)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.tableSize)
+        self.buffer = self.shm.buf[:self.tableSize]
+        self.tt = TT.TranspositionTable(buffer=self.buffer)
+        self.tt.clear()
+        self.stopEvent = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        self.tasks = []
+        self.processes = []
+        for index in range(1, self.workers):
+            tasks = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_helperLoop, daemon=True,
+                                              args=(index, self.shm.name, self.tableSize, tasks, self.results,
+                                                    self.stopEvent))
+            process.start()
+            self.tasks.append(tasks)
+            self.processes.append(process)
+        self.workerNodes = [0] * self.workers
+        self.nodes = 0
+
+    '''
+    Searches gs with finder, a MoveFinder using self.tt, while the helpers search copies of gs;
+    finder.stop() or its own limits end the whole search. Per-worker node counts are left in workerNodes.
+    A helper process that has died is not waited for; without any helper the main search's move is returned.
+    '''
+    def search(self, gs, finder, validMoves=None):
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        self.stopEvent.clear()
+        #the queues pickle in a background thread, so they get a copy that the search below does not touch
+        snapshot = copy.deepcopy(gs)
+        waiting = {}
+        for index, (tasks, process) in enumerate(zip(self.tasks, self.processes), 1):
+            if process.is_alive():
+                tasks.put((snapshot, finder.maxDepth, finder.maxNodes))
+                waiting[index] = process
+        try:
+            bestMove = finder.search(gs, validMoves)
+        finally:
+            self.stopEvent.set()
+        bestDepth = finder.depth
+        self.workerNodes = [0] * self.workers
+        self.workerNodes[0] = finder.nodes
+        while waiting:
+            try:
+                index, moveCode, depth, score, nodes = self.results.get(timeout=RESULT_POLL)
+            except queue.Empty:
+                for index, process in list(waiting.items()):
+                    if process.exitcode is not None:
+                        del waiting[index]
+                continue
+            waiting.pop(index, None)
+            self.workerNodes[index] = nodes
+            if depth > bestDepth and moveCode:
+                helperMove = TT.decodeMove(moveCode, gs.board)
+                for move in validMoves:
+                    if move == helperMove:
+                        bestMove, bestDepth = move, depth
+                        finder.depth, finder.score = depth, score
+        self.nodes = sum(self.workerNodes)
+        return bestMove
+
+    def close(self):
+        for tasks, process in zip(self.tasks, self.processes):
+            if process.is_alive():
+                tasks.put(None)
+        for process in self.processes:
+            process.join()
+        self.tt.release()
+        self.buffer.release()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time a Lazy SMP search and show the nodes each worker searched")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--fen", default=ChessEngine.START_FEN)
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--time", type=float, help="seconds to search instead of a fixed depth")
+    parser.add_argument("--hash", type=int, default=TT.DEFAULT_SIZE_MB, help="table size in MB")
+    args = parser.parse_args(argv)
+
+    with ParallelSearch(args.workers, args.hash) as smp:
+        gs = ChessEngine.GameState(args.fen)
+        finder = SmartMoveFinder.MoveFinder(args.time, args.depth if args.time is None else SmartMoveFinder.MAX_DEPTH,
+                                            tt=smp.tt)
+        start = time.perf_counter()
+        move = smp.search(gs, finder)
+        elapsed = time.perf_counter() - start
+        for index, nodes in enumerate(smp.workerNodes):
+            print("worker %d: %d nodes, %.0f nps" % (index, nodes, nodes / elapsed if elapsed else 0))
+        print("bestmove %s depth %d score %d: %d nodes in %.2fs, %.0f nps"
+              % (move.getChessNotation() if move else "none", finder.depth, finder.score, smp.nodes, elapsed,
+                 smp.nodes / elapsed if elapsed else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
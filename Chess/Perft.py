@@ -0,0 +1,132 @@
+"""Perft node counting for checking and timing move generation; run with python -m Chess.Perft"""
+import argparse
+import sys
+import time
+from Chess import ChessEngine, BitboardEngine
+
+'''
+Standard perft positions with their published node counts per depth
+'''
+POSITIONS = {
+    "startpos": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                 (20, 400, 8902, 197281, 4865609)),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 (48, 2039, 97862, 4085603)),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  (14, 191, 2812, 43238, 674624)),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  (6, 264, 9467, 422333)),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  (44, 1486, 62379, 2103487)),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  (46, 2079, 89890)),
+    #not a published position; counts agreed by both GameStates. A pawn pinned along its file may push towards its king
+    "filepin": ("8/8/4K3/8/4P3/8/8/k3r3 w - - 0 1",
+                (9, 109, 822, 12516, 90262)),
+}
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+'''
+Node counts below each root move, the usual way to narrow down a move generation bug
+'''
+def divide(gs, depth):
+    results = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        results.append((move.getChessNotation(), perft(gs, depth - 1)))
+        gs.undoMove()
+    return results
+
+
+def newGameState(bitboard, fen=ChessEngine.START_FEN):
+    return BitboardEngine.BitboardGameState(fen) if bitboard else ChessEngine.GameState(fen)
+
+
+'''
+Root moves whose divide counts differ between GameState and BitboardGameState, as
+(move, GameState nodes, BitboardGameState nodes) with None for a move only one of them generates
+'''
+def compare(fen, depth):
+    plain = dict(divide(newGameState(False, fen), depth))
+    bitboard = dict(divide(newGameState(True, fen), depth))
+    return [(move, plain.get(move), bitboard.get(move)) for move in sorted(set(plain) | set(bitboard))
+            if plain.get(move) != bitboard.get(move)]
+
+
+def runSuite(depth, names=None, bitboard=False, out=sys.stdout):
+    failures = 0
+    totalNodes = 0
+    totalTime = 0.0
+    for name in names or POSITIONS:
+        fen, expected = POSITIONS[name]
+        gs = newGameState(bitboard, fen)
+        for d in range(1, min(depth, len(expected)) + 1):
+            start = time.perf_counter()
+            nodes = perft(gs, d)
+            elapsed = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            status = "ok" if nodes == expected[d - 1] else "FAIL expected %d" % expected[d - 1]
+            if nodes != expected[d - 1]:
+                failures += 1
+            out.write("%-10s depth %d %10d nodes %8.2fs %10.0f nps  %s\n"
+                      % (name, d, nodes, elapsed, nodes / elapsed if elapsed else 0, status))
+    out.write("total %d nodes in %.2fs, %.0f nps, %d failures\n"
+              % (totalNodes, totalTime, totalNodes / totalTime if totalTime else 0, failures))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts for GameState.getValidMoves")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--position", action="append", choices=sorted(POSITIONS),
+                        help="suite position to run, may be repeated (default: all)")
+    parser.add_argument("--fen", help="run a single FEN instead of the suite")
+    parser.add_argument("--divide", action="store_true", help="print node counts per root move")
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardEngine.BitboardGameState")
+    parser.add_argument("--compare", action="store_true",
+                        help="check GameState against BitboardGameState move by move instead of counting")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        fens = [args.fen] if args.fen else [POSITIONS[name][0] for name in args.position or POSITIONS]
+        mismatches = 0
+        for fen in fens:
+            for move, plain, bitboard in compare(fen, args.depth):
+                print("%s %s: GameState %s BitboardGameState %s" % (fen, move, plain, bitboard))
+                mismatches += 1
+        print("%d mismatches" % mismatches)
+        return 1 if mismatches else 0
+
+    if args.fen or args.divide:
+        fen = args.fen or POSITIONS[(args.position or ["startpos"])[0]][0]
+        gs = newGameState(args.bitboard, fen)
+        start = time.perf_counter()
+        if args.divide:
+            nodes = 0
+            for notation, count in divide(gs, args.depth):
+                print("%s: %d" % (notation, count))
+                nodes += count
+        else:
+            nodes = perft(gs, args.depth)
+        elapsed = time.perf_counter() - start
+        print("nodes %d time %.2fs nps %.0f" % (nodes, elapsed, nodes / elapsed if elapsed else 0))
+        return 0
+    return 1 if runSuite(args.depth, args.position, args.bitboard) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""Streaming PGN reader, SAN parsing/export and bulk replay; run with python -m Chess.Pgn"""
+import argparse
+import bz2
+import collections
+import gzip
+import lzma
+import multiprocessing
+import os
+import re
+import sys
+import time
+from Chess import ChessEngine, BitboardEngine
+
+HEADER_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+SAN_RE = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+_COMMENT_RE = re.compile(r"\{[^}]*\}|;[^\n]*")
+#NAGs and move numbers, which may be written against the move as in 1.e4 or 12...Nf6
+_NOISE_RE = re.compile(r"\$\d+|\d+\.(?:\.\.)?")
+LINE_LENGTH = 80
+
+
+def openPgn(path):
+    if path == "-":
+        return sys.stdin
+    opener = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}.get(os.path.splitext(path)[1], open)
+    return opener(path, "rt", encoding="utf-8", errors="replace")
+
+'''
+Yields (headers, movetext) for each game in stream, one game in memory at a time.
+A game ends at the next tag section or at a blank line after its movetext.
+'''
+def readGames(stream):
+    headers = {}
+    moveLines = []
+    for line in stream:
+        line = line.strip()
+        if line.startswith("["):
+            if moveLines:
+                yield headers, " ".join(moveLines)
+                headers, moveLines = {}, []
+            match = HEADER_RE.match(line)
+            if match:
+                headers[match.group(1)] = re.sub(r"\\(.)", r"\1", match.group(2))
+        elif line.startswith("%"):
+            continue
+        elif line:
+            moveLines.append(line)
+        elif moveLines:
+            yield headers, " ".join(moveLines)
+            headers, moveLines = {}, []
+    if headers or moveLines:
+        yield headers, " ".join(moveLines)
+
+'''
+The SAN moves of the main line; comments, variations, NAGs, move numbers and the result are dropped
+'''
+def sanTokens(movetext):
+    text = _COMMENT_RE.sub(" ", movetext)
+    if "(" in text:
+        mainLine = []
+        depth = 0
+        for ch in text:
+            if ch == "(":
+                depth += 1
+            elif ch == ")" and depth:
+                depth -= 1
+            elif depth == 0:
+                mainLine.append(ch)
+        text = "".join(mainLine)
+    return [token for token in _NOISE_RE.sub(" ", text).split() if token not in RESULTS]
+
+'''
+Finds the legal move written as san in gs; raises ValueError if there is none or more than one
+'''
+def parseSan(gs, san, validMoves=None):
+    if validMoves is None:
+        validMoves = gs.getValidMoves()
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        kingSide = len(text) == 3
+        for move in validMoves:
+            if move.isCastleMove and (move.endCol > move.startCol) == kingSide:
+                return move
+        raise ValueError("illegal castling %r" % san)
+    match = SAN_RE.match(text)
+    if match is None:
+        raise ValueError("unreadable move %r" % san)
+    piece, fromFile, fromRank, target, promotion = match.groups()
+    piece = piece or "P"
+    endRow, endCol = ChessEngine.Move.ranksToRows[target[1]], ChessEngine.Move.filesToCols[target[0]]
+    found = None
+    for move in validMoves:
+        if move.endRow != endRow or move.endCol != endCol or move.pieceMoved[1] != piece:
+            continue
+        if fromFile is not None and move.startCol != ChessEngine.Move.filesToCols[fromFile]:
+            continue
+        if fromRank is not None and move.startRow != ChessEngine.Move.ranksToRows[fromRank]:
+            continue
+        if move.isPawnPromotion and move.promotionChoice != (promotion or "Q"):
+            continue
+        if found is not None:
+            raise ValueError("ambiguous move %r" % san)
+        found = move
+    if found is None:
+        raise ValueError("illegal move %r" % san)
+    return found
+
+'''
+Standard algebraic notation of a legal move in gs, with the check or mate suffix
+'''
+def moveToSan(gs, move, validMoves=None):
+    if move.isCastleMove:
+        san = "O-O" if move.endCol > move.startCol else "O-O-O"
+    else:
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        target = move.getRankFile(move.endRow, move.endCol)
+        capture = move.pieceCaptured != "--" or move.isEnpassantMove
+        piece = move.pieceMoved[1]
+        if piece == "P":
+            san = (ChessEngine.Move.colsToFiles[move.startCol] + "x" if capture else "") + target
+            if move.isPawnPromotion:
+                san += "=" + move.promotionChoice
+        else:
+            rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow
+                      and other.endCol == move.endCol and (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+            prefix = ""
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    prefix = ChessEngine.Move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    prefix = ChessEngine.Move.rowsToRanks[move.startRow]
+                else:
+                    prefix = move.getRankFile(move.startRow, move.startCol)
+            san = piece + prefix + ("x" if capture else "") + target
+    gs.makeMove(move)
+    replies = gs.getValidMoves()
+    if gs.inCheck:
+        san += "#" if len(replies) == 0 else "+"
+    gs.undoMove()
+    return san
+
+'''
+PGN text for the game played in gs. The moves are undone and replayed to write them, leaving gs as it was.
+'''
+def gameToPgn(gs, headers=None):
+    moves = list(gs.moveLog)
+    for _ in moves:
+        gs.undoMove()
+    tags = collections.OrderedDict((name, "?") for name in ("Event", "Site", "Date", "Round", "White", "Black"))
+    tags["Result"] = "*"
+    startFen = gs.getFen()
+    if startFen != ChessEngine.START_FEN:
+        tags["SetUp"] = "1"
+        tags["FEN"] = startFen
+    tags.update(headers or {})
+    tokens = []
+    for move in moves:
+        if gs.whiteToMove or not tokens:
+            tokens.append("%d.%s" % (gs.fullmoveNumber, "" if gs.whiteToMove else ".."))
+        tokens.append(moveToSan(gs, move))
+        gs.makeMove(move)
+    tokens.append(tags["Result"])
+    lines = ['[%s "%s"]' % (name, value.replace("\\", "\\\\").replace('"', '\\"')) for name, value in tags.items()]
+    lines.append("")
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+'''
+Plays the main line of a game on a new GameState (from its FEN tag if it has one) and returns it
+'''
+def replayGame(headers, movetext, bitboard=False):
+    fen = headers.get("FEN", ChessEngine.START_FEN)
+    gs = BitboardEngine.BitboardGameState(fen) if bitboard else ChessEngine.GameState(fen)
+    for san in sanTokens(movetext):
+        gs.makeMove(parseSan(gs, san))
+    return gs
+
+'''
+Worker side of ingest: replays a batch of games and returns (games, plies, errors)
+'''
+def replayBatch(task):
+    batch, bitboard = task
+    plies = 0
+    errors = []
+    for index, headers, movetext in batch:
+        try:
+            plies += len(replayGame(headers, movetext, bitboard).moveLog)
+        except ValueError as e:
+            errors.append((index, headers.get("White", "?") + " - " + headers.get("Black", "?"), str(e)))
+    return len(batch), plies, errors
+
+
+def _batches(games, batchSize, bitboard, limit):
+    batch = []
+    for index, (headers, movetext) in enumerate(games):
+        if limit is not None and index >= limit:
+            break
+        batch.append((index, headers, movetext))
+        if len(batch) == batchSize:
+            yield batch, bitboard
+            batch = []
+    if batch:
+        yield batch, bitboard
+
+'''
+Replays every game from the given PGN files. With more than one worker the games are sent to a
+process pool in batches, with at most two batches per worker in flight so memory stays bounded
+however large the archive. Returns a dict of totals and rates.
+'''
+def ingest(paths, workers=1, bitboard=False, batchSize=64, limit=None, onError=None, onProgress=None):
+    def games():
+        for path in paths:
+            stream = openPgn(path)
+            try:
+                for game in readGames(stream):
+                    yield game
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+
+    totals = {"games": 0, "plies": 0, "errors": 0}
+    start = time.perf_counter()
+
+    def collect(result):
+        count, plies, errors = result
+        totals["games"] += count
+        totals["plies"] += plies
+        totals["errors"] += len(errors)
+        if onError is not None:
+            for error in errors:
+                onError(*error)
+        if onProgress is not None:
+            onProgress(totals["games"], time.perf_counter() - start)
+
+    tasks = _batches(games(), batchSize, bitboard, limit)
+    if workers <= 1:
+        for task in tasks:
+            collect(replayBatch(task))
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            pending = collections.deque()
+            for task in tasks:
+                pending.append(pool.apply_async(replayBatch, (task,)))
+                if len(pending) >= workers * 2:
+                    collect(pending.popleft().get())
+            while pending:
+                collect(pending.popleft().get())
+    elapsed = time.perf_counter() - start
+    totals["seconds"] = elapsed
+    totals["gamesPerSecond"] = totals["games"] / elapsed if elapsed else 0.0
+    totals["pliesPerSecond"] = totals["plies"] / elapsed if elapsed else 0.0
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay PGN archives through the move generator")
+    parser.add_argument("paths", nargs="+", help="PGN files, optionally .gz/.bz2/.xz compressed; - for stdin")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=64, help="games sent to a worker at a time")
+    parser.add_argument("--limit", type=int, help="stop after this many games")
+    parser.add_argument("--bitboard", action="store_true", help="use BitboardEngine.BitboardGameState")
+    parser.add_argument("--quiet", action="store_true", help="do not list games that fail to replay")
+    args = parser.parse_args(argv)
+
+    def report(index, players, message):
+        if not args.quiet:
+            print("game %d (%s): %s" % (index + 1, players, message))
+
+    totals = ingest(args.paths, args.workers, args.bitboard, args.batch_size, args.limit, report)
+    print("%d games, %d plies, %d errors in %.2fs: %.1f games/s, %.0f plies/s"
+          % (totals["games"], totals["plies"], totals["errors"], totals["seconds"],
+             totals["gamesPerSecond"], totals["pliesPerSecond"]))
+    return 1 if totals["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Counters and optional timers for one search, with a UCI info line and a JSON trace"""
+import json
+import time
+
+TIMERS = ("movegen", "eval", "pins")
+
+
+class SearchStats():
+    '''
+    Filled in by MoveFinder during a search. The counters are always kept since they cost one
+    addition per event. The timers (seconds in move generation, evaluation and checkForPinsAndChecks)
+    are only kept inside timing(), which swaps timed wrappers onto the GameState and the finder for the
+    length of the search, so a search that is not profiled runs the unwrapped methods.
+    movegen includes the checkForPinsAndChecks call that starts every move generation.
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.qnodes = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.ttCutoffs = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.tbHits = 0
+        self.iterations = [] #(depth, nodes, seconds, score) after each completed depth
+        self.times = dict.fromkeys(TIMERS, 0.0)
+        self.calls = dict.fromkeys(TIMERS, 0)
+        self.profiled = False
+
+    def endIteration(self, depth, nodes, seconds, score):
+        self.iterations.append((depth, nodes, seconds, score))
+
+    '''
+    Nodes of the last iteration over nodes of the one before, or None before two iterations are done
+    '''
+    def branchingFactor(self):
+        if len(self.iterations) < 2:
+            return None
+        nodes = [0] + [iteration[1] for iteration in self.iterations]
+        previous = nodes[-2] - nodes[-3]
+        return (nodes[-1] - nodes[-2]) / previous if previous else None
+
+    def _timed(self, name, method):
+        times, calls = self.times, self.calls
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times[name] += clock() - start
+                calls[name] += 1
+
+        return timed
+
+    def _timedGenerator(self, name, method):
+        times, calls = self.times, self.calls
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            moves = method(*args, **kwargs)
+            calls[name] += 1
+            while True:
+                start = clock()
+                try:
+                    move = next(moves)
+                except StopIteration:
+                    return
+                finally:
+                    times[name] += clock() - start
+                yield move
+
+        return timed
+
+    '''
+    Context manager timing gs's move generation and finder.evaluate until it exits
+    '''
+    def timing(self, gs, finder):
+        return _Timing(self, gs, finder)
+
+    '''
+    Plain dict of everything collected, for JSON output
+    '''
+    def toDict(self, nodes=None, seconds=None):
+        stats = {"qnodes": self.qnodes, "ttProbes": self.ttProbes, "ttHits": self.ttHits,
+                 "ttCutoffs": self.ttCutoffs, "betaCutoffs": self.betaCutoffs,
+                 "firstMoveCutoffs": self.firstMoveCutoffs, "tbHits": self.tbHits,
+                 "branchingFactor": self.branchingFactor(),
+                 "iterations": [{"depth": depth, "nodes": iterNodes, "time": round(iterSeconds, 4), "score": score}
+                                for depth, iterNodes, iterSeconds, score in self.iterations]}
+        if nodes is not None:
+            stats["nodes"] = nodes
+        if seconds is not None:
+            stats["time"] = round(seconds, 4)
+        if self.profiled:
+            stats["times"] = {name: round(self.times[name], 4) for name in TIMERS}
+            stats["calls"] = dict(self.calls)
+        return stats
+
+    '''
+    Text for a UCI "info string" line
+    '''
+    def infoString(self, nodes, seconds):
+        branching = self.branchingFactor()
+        text = "stats qnodes %d tthits %d ttcutoffs %d cutoffs %d firstmove %.1f%% ebf %s" % (
+            self.qnodes, self.ttHits, self.ttCutoffs, self.betaCutoffs,
+            100.0 * self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0,
+            "%.2f" % branching if branching is not None else "-")
+        if self.tbHits:
+            text += " tbhits %d" % self.tbHits
+        if self.profiled and seconds:
+            text += "".join(" %s %.1f%%" % (name, 100.0 * self.times[name] / seconds) for name in TIMERS)
+        return text
+
+    '''
+    Appends one JSON line describing the search to the file at path
+    '''
+    def writeTrace(self, path, fen, move, nodes, seconds):
+        record = {"fen": fen, "bestmove": move, "stats": self.toDict(nodes, seconds)}
+        with open(path, "a") as out:
+            out.write(json.dumps(record) + "\n")
+
+
+class _Timing():
+    def __init__(self, stats, gs, finder):
+        self.stats = stats
+        self.gs = gs
+        self.finder = finder
+
+    def __enter__(self):
+        stats, gs = self.stats, self.gs
+        stats.profiled = True
+        gs.checkForPinsAndChecks = stats._timed("pins", gs.checkForPinsAndChecks)
+        gs.getValidMoves = stats._timed("movegen", gs.getValidMoves)
+        gs.generateMovesStaged = stats._timedGenerator("movegen", gs.generateMovesStaged)
+        self.finder.evaluate = stats._timed("eval", self.finder.evaluate)
+        return stats
+
+    def __exit__(self, *exc):
+        for name in ("checkForPinsAndChecks", "getValidMoves", "generateMovesStaged"):
+            del self.gs.__dict__[name]
+        del self.finder.__dict__["evaluate"]
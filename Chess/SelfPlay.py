@@ -0,0 +1,214 @@
+"""Headless engine vs engine matches over a process pool; run with python -m Chess.SelfPlay"""
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from Chess import ChessEngine, SmartMoveFinder, TranspositionTable, OpeningBook
+
+MAX_PLIES = 300 #games still running after this many plies are adjudicated a draw
+
+'''
+Engine settings are written as comma separated key=value pairs, e.g. "maxDepth=3,hashMB=8".
+Keys are MoveFinder arguments plus hashMB; timeLimit is replaced by the clock when a time control is set.
+An engine given no timeLimit, maxNodes or maxDepth below MAX_DEPTH searches DEFAULT_TIME_LIMIT seconds
+a move, since a search with no limit at all would never return.
+'''
+def parseEngine(spec):
+    engine = {"timeLimit": None, "maxDepth": SmartMoveFinder.MAX_DEPTH, "maxNodes": None, "hashMB": 16}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, value = item.split("=")
+        if name not in engine:
+            raise ValueError("unknown engine setting %r" % name)
+        engine[name] = float(value) if name == "timeLimit" else int(value)
+    if engine["timeLimit"] is None and engine["maxNodes"] is None and engine["maxDepth"] >= SmartMoveFinder.MAX_DEPTH:
+        engine["timeLimit"] = SmartMoveFinder.DEFAULT_TIME_LIMIT
+    return engine
+
+'''
+"base+increment" in seconds, e.g. "10+0.1"
+'''
+def parseTimeControl(text):
+    if not text:
+        return None
+    base, _, increment = text.partition("+")
+    return float(base), float(increment or 0)
+
+
+def insufficientMaterial(gs):
+    minors = 0
+    for row in gs.board:
+        for square in row:
+            if square[1] in "PRQ":
+                return False
+            if square[1] in "NB":
+                minors += 1
+    return minors <= 1
+
+'''
+None while the rules let the game go on, otherwise (result, reason) with result "1-0", "0-1" or "1/2-1/2":
+checkmate, stalemate, threefold repetition, the fifty move rule or insufficient material
+'''
+def rulesResult(gs, validMoves):
+    if len(validMoves) == 0:
+        if gs.inCheck:
+            return ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if gs.repetitionCount() >= 3:
+        return "1/2-1/2", "repetition"
+    if gs.halfmoveClock >= 100:
+        return "1/2-1/2", "fifty moves"
+    if insufficientMaterial(gs):
+        return "1/2-1/2", "insufficient material"
+    return None
+
+'''
+rulesResult, with games still going after MAX_PLIES plies adjudicated a draw
+'''
+def gameResult(gs, validMoves):
+    result = rulesResult(gs, validMoves)
+    if result is None and len(gs.moveLog) >= MAX_PLIES:
+        return "1/2-1/2", "adjudicated"
+    return result
+
+'''
+Plays one game in a worker. Each side gets its own transposition table and, with a time control,
+its own clock; the move budget is a slice of the remaining time plus the increment.
+'''
+def playGame(task):
+    gameIndex, seed, engineA, engineB, aIsWhite, openingPlies, timeControl, bookPath = task
+    rng = random.Random(seed)
+    book = OpeningBook.OpeningBook(bookPath) if bookPath else None
+    gs = ChessEngine.GameState()
+    engines = {True: engineA if aIsWhite else engineB, False: engineB if aIsWhite else engineA}
+    tables = {side: TranspositionTable.TranspositionTable(engine["hashMB"]) for side, engine in engines.items()}
+    clocks = {True: timeControl[0], False: timeControl[0]} if timeControl else None
+    nodes = {True: 0, False: 0}
+    searchTime = {True: 0.0, False: 0.0}
+    moves = []
+    result = None
+
+    validMoves = gs.getValidMoves()
+    for _ in range(openingPlies):
+        if not validMoves:
+            break
+        move = rng.choice(validMoves)
+        gs.makeMove(move)
+        moves.append(move.getChessNotation())
+        validMoves = gs.getValidMoves()
+
+    while result is None:
+        result = gameResult(gs, validMoves)
+        if result is not None:
+            break
+        side = gs.whiteToMove
+        engine = engines[side]
+        timeLimit = engine["timeLimit"]
+        if clocks is not None:
+            timeLimit = max(0.01, clocks[side] / 30 + timeControl[1] * 0.8)
+        finder = SmartMoveFinder.MoveFinder(timeLimit, engine["maxDepth"], engine["maxNodes"], tables[side], book)
+        start = time.perf_counter()
+        move = finder.search(gs, validMoves)
+        elapsed = time.perf_counter() - start
+        nodes[side] += finder.nodes
+        searchTime[side] += elapsed
+        if clocks is not None:
+            clocks[side] -= elapsed
+            if clocks[side] < 0:
+                result = ("0-1" if side else "1-0"), "time forfeit"
+                break
+            clocks[side] += timeControl[1]
+        gs.makeMove(move)
+        moves.append(move.getChessNotation())
+        validMoves = gs.getValidMoves()
+
+    if book is not None:
+        book.close()
+    scoreA = {"1-0": 1.0, "0-1": 0.0}.get(result[0], 0.5)
+    if not aIsWhite:
+        scoreA = 1.0 - scoreA
+    return {"game": gameIndex, "aIsWhite": aIsWhite, "result": result[0], "reason": result[1], "scoreA": scoreA,
+            "plies": len(gs.moveLog), "moves": moves,
+            "nodesA": nodes[aIsWhite], "timeA": searchTime[aIsWhite],
+            "nodesB": nodes[not aIsWhite], "timeB": searchTime[not aIsWhite]}
+
+'''
+Elo difference for a score fraction, with an approximate 95% margin from the per-game score variance
+'''
+def eloEstimate(results):
+    n = len(results)
+    if n == 0:
+        return 0.0, 0.0
+    score = sum(r["scoreA"] for r in results) / n
+    variance = sum((r["scoreA"] - score) ** 2 for r in results) / n
+
+    def elo(p):
+        p = min(max(p, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / p - 1)
+
+    margin = 1.96 * math.sqrt(variance / n)
+    return elo(score) + 0.0, (elo(score + margin) - elo(score - margin)) / 2
+
+
+def summarize(results):
+    wins = sum(1 for r in results if r["scoreA"] == 1.0)
+    losses = sum(1 for r in results if r["scoreA"] == 0.0)
+    draws = len(results) - wins - losses
+    elo, margin = eloEstimate(results)
+    nodesA = sum(r["nodesA"] for r in results)
+    nodesB = sum(r["nodesB"] for r in results)
+    timeA = sum(r["timeA"] for r in results)
+    timeB = sum(r["timeB"] for r in results)
+    return {"games": len(results), "wins": wins, "draws": draws, "losses": losses,
+            "elo": elo, "eloMargin": margin,
+            "npsA": nodesA / timeA if timeA else 0.0, "npsB": nodesB / timeB if timeB else 0.0}
+
+'''
+Plays games engine A vs engine B. Games come in pairs sharing a random opening with colours swapped.
+Returns the per-game results (in completion order) and their summary.
+'''
+def runMatch(games, engineA, engineB, workers=None, openingPlies=4, timeControl=None, seed=None, onResult=None,
+             bookPath=None):
+    seed = random.randrange(1 << 30) if seed is None else seed
+    tasks = [(i, seed + i // 2, engineA, engineB, i % 2 == 0, openingPlies, timeControl, bookPath) for i in range(games)]
+    results = []
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        for result in pool.imap_unordered(playGame, tasks):
+            results.append(result)
+            if onResult is not None:
+                onResult(result)
+    return results, summarize(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Engine vs engine match runner")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--engine-a", default="maxDepth=2", help="key=value settings, e.g. maxDepth=3,hashMB=8")
+    parser.add_argument("--engine-b", default="maxDepth=2")
+    parser.add_argument("--tc", help="time control base+increment in seconds, e.g. 10+0.1")
+    parser.add_argument("--opening-plies", type=int, default=4, help="random plies played before the engines start")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--book", help="opening book both engines play from while in book")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    def report(result):
+        if not args.quiet:
+            print("game %d: %s %s (%s, %d plies)" % (result["game"], "A-B" if result["aIsWhite"] else "B-A",
+                                                     result["result"], result["reason"], result["plies"]))
+            sys.stdout.flush()
+
+    start = time.perf_counter()
+    results, summary = runMatch(args.games, parseEngine(args.engine_a), parseEngine(args.engine_b), args.workers,
+                                args.opening_plies, parseTimeControl(args.tc), args.seed, report, args.book)
+    print("A vs B: +%d =%d -%d  Elo %+.0f +/- %.0f  A %.0f nps  B %.0f nps  (%.1fs)"
+          % (summary["wins"], summary["draws"], summary["losses"], summary["elo"], summary["eloMargin"],
+             summary["npsA"], summary["npsB"], time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,430 @@
+import copy
+import os
+import queue
 import random
+import threading
+import time
+from Chess import TranspositionTable as TT, Evaluation
+from Chess.SearchStats import SearchStats
+from Chess.OpeningBook import OpeningBook
+from Chess.Tablebase import Tablebases
 
+pieceScore = {"K": 0, "Q": 900, "R": 500, "B": 330, "N": 320, "P": 100}
+CHECKMATE = 100000
+STALEMATE = 0
+MAX_DEPTH = 64
+MATE_BOUND = CHECKMATE - MAX_DEPTH #scores past this are mates within the search's ply budget
+#tablebase mates longer than that budget score between here and MATE_BOUND (a table value is at most 127 plies)
+TABLEBASE_BOUND = MATE_BOUND - MAX_DEPTH - 128
+DEFAULT_TIME_LIMIT = 1.0 #seconds
+CHECK_EVERY = 256 #nodes between clock checks
+STOP_POLL = 0.01 #seconds between stop() calls in stopThread
+HASH_SIZE_MB = TT.DEFAULT_SIZE_MB
+BOOK_FILE = "book.bin" #used by findBestMove when it exists
+TABLEBASE_DIR = "tablebases" #likewise
+
+_sharedTable = None
+_sharedBook = None
+_sharedTablebases = None
 
 
 def findRandomMove(validMoves):
-    return validMoves[random.randint(0, len(validMoves) - 1)]
\ No newline at end of file
+    return validMoves[random.randint(0, len(validMoves) - 1)]
+
+'''
+Material balance from the point of view of the side to move
+'''
+def scoreMaterial(gs):
+    score = 0
+    for row in gs.board:
+        for square in row:
+            if square[0] == "w":
+                score += pieceScore[square[1]]
+            elif square[0] == "b":
+                score -= pieceScore[square[1]]
+    return score if gs.whiteToMove else -score
+
+'''
+Table kept between calls so the AI reuses what it learned on earlier moves
+'''
+def getSharedTable():
+    global _sharedTable
+    if _sharedTable is None:
+        _sharedTable = TT.TranspositionTable(HASH_SIZE_MB)
+    return _sharedTable
+
+
+'''
+BOOK_FILE opened once, or None if there is no book
+'''
+def getSharedBook():
+    global _sharedBook
+    if _sharedBook is None and BOOK_FILE and os.path.exists(BOOK_FILE):
+        _sharedBook = OpeningBook(BOOK_FILE)
+    return _sharedBook
+
+'''
+Tablebases in TABLEBASE_DIR, or None if the directory does not exist
+'''
+def getSharedTablebases():
+    global _sharedTablebases
+    if _sharedTablebases is None and TABLEBASE_DIR and os.path.isdir(TABLEBASE_DIR):
+        _sharedTablebases = Tablebases(TABLEBASE_DIR)
+    return _sharedTablebases
+
+
+'''
+Stops the search finder is running on thread and waits for it to end. stop() is repeated until the
+thread is done because a search clears earlier stop requests when it starts, so one stop() landing
+before the thread reaches search() would be lost.
+'''
+def stopThread(finder, thread):
+    while thread.is_alive():
+        finder.stop()
+        thread.join(STOP_POLL)
+
+
+def findBestMove(gs, validMoves, timeLimit=DEFAULT_TIME_LIMIT, maxDepth=MAX_DEPTH, maxNodes=None):
+    return MoveFinder(timeLimit, maxDepth, maxNodes, getSharedTable(), getSharedBook(),
+                      tablebases=getSharedTablebases()).search(gs, validMoves)
+
+'''
+Mate scores, tablebase ones included, are stored relative to the node so they stay valid when reached
+at a different ply; a long mate read back further from the root is clamped to TABLEBASE_BOUND
+'''
+def scoreToTable(score, ply):
+    if score >= TABLEBASE_BOUND:
+        return score + ply
+    if score <= -TABLEBASE_BOUND:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= TABLEBASE_BOUND:
+        return max(TABLEBASE_BOUND, score - ply)
+    if score <= -TABLEBASE_BOUND:
+        return min(-TABLEBASE_BOUND, score + ply)
+    return score
+
+'''
+Score for a tablebase value (plies to mate, see Chess.Tablebase) found ply plies from the root.
+Mates too long for the mate score range still outscore any evaluation and keep their order,
+scoring CHECKMATE - MAX_DEPTH - distance down to TABLEBASE_BOUND.
+'''
+def tablebaseScore(value, ply):
+    if value == 0:
+        return STALEMATE
+    distance = ply + (value if value > 0 else -value - 1)
+    score = CHECKMATE - distance if distance < MAX_DEPTH else max(TABLEBASE_BOUND, MATE_BOUND - distance)
+    return score if value > 0 else -score
+
+
+class MoveFinder():
+    '''
+    Iterative deepening negamax with alpha-beta pruning and quiescence search, driven by
+    makeMove/undoMove on the GameState it is given. Stops on timeLimit (seconds) or maxNodes,
+    whichever comes first, and returns the best move of the last completed iteration.
+    Positions are cached by gs.zobristKey in tt, a fresh table if none is given.
+    While the position is in book (an OpeningBook) a weighted book move is played without searching.
+    Pawn structure scores are cached in pawnTable, Evaluation.sharedPawnTable if none is given.
+    Positions covered by tablebases (a Chess.Tablebase.Tablebases) are scored exactly without searching.
+    stop() may be called from another thread to end the current search early; it does not carry over
+    to the next search.
+    onIteration, if set, is called as onIteration(finder, gs) after every completed depth.
+    Counters for the last search are kept in stats (a SearchStats). Setting profile also times move
+    generation and evaluation, and setting tracePath appends a JSON line per search to that file.
+    '''
+    def __init__(self, timeLimit=DEFAULT_TIME_LIMIT, maxDepth=MAX_DEPTH, maxNodes=None, tt=None, book=None,
+                 pawnTable=None, tablebases=None):
+        self.tt = tt if tt is not None else TT.TranspositionTable(HASH_SIZE_MB)
+        self.book = book
+        self.tablebases = tablebases
+        self.pawnTable = pawnTable if pawnTable is not None else Evaluation.sharedPawnTable
+        self.timeLimit = timeLimit
+        self.maxDepth = maxDepth
+        self.maxNodes = maxNodes
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        self.stopped = False
+        self.stopRequested = False
+        self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+        self.history = {}
+        self.pvMove = None
+        self.onIteration = None
+        self.startDepth = 1
+        self.stats = SearchStats()
+        self.profile = False
+        self.tracePath = None
+        self.clockLock = threading.Lock()
+
+    def search(self, gs, validMoves=None):
+        self.stopRequested = False #a stop() aimed at an earlier search must not end this one
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        if len(validMoves) == 0:
+            return None
+        if self.book is not None:
+            bookMove = self.book.pickMove(gs, validMoves)
+            if bookMove is not None:
+                return bookMove
+        with self.clockLock:
+            self.startTime = time.perf_counter()
+            self.deadline = None if self.timeLimit is None else self.startTime + self.timeLimit
+        self.nodes = 0
+        self.stopped = False
+        self.stats.reset()
+        self.tt.newSearch()
+        if self.profile:
+            with self.stats.timing(gs, self):
+                bestMove = self.deepen(gs, validMoves)
+        else:
+            bestMove = self.deepen(gs, validMoves)
+        if self.tracePath is not None:
+            self.stats.writeTrace(self.tracePath, gs.getFen(), bestMove.getChessNotation(), self.nodes, self.elapsed())
+        return bestMove
+
+    def deepen(self, gs, validMoves):
+        bestMove = validMoves[0]
+        for depth in range(self.startDepth, self.maxDepth + 1):
+            score, move = self.searchRoot(gs, validMoves, depth)
+            if self.stopped:
+                break
+            bestMove = move
+            self.pvMove = move
+            self.depth = depth
+            self.score = score
+            self.stats.endIteration(depth, self.nodes, self.elapsed(), score)
+            if self.onIteration is not None:
+                self.onIteration(self, gs)
+            if abs(score) >= MATE_BOUND or len(validMoves) == 1:
+                break
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                break
+        return bestMove
+
+    def searchRoot(self, gs, validMoves, depth):
+        alpha, beta = -CHECKMATE - 1, CHECKMATE + 1
+        bestMove = None
+        for move in self.orderMoves(validMoves, 0, self.pvMove):
+            gs.makeMove(move)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, 1)
+            gs.undoMove()
+            if self.stopped:
+                break
+            if score > alpha or bestMove is None:
+                alpha = score
+                bestMove = move
+        if not self.stopped:
+            self.tt.store(gs.zobristKey, depth, scoreToTable(alpha, 0), TT.EXACT, TT.encodeMove(bestMove))
+        return alpha, bestMove
+
+    def negamax(self, gs, depth, alpha, beta, ply):
+        if self.tablebases is not None:
+            value = self.tablebases.probe(gs)
+            if value is not None:
+                self.nodes += 1
+                self.stats.tbHits += 1
+                return tablebaseScore(value, ply)
+        if depth <= 0:
+            return self.quiescence(gs, alpha, beta, ply)
+        if self.checkLimits():
+            return 0
+        key = gs.zobristKey
+        hashMoveCode = 0
+        stats = self.stats
+        stats.ttProbes += 1
+        entry = self.tt.probe(key)
+        if entry is not None:
+            stats.ttHits += 1
+            entryDepth, entryScore, bound, hashMoveCode = entry
+            if entryDepth >= depth:
+                entryScore = scoreFromTable(entryScore, ply)
+                if bound == TT.EXACT or (bound == TT.LOWER_BOUND and entryScore >= beta) \
+                        or (bound == TT.UPPER_BOUND and entryScore <= alpha):
+                    stats.ttCutoffs += 1
+                    return entryScore
+        alphaOrig = alpha
+        moveCount = 0
+        bestScore = -CHECKMATE - 1
+        bestMove = None
+        hashMove = TT.decodeMove(hashMoveCode, gs.board)
+        killers = tuple(self.killers[ply]) if ply <= MAX_DEPTH else ()
+        for move in gs.generateMovesStaged(hashMove, orderKey=self.moveOrderKey(ply), killers=killers):
+            moveCount += 1
+            gs.makeMove(move)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                stats.betaCutoffs += 1
+                if moveCount == 1:
+                    stats.firstMoveCutoffs += 1
+                if move.pieceCaptured == "--":
+                    self.storeKiller(move, ply)
+                    historyKey = (move.pieceMoved, move.endRow, move.endCol)
+                    self.history[historyKey] = self.history.get(historyKey, 0) + depth * depth
+                break
+        if bestMove is None:
+            return -CHECKMATE + ply if gs.inCheck else STALEMATE
+        if bestScore >= beta:
+            bound = TT.LOWER_BOUND
+        elif bestScore <= alphaOrig:
+            bound = TT.UPPER_BOUND
+        else:
+            bound = TT.EXACT
+        self.tt.store(key, depth, scoreToTable(bestScore, ply), bound,
+                      TT.encodeMove(bestMove) if bound != TT.UPPER_BOUND else 0)
+        return bestScore
+
+    '''
+    Only captures and promotions are searched past the horizon so the leaf score is not taken mid-exchange
+    '''
+    def quiescence(self, gs, alpha, beta, ply):
+        if self.checkLimits():
+            return 0
+        self.stats.qnodes += 1
+        standPat = self.evaluate(gs, alpha, beta)
+        if standPat >= beta or ply >= MAX_DEPTH:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+        for move in gs.generateMovesStaged(capturesOnly=True, orderKey=mvvLva):
+            gs.makeMove(move)
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def evaluate(self, gs, alpha, beta):
+        return Evaluation.evaluate(gs, alpha, beta, self.pawnTable)
+
+    def elapsed(self):
+        return time.perf_counter() - self.startTime
+
+    '''
+    Best line found so far, read back from the transposition table starting at gs
+    '''
+    def principalVariation(self, gs, maxLength=MAX_DEPTH):
+        pv = []
+        seen = set()
+        while len(pv) < maxLength and gs.zobristKey not in seen:
+            seen.add(gs.zobristKey)
+            entry = self.tt.probe(gs.zobristKey)
+            if entry is None or entry[3] == 0:
+                break
+            hashMove = TT.decodeMove(entry[3], gs.board)
+            move = next(gs.generateMovesStaged(hashMove), None)
+            if move is None or move != hashMove:
+                break
+            pv.append(move)
+            gs.makeMove(move)
+        for _ in pv:
+            gs.undoMove()
+        return pv
+
+    def stop(self):
+        self.stopRequested = True
+
+    '''
+    Gives a search started without a time limit timeLimit seconds from now; may be called from another thread
+    '''
+    def ponderhit(self, timeLimit):
+        with self.clockLock:
+            self.timeLimit = timeLimit
+            self.deadline = time.perf_counter() + timeLimit
+
+    def checkLimits(self):
+        self.nodes += 1
+        if self.stopRequested:
+            self.stopped = True
+        if self.nodes % CHECK_EVERY == 0:
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                self.stopped = True
+        if self.maxNodes is not None and self.nodes >= self.maxNodes:
+            self.stopped = True
+        return self.stopped
+
+    def storeKiller(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    '''
+    Captures by MVV-LVA, then killers, then quiet moves by history score
+    '''
+    def moveOrderKey(self, ply):
+        killers = self.killers[ply] if ply <= MAX_DEPTH else (None, None)
+
+        def moveOrder(move):
+            if move.pieceCaptured != "--" or move.isPawnPromotion:
+                return 2000000 + mvvLva(move)
+            if move == killers[0]:
+                return 1000002
+            if move == killers[1]:
+                return 1000001
+            return self.history.get((move.pieceMoved, move.endRow, move.endCol), 0)
+
+        return moveOrder
+
+    '''
+    Full list ordering for the root: previous best move first, then as moveOrderKey
+    '''
+    def orderMoves(self, moves, ply, hashMove=None):
+        moveOrder = self.moveOrderKey(ply)
+        return sorted(moves, key=lambda move: 3000000 if hashMove is not None and move == hashMove else moveOrder(move),
+                      reverse=True)
+
+'''
+The reply finder expects to gs, its position after the move finder chose, read from the transposition table
+'''
+def predictReply(gs, finder):
+    pv = finder.principalVariation(gs, 1)
+    return pv[0] if pv else None
+
+
+class Ponder():
+    '''
+    Searches the position after the predicted reply on a background thread while the opponent thinks.
+    If the opponent plays it, hit() turns the ponder search into the real one, finishing timeLimit
+    seconds from then; otherwise stop() abandons it and the next search still finds its work in the
+    transposition table finder shares. finder must have no time limit.
+    '''
+    def __init__(self, gs, predicted, finder):
+        self.predicted = predicted
+        self.finder = finder
+        self.result = queue.Queue()
+        state = copy.deepcopy(gs)
+        state.makeMove(predicted)
+        self.thread = threading.Thread(target=lambda: self.result.put(finder.search(state)), daemon=True)
+        self.thread.start()
+
+    '''
+    Returns the finder and the queue its move will be put on
+    '''
+    def hit(self, timeLimit):
+        self.finder.ponderhit(timeLimit)
+        return self.finder, self.result
+
+    def stop(self):
+        stopThread(self.finder, self.thread)
+
+
+def mvvLva(move):
+    victim = pieceScore[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0
+    if move.isPawnPromotion:
+        victim += pieceScore["Q"]
+    return victim * 10 - pieceScore[move.pieceMoved[1]] // 10
@@ -0,0 +1,437 @@
+"""Distance-to-mate endgame tablebases built by retrograde analysis; run with python -m Chess.Tablebase"""
+import argparse
+import array
+import itertools
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from Chess import ChessEngine
+
+'''
+A table covers one material signature such as "KQvK" (white's pieces, then black's, strongest first)
+for both sides to move. Positions are indexed by arithmetic on the squares of the pieces in the order
+signaturePieces gives, so a probe is one byte read at a computed offset of the mapped file:
+
+    index = sideToMove * 64 ** n + sum(square[i] * 64 ** (n - 1 - i))
+
+with sideToMove 0 for white. Each byte is a signed distance to mate in plies: v > 0 means the side
+to move mates in v plies, v < 0 means it is mated in -v - 1 plies, 0 is a draw (or an impossible
+position). Positions with castling rights or an en passant square are not covered.
+'''
+MAGIC = b"PYTB"
+VERSION = 1
+HEADER = struct.Struct("<4sBB10s") #magic, version, piece count, signature
+MAX_PIECES = 4
+TABLE_DIR = "tablebases"
+PIECE_ORDER = "QRBNP" #strongest first
+PIECE_RANK = {piece: len(PIECE_ORDER) - i for i, piece in enumerate(PIECE_ORDER)}
+
+KING_STEPS = [[r * 8 + c for r, c in targets] for targets in ChessEngine.KING_TARGETS]
+KNIGHT_STEPS = [[r * 8 + c for r, c in targets] for targets in ChessEngine.KNIGHT_TARGETS]
+
+
+def _rays(directions):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        rays = []
+        for dRow, dCol in directions:
+            ray = []
+            endRow, endCol = row + dRow, col + dCol
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                ray.append(endRow * 8 + endCol)
+                endRow += dRow
+                endCol += dCol
+            rays.append(ray)
+        table.append(rays)
+    return table
+
+
+SLIDER_RAYS = {"R": _rays(ChessEngine.ROOK_DIRECTIONS), "B": _rays(ChessEngine.BISHOP_DIRECTIONS),
+               "Q": _rays(ChessEngine.ROOK_DIRECTIONS + ChessEngine.BISHOP_DIRECTIONS)}
+
+
+def _sideKey(pieces):
+    return len(pieces), sorted((PIECE_RANK[piece] for piece in pieces), reverse=True)
+
+
+def _sortPieces(pieces):
+    return "".join(sorted(pieces, key=PIECE_ORDER.index))
+
+'''
+Canonical signature for white's and black's non-king pieces, and whether colours had to be swapped
+to put the stronger side first
+'''
+def makeSignature(whitePieces, blackPieces):
+    flipped = _sideKey(whitePieces) < _sideKey(blackPieces)
+    if flipped:
+        whitePieces, blackPieces = blackPieces, whitePieces
+    return "K%svK%s" % (_sortPieces(whitePieces), _sortPieces(blackPieces)), flipped
+
+'''
+Pieces of a signature in index order: the two kings, then white's pieces, then black's
+'''
+def signaturePieces(signature):
+    white, black = signature.split("v")
+    return ["wK", "bK"] + ["w" + piece for piece in white[1:]] + ["b" + piece for piece in black[1:]]
+
+'''
+Every signature with three up to maxPieces pieces
+'''
+def allSignatures(maxPieces=MAX_PIECES):
+    signatures = set()
+    for count in range(1, maxPieces - 1):
+        for pieces in itertools.combinations_with_replacement(PIECE_ORDER, count):
+            for split in range(count + 1):
+                signatures.add(makeSignature(pieces[:split], pieces[split:])[0])
+    return sorted(signatures, key=lambda sig: (len(sig), sig.count("P"), sig))
+
+'''
+Signatures a table's captures and promotions lead into; KvK is left out as it is always a draw
+'''
+def dependencies(signature):
+    white, black = signature.split("v")
+    sides = [list(white[1:]), list(black[1:])]
+    found = set()
+    for side in (0, 1):
+        for i, piece in enumerate(sides[side]):
+            smaller = [list(pieces) for pieces in sides]
+            del smaller[side][i]
+            if smaller[0] or smaller[1]:
+                found.add(makeSignature(smaller[0], smaller[1])[0])
+            if piece == "P":
+                for promoted in "QRBN":
+                    changed = [list(pieces) for pieces in sides]
+                    changed[side][i] = promoted
+                    found.add(makeSignature(changed[0], changed[1])[0])
+    return found
+
+
+class TablebaseFile():
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, pieceCount, signature = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d tablebase" % (path, VERSION))
+        self.signature = signature.rstrip(b"\0").decode()
+        self.pieces = signaturePieces(self.signature)
+
+    def value(self, index):
+        byte = self.data[HEADER.size + index]
+        return byte - 256 if byte > 127 else byte
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+'''
+Whether the side to move in gs can take en passant, found without generating moves: a pawn of its own
+beside the pawn that just moved two squares makes the capture, and it is legal when that leaves the
+king out of check. This covers a capturer pinned to its king, the two pawns leaving a rank the king
+shares with a rook or queen, and a check the capture does not answer. gs is left unchanged.
+'''
+def enpassantLegal(gs):
+    epRow, epCol = gs.enpassantPossible
+    colour, enemy = ("w", "b") if gs.whiteToMove else ("b", "w")
+    pawnRow = epRow + 1 if gs.whiteToMove else epRow - 1 #the row of both pawns
+    kingRow, kingCol = gs.whiteKingLocation if gs.whiteToMove else gs.blackKingLocation
+    board = None
+    for col in (epCol - 1, epCol + 1):
+        if 0 <= col < 8 and gs.board[pawnRow][col] == colour + "P":
+            if board is None:
+                board = [list(boardRow) for boardRow in gs.board]
+                board[pawnRow][epCol] = "--"
+                board[epRow][epCol] = colour + "P"
+            board[pawnRow][col] = "--"
+            if not ChessEngine.sqAttackedBy(board, kingRow, kingCol, enemy):
+                return True
+            board[pawnRow][col] = colour + "P"
+    return False
+
+
+class Tablebases():
+    '''
+    The tables found in directory, opened on first use. probe(gs) returns the stored distance to mate
+    for the side to move (see the format notes above) or None if no table covers the position.
+    gs.pieceCount, kept by makeMove/undoMove, turns most positions away before the board is read.
+    '''
+    def __init__(self, directory=TABLE_DIR):
+        self.directory = directory
+        self.tables = {}
+        self.probes = 0
+        self.hits = 0
+
+    def table(self, signature):
+        if signature not in self.tables:
+            path = os.path.join(self.directory, signature + ".tb")
+            self.tables[signature] = TablebaseFile(path) if os.path.exists(path) else None
+        return self.tables[signature]
+
+    def probe(self, gs):
+        if gs.pieceCount > MAX_PIECES or gs.currentCastlingRights:
+            return None
+        if gs.pieceCount == 2:
+            return 0
+        #an en passant square only matters to the table when the capture is legal
+        if gs.enpassantPossible != () and enpassantLegal(gs):
+            return None
+        squares = {}
+        for row in range(8):
+            boardRow = gs.board[row]
+            for col in range(8):
+                piece = boardRow[col]
+                if piece != "--":
+                    squares.setdefault(piece, []).append(row * 8 + col)
+        self.probes += 1
+        white = [piece[1] for piece, sqs in squares.items() if piece[0] == "w" and piece != "wK" for _ in sqs]
+        black = [piece[1] for piece, sqs in squares.items() if piece[0] == "b" and piece != "bK" for _ in sqs]
+        signature, flipped = makeSignature(white, black)
+        table = self.table(signature)
+        if table is None:
+            return None
+        self.hits += 1
+        whiteToMove = gs.whiteToMove
+        if flipped:
+            squares = {("b" if piece[0] == "w" else "w") + piece[1]: [sq ^ 56 for sq in sqs] for piece, sqs in squares.items()}
+            whiteToMove = not whiteToMove
+        index = 0 if whiteToMove else 1
+        used = {}
+        for piece in table.pieces:
+            index = index * 64 + squares[piece][used.get(piece, 0)]
+            used[piece] = used.get(piece, 0) + 1
+        return table.value(index)
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+def _decode(index, n):
+    squares = [0] * n
+    for i in range(n - 1, -1, -1):
+        index, squares[i] = divmod(index, 64)
+    return index, squares
+
+'''
+Positions one move earlier: the side that just moved takes back a quiet move of one of its pieces.
+Captures and promotions are not taken back since they come from other tables.
+'''
+def _predecessors(index, pieces, sideSize):
+    stm, squares = _decode(index, len(pieces))
+    moverColour = "b" if stm == 0 else "w"
+    previousStm = 1 - stm
+    occupied = set(squares)
+    found = []
+    for slot, piece in enumerate(pieces):
+        if piece[0] != moverColour:
+            continue
+        sq = squares[slot]
+        kind = piece[1]
+        origins = []
+        if kind == "K":
+            origins = [t for t in KING_STEPS[sq] if t not in occupied]
+        elif kind == "N":
+            origins = [t for t in KNIGHT_STEPS[sq] if t not in occupied]
+        elif kind == "P":
+            back = 8 if moverColour == "w" else -8
+            if 0 <= sq + back < 64 and sq + back not in occupied:
+                origins.append(sq + back)
+                if sq // 8 == (4 if moverColour == "w" else 3) and sq + 2 * back not in occupied:
+                    origins.append(sq + 2 * back)
+        else:
+            for ray in SLIDER_RAYS[kind][sq]:
+                for t in ray:
+                    if t in occupied:
+                        break
+                    origins.append(t)
+        weight = 64 ** (len(pieces) - 1 - slot)
+        base = index + (previousStm - stm) * sideSize - sq * weight
+        for origin in origins:
+            found.append(base + origin * weight)
+    return found
+
+'''
+Builds the table for signature and writes it to directory/<signature>.tb; the tables its captures and
+promotions lead to must already be there. Returns (signature, positions, seconds).
+'''
+def generate(signature, directory=TABLE_DIR):
+    start = time.perf_counter()
+    pieces = signaturePieces(signature)
+    n = len(pieces)
+    sideSize = 64 ** n
+    size = 2 * sideSize
+    values = array.array("b", bytes(size))
+    counts = array.array("B", bytes(size)) #quiet moves not yet known to lose
+    exitLoss = array.array("B", bytes(size)) #longest loss through a capture or promotion
+    status = bytearray(size) #0 impossible, 1 open, 2 has a capture or promotion that does not lose, 3 resolved
+    buckets = {}
+    children = Tablebases(directory)
+
+    gs = ChessEngine.GameState("4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+    board = gs.board
+    for index in range(size):
+        stm, squares = _decode(index, n)
+        if len(set(squares)) < n:
+            continue
+        if any(piece[1] == "P" and squares[i] // 8 in (0, 7) for i, piece in enumerate(pieces)):
+            continue
+        for row in board:
+            row[:] = ["--"] * 8
+        for i, piece in enumerate(pieces):
+            board[squares[i] // 8][squares[i] % 8] = piece
+        gs.whiteKingLocation = divmod(squares[0], 8)
+        gs.blackKingLocation = divmod(squares[1], 8)
+        gs.whiteToMove = stm == 0
+        gs.currentCastlingRights = 0
+        gs.enpassantPossible = ()
+        gs.attackMapCache = (None, 0)
+        gs.pieceCount = n
+        waitingRow, waitingCol = gs.blackKingLocation if stm == 0 else gs.whiteKingLocation
+        if gs.sqAttackedBy(waitingRow, waitingCol, "w" if stm == 0 else "b"):
+            continue
+        status[index] = 1
+        moves = gs.getValidMoves()
+        if not moves:
+            if gs.inCheck:
+                buckets.setdefault(0, []).append(index)
+            else:
+                status[index] = 3
+            continue
+        quiet = 0
+        bestWin = 0
+        longestLoss = 0
+        safe = False
+        for move in moves:
+            if move.pieceCaptured == "--" and not move.isPawnPromotion:
+                quiet += 1
+                continue
+            gs.makeMove(move)
+            child = children.probe(gs)
+            gs.undoMove()
+            gs.attackMapCache = (None, 0)
+            if child is None:
+                raise ValueError("%s needs the table for %s" % (signature, gs.getFen()))
+            if child < 0:
+                bestWin = -child if bestWin == 0 else min(bestWin, -child)
+            elif child > 0:
+                longestLoss = max(longestLoss, child + 1)
+            else:
+                safe = True
+        counts[index] = quiet
+        exitLoss[index] = longestLoss
+        if bestWin:
+            buckets.setdefault(bestWin, []).append(index)
+        if safe or bestWin:
+            status[index] = 2
+            if quiet == 0 and not bestWin:
+                status[index] = 3
+        elif quiet == 0:
+            buckets.setdefault(longestLoss, []).append(index)
+    children.close()
+
+    #Retrograde pass in order of distance: losses at even plies, wins at odd plies
+    ply = 0
+    while buckets:
+        items = buckets.pop(ply, [])
+        if ply > 127:
+            raise ValueError("%s has mates longer than a byte can hold" % signature)
+        for index in items:
+            if status[index] == 3:
+                continue
+            status[index] = 3
+            if ply % 2 == 0:
+                values[index] = -ply - 1
+                for previous in _predecessors(index, pieces, sideSize):
+                    if status[previous] in (1, 2):
+                        buckets.setdefault(ply + 1, []).append(previous)
+            else:
+                values[index] = ply
+                for previous in _predecessors(index, pieces, sideSize):
+                    if status[previous] == 1:
+                        counts[previous] -= 1
+                        if counts[previous] == 0:
+                            buckets.setdefault(max(ply + 1, exitLoss[previous]), []).append(previous)
+        ply += 1
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, signature + ".tb")
+    with open(path + ".tmp", "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, n, signature.encode()))
+        out.write(values.tobytes())
+    os.replace(path + ".tmp", path)
+    return signature, size, time.perf_counter() - start
+
+
+def _generateTask(task):
+    return generate(*task)
+
+'''
+Builds the given tables and any missing ones they depend on. Tables are built in waves, each wave
+holding every table whose dependencies are done, with the tables of a wave spread over a process pool.
+'''
+def generateAll(signatures, directory=TABLE_DIR, workers=None, onDone=None):
+    wanted = set()
+    stack = list(signatures)
+    while stack:
+        signature = stack.pop()
+        if signature not in wanted and not os.path.exists(os.path.join(directory, signature + ".tb")):
+            wanted.add(signature)
+            stack.extend(dependencies(signature))
+    done = set()
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool:
+        while wanted - done:
+            wave = [sig for sig in sorted(wanted - done) if all(dep in done or dep not in wanted
+                                                                 for dep in dependencies(sig))]
+            for result in pool.imap_unordered(_generateTask, [(sig, directory) for sig in wave]):
+                done.add(result[0])
+                if onDone is not None:
+                    onDone(*result)
+    return sorted(done)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command")
+    build = commands.add_parser("generate", help="build tables and the tables they depend on")
+    build.add_argument("signatures", nargs="*", help="e.g. KQvK KRvK; default all with --pieces pieces")
+    build.add_argument("--pieces", type=int, default=3, choices=(3, 4))
+    build.add_argument("--dir", default=TABLE_DIR)
+    build.add_argument("--workers", type=int, default=os.cpu_count())
+    probe = commands.add_parser("probe", help="look a position up")
+    probe.add_argument("fen")
+    probe.add_argument("--dir", default=TABLE_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        signatures = args.signatures or [sig for sig in allSignatures(args.pieces) if len(sig) == args.pieces + 1]
+
+        def report(signature, positions, seconds):
+            print("%-8s %10d positions %8.1fs" % (signature, positions, seconds))
+            sys.stdout.flush()
+
+        generateAll(signatures, args.dir, args.workers, report)
+    elif args.command == "probe":
+        tables = Tablebases(args.dir)
+        value = tables.probe(ChessEngine.GameState(args.fen))
+        if value is None:
+            print("not in the tablebases")
+        elif value > 0:
+            print("win, mate in %d plies" % value)
+        elif value < 0:
+            print("loss, mated in %d plies" % (-value - 1))
+        else:
+            print("draw")
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Fixed size transposition table packed into a flat 64-bit word array"""
+from Chess.ChessEngine import Move
+
+EMPTY = 0
+EXACT = 1
+LOWER_BOUND = 2 #score is at least the stored value (fail high)
+UPPER_BOUND = 3 #score is at most the stored value (fail low)
+
+DEFAULT_SIZE_MB = 16
+BUCKET_BYTES = 32 #two entries of a key word and a data word
+
+_MASK64 = (1 << 64) - 1
+_SCORE_OFFSET = 1 << 31
+_PROMOTION_CODES = {None: 0, "Q": 1, "R": 2, "B": 3, "N": 4}
+_PROMOTION_PIECES = {code: piece for piece, code in _PROMOTION_CODES.items()}
+
+'''
+Moves are stored as 15 bits: start square, end square (row * 8 + col) and promotion piece.
+0 means no move since a move never starts and ends on a8.
+'''
+def encodeMove(move):
+    if move is None:
+        return 0
+    return (move.startRow * 8 + move.startCol) | (move.endRow * 8 + move.endCol) << 6 \
+        | _PROMOTION_CODES[move.promotionChoice] << 12
+
+
+'''
+Rebuilds a stored move against board; the caller still has to check it is legal there
+'''
+def decodeMove(code, board):
+    if code == 0:
+        return None
+    return Move(divmod(code & 63, 8), divmod(code >> 6 & 63, 8), board, promotionChoice=_PROMOTION_PIECES[code >> 12 & 7])
+
+
+'''
+Bytes used by a table of sizeMB: the largest power of two number of buckets that fits
+'''
+def tableBytes(sizeMB):
+    buckets = 1
+    while buckets * 2 * BUCKET_BYTES <= sizeMB * 1024 * 1024:
+        buckets *= 2
+    return buckets * BUCKET_BYTES
+
+
+class TranspositionTable():
+    '''
+    Each bucket holds a depth-preferred entry and an always-replace entry. Entries are a key word and
+    a data word in one flat array, with the key word stored XORed with the data so a torn write is seen
+    as a miss instead of a wrong hit. Entries from earlier searches (see newSearch) are replaced first.
+    buffer may be shared memory of tableBytes(sizeMB) bytes, so several processes can use one table.
+
+    Data word layout: move bits 0-15, depth 16-23, bound 24-25, age 26-31, score + 2**31 bits 32-63.
+    '''
+    def __init__(self, sizeMB=DEFAULT_SIZE_MB, buffer=None):
+        if buffer is None:
+            buffer = bytearray(tableBytes(sizeMB))
+        self.buffer = buffer
+        self.words = memoryview(buffer).cast("Q")
+        self.bucketMask = len(self.words) // 4 - 1
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def newSearch(self):
+        self.age = (self.age + 1) & 63
+
+    '''
+    Drops the view of buffer, which shared memory needs before it can be closed
+    '''
+    def release(self):
+        self.words.release()
+
+    def clear(self):
+        view = memoryview(self.buffer)
+        view[:] = bytes(len(view))
+        self.age = 0
+
+    '''
+    Returns (depth, score, bound, moveCode) for key, or None on a miss
+    '''
+    def probe(self, key):
+        self.probes += 1
+        words = self.words
+        index = (key & self.bucketMask) << 2
+        for slot in (index, index + 2):
+            data = words[slot + 1]
+            if words[slot] ^ data == key and data:
+                self.hits += 1
+                return (data >> 16 & 0xFF, (data >> 32) - _SCORE_OFFSET, data >> 24 & 3, data & 0xFFFF)
+        return None
+
+    def store(self, key, depth, score, bound, moveCode=0):
+        self.stores += 1
+        words = self.words
+        index = (key & self.bucketMask) << 2
+        data = moveCode | min(depth, 255) << 16 | bound << 24 | self.age << 26 | (score + _SCORE_OFFSET) << 32
+        preferred = words[index + 1]
+        preferredKey = words[index] ^ preferred
+        if preferredKey == key:
+            #keep the best move we already know if this search did not find one
+            if moveCode == 0:
+                data |= preferred & 0xFFFF
+            slot = index
+        elif preferred == 0 or (preferred >> 26 & 63) != self.age or depth >= (preferred >> 16 & 0xFF):
+            #demote the entry being replaced to the always-replace slot
+            if preferred:
+                words[index + 2] = preferredKey ^ preferred
+                words[index + 3] = preferred
+            slot = index
+        else:
+            slot = index + 2
+        words[slot] = (key ^ data) & _MASK64
+        words[slot + 1] = data
+
+    '''
+    Permille of the first thousand entries used in the current search, as UCI reports it
+    '''
+    def hashfull(self):
+        words = self.words
+        sample = min(1000, len(words) // 2)
+        used = 0
+        for i in range(sample):
+            data = words[i * 2 + 1]
+            if data and (data >> 26 & 63) == self.age:
+                used += 1
+        return used * 1000 // sample if sample else 0
@@ -0,0 +1,273 @@
+"""UCI protocol front-end for the engine; run with python -m Chess.UciEngine"""
+import sys
+import threading
+from Chess import ChessEngine, SmartMoveFinder, TranspositionTable, OpeningBook, ParallelSearch, Tablebase
+
+ENGINE_NAME = "Python_Chess"
+ENGINE_AUTHOR = "teamoteh"
+MOVE_OVERHEAD = 0.05 #seconds kept back per move for output and process scheduling
+MAX_THREADS = 256
+
+
+def moveToUci(move):
+    return move.getChessNotation()
+
+
+def parseUciMove(gs, text):
+    text = text.lower()
+    for move in gs.getValidMoves():
+        notation = move.getChessNotation()
+        if notation == text or (len(text) == 4 and move.promotionChoice == "Q" and notation[:4] == text):
+            return move
+    return None
+
+
+def scoreToUci(score):
+    if abs(score) >= SmartMoveFinder.TABLEBASE_BOUND:
+        if abs(score) >= SmartMoveFinder.MATE_BOUND:
+            plies = SmartMoveFinder.CHECKMATE - abs(score)
+        else:
+            plies = SmartMoveFinder.MATE_BOUND - abs(score) #a tablebase mate past the search's ply budget
+        moves = (plies + 1) // 2
+        return "mate %d" % (moves if score > 0 else -moves)
+    return "cp %d" % score
+
+'''
+Seconds to spend on this move given the go parameters; None means search until stopped
+'''
+def moveTime(params, whiteToMove):
+    if "movetime" in params:
+        return max(0.01, params["movetime"] / 1000 - MOVE_OVERHEAD)
+    remaining = params.get("wtime" if whiteToMove else "btime")
+    if remaining is None:
+        return None
+    increment = params.get("winc" if whiteToMove else "binc", 0) / 1000
+    remaining /= 1000
+    movesToGo = params.get("movestogo", 30)
+    budget = remaining / max(movesToGo, 1) + increment * 0.8
+    return max(0.01, min(budget, remaining * 0.5) - MOVE_OVERHEAD)
+
+
+class UciEngine():
+    '''
+    Commands are read on the calling thread while searches run on a worker thread,
+    so stop, isready and quit are answered while the engine is thinking.
+    '''
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.outLock = threading.Lock()
+        self.hashMB = TranspositionTable.DEFAULT_SIZE_MB
+        self.threads = 1
+        self.smp = None #ParallelSearch while Threads is above 1
+        self.tt = TranspositionTable.TranspositionTable(self.hashMB)
+        self.book = None
+        self.ownBook = True
+        self.tablebases = None
+        self.profile = False
+        self.tracePath = None
+        self.gs = ChessEngine.GameState()
+        self.finder = None
+        self.searchThread = None
+        self.goParams = {}
+        self.pondering = False
+        #set once bestmove may be sent; go infinite and go ponder hold it until stop or ponderhit
+        self.release = threading.Event()
+
+    def send(self, line):
+        with self.outLock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def loop(self, stream=sys.stdin):
+        for line in stream:
+            if not self.handle(line.strip()):
+                break
+        self.stopSearch()
+        if self.smp is not None:
+            self.smp.close()
+
+    '''
+    Handles one command line; returns False on quit. A command with a bad argument is reported
+    as an info string and leaves the position and options as they were.
+    '''
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        try:
+            return self.dispatch(tokens)
+        except ValueError as e:
+            self.send("info string bad command %r: %s" % (line, e))
+            return True
+
+    def dispatch(self, tokens):
+        command = tokens[0]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max 4096" % TranspositionTable.DEFAULT_SIZE_MB)
+            self.send("option name Threads type spin default 1 min 1 max %d" % MAX_THREADS)
+            self.send("option name OwnBook type check default true")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("option name Profile type check default false")
+            self.send("option name TraceFile type string default <empty>")
+            self.send("option name Ponder type check default false")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setOption(tokens)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.tt.clear()
+        elif command == "position":
+            self.setPosition(tokens)
+        elif command == "go":
+            self.go(tokens)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            return False
+        return True
+
+    def setOption(self, tokens):
+        if "name" in tokens and "value" in tokens:
+            name = " ".join(tokens[tokens.index("name") + 1:tokens.index("value")]).lower()
+            value = " ".join(tokens[tokens.index("value") + 1:])
+            if name == "hash":
+                hashMB = max(1, int(value))
+                self.stopSearch()
+                self.hashMB = hashMB
+                self.newTable()
+            elif name == "threads":
+                threads = min(max(1, int(value)), MAX_THREADS)
+                self.stopSearch()
+                self.threads = threads
+                self.newTable()
+            elif name == "ownbook":
+                self.ownBook = value.lower() == "true"
+            elif name == "bookfile":
+                self.stopSearch()
+                if self.book is not None:
+                    self.book.close()
+                    self.book = None
+                if value and value != "<empty>":
+                    try:
+                        self.book = OpeningBook.OpeningBook(value)
+                    except (OSError, ValueError) as e:
+                        self.send("info string cannot open book %s: %s" % (value, e))
+            elif name == "tablebasepath":
+                self.stopSearch()
+                if self.tablebases is not None:
+                    self.tablebases.close()
+                self.tablebases = Tablebase.Tablebases(value) if value and value != "<empty>" else None
+            elif name == "profile":
+                self.profile = value.lower() == "true"
+            elif name == "tracefile":
+                self.tracePath = value if value and value != "<empty>" else None
+
+    '''
+    A plain table for one thread, otherwise one in shared memory owned by a ParallelSearch
+    '''
+    def newTable(self):
+        if self.smp is not None:
+            self.smp.close()
+            self.smp = None
+        if self.threads > 1:
+            self.smp = ParallelSearch.ParallelSearch(self.threads, self.hashMB)
+            self.tt = self.smp.tt
+        else:
+            self.tt = TranspositionTable.TranspositionTable(self.hashMB)
+
+    def setPosition(self, tokens):
+        movesAt = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if len(tokens) > 1 and tokens[1] == "fen":
+            fen = " ".join(tokens[2:movesAt])
+        else:
+            fen = ChessEngine.START_FEN
+        gs = ChessEngine.GameState(fen) #a bad FEN raises here, before the running search is stopped
+        for text in tokens[movesAt + 1:]:
+            move = parseUciMove(gs, text)
+            if move is None:
+                self.send("info string illegal move " + text)
+                break
+            gs.makeMove(move)
+        self.stopSearch()
+        self.gs = gs
+
+    def go(self, tokens):
+        params = {}
+        for i, token in enumerate(tokens[:-1]):
+            if token in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes"):
+                params[token] = int(tokens[i + 1])
+        self.stopSearch()
+        self.goParams = params
+        self.pondering = "ponder" in tokens
+        infinite = "infinite" in tokens
+        timeLimit = None if infinite or self.pondering else moveTime(params, self.gs.whiteToMove)
+        self.release = threading.Event()
+        if not infinite and not self.pondering:
+            self.release.set()
+        self.finder = SmartMoveFinder.MoveFinder(timeLimit, params.get("depth", SmartMoveFinder.MAX_DEPTH),
+                                                 params.get("nodes"), self.tt, self.book if self.ownBook else None,
+                                                 tablebases=self.tablebases)
+        self.finder.onIteration = self.sendInfo
+        self.finder.profile = self.profile
+        self.finder.tracePath = self.tracePath
+        self.searchThread = threading.Thread(target=self.search, args=(self.finder, self.gs), daemon=True)
+        self.searchThread.start()
+
+    def search(self, finder, gs):
+        if self.smp is not None:
+            move = self.smp.search(gs, finder)
+            self.send("info string worker nodes " + " ".join(str(nodes) for nodes in self.smp.workerNodes))
+        else:
+            move = finder.search(gs)
+        self.send("info string pawn table hit rate %.1f%%" % (finder.pawnTable.hitRate() * 100))
+        if move is not None and finder.depth:
+            self.send("info string " + finder.stats.infoString(finder.nodes, finder.elapsed()))
+        self.release.wait()
+        if move is None:
+            self.send("bestmove 0000")
+            return
+        pv = finder.principalVariation(gs, 2)
+        ponder = " ponder " + moveToUci(pv[1]) if len(pv) == 2 and pv[0] == move else ""
+        self.send("bestmove " + moveToUci(move) + ponder)
+
+    '''
+    The opponent played the move being pondered on: the search goes on as a normal one, on the clock
+    given with go ponder, and its bestmove is sent when it ends
+    '''
+    def ponderhit(self):
+        if self.searchThread is None or not self.pondering:
+            return
+        self.pondering = False
+        timeLimit = moveTime(self.goParams, self.gs.whiteToMove)
+        if timeLimit is not None:
+            self.finder.ponderhit(timeLimit)
+            self.release.set()
+
+    def sendInfo(self, finder, gs):
+        elapsed = finder.elapsed()
+        pv = finder.principalVariation(gs, finder.depth)
+        self.send("info depth %d score %s nodes %d nps %d time %d hashfull %d pv %s"
+                  % (finder.depth, scoreToUci(finder.score), finder.nodes, finder.nodes / elapsed if elapsed else 0,
+                     elapsed * 1000, self.tt.hashfull(), " ".join(moveToUci(move) for move in pv)))
+
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.release.set()
+            SmartMoveFinder.stopThread(self.finder, self.searchThread)
+            self.searchThread = None
+            self.finder = None
+
+
+def main():
+    UciEngine().loop()
+
+
+if __name__ == "__main__":
+    main()
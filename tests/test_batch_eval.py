@@ -0,0 +1,66 @@
+import random
+import pytest
+from Chess import ChessEngine, BitboardEngine, Evaluation, Perft
+
+np = pytest.importorskip("numpy")
+from Chess import BatchEval
+
+
+def randomPositions(count, seed=5):
+    rng = random.Random(seed)
+    states = []
+    for index in range(count):
+        gs = ChessEngine.GameState(Perft.POSITIONS[sorted(Perft.POSITIONS)[index % len(Perft.POSITIONS)]][0])
+        for _ in range(rng.randrange(60)):
+            moves = gs.getValidMoves()
+            if not moves:
+                break
+            gs.makeMove(rng.choice(moves))
+        states.append(gs)
+    return states
+
+
+def testEvaluateMatchesTaper():
+    states = randomPositions(200)
+    squares, whiteToMove = BatchEval.encodeFens([gs.getFen() for gs in states])
+    expected = [Evaluation.taper(gs.mgScore, gs.egScore, gs.phase) for gs in states]
+    assert BatchEval.evaluate(squares).tolist() == expected
+    assert whiteToMove.tolist() == [gs.whiteToMove for gs in states]
+    assert BatchEval.evaluate(squares, whiteToMove).tolist() == \
+        [score if gs.whiteToMove else -score for score, gs in zip(expected, states)]
+
+
+def testEncodeStatesMatchesEncodeFens():
+    states = randomPositions(50, seed=9)
+    fromFens = BatchEval.encodeFens([gs.getFen() for gs in states])
+    fromStates = BatchEval.encodeStates(states)
+    assert (fromFens[0] == fromStates[0]).all() and (fromFens[1] == fromStates[1]).all()
+
+
+def testBitboardsAndPlanes():
+    fen = Perft.POSITIONS["kiwipete"][0]
+    squares, _ = BatchEval.encodeFens([fen, ChessEngine.START_FEN])
+    gs = BitboardEngine.BitboardGameState(fen)
+    bitboards = BatchEval.toBitboards(squares)
+    planes = BatchEval.toPlanes(squares)
+    for index, piece in enumerate(BatchEval.PIECES):
+        expected = sum(1 << (row * 8 + col) for row in range(8) for col in range(8) if gs.board[row][col] == piece)
+        assert int(bitboards[0, index]) == expected
+        assert int(planes[0, index].sum()) == bin(expected).count("1")
+    assert planes.shape == (2, 12, 8, 8)
+    assert planes[1, BatchEval.PIECES.index("wK"), 7, 4] == 1
+
+
+def testEmptyBatch():
+    squares, whiteToMove = BatchEval.encodeFens([])
+    assert squares.shape == (0, 64) and BatchEval.evaluate(squares).shape == (0,)
+
+
+@pytest.mark.parametrize("fen", ["rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",
+                                 "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                                 "rnbqkbnr/pppppppp/7/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                                 "rnbqkbnr/ppppxppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"])
+def testBadFensRaise(fen):
+    with pytest.raises(ValueError) as error:
+        BatchEval.encodeFens([ChessEngine.START_FEN, fen])
+    assert "FEN 1 " in str(error.value)
@@ -0,0 +1,68 @@
+import random
+import pytest
+from Chess import ChessEngine, BitboardEngine, Perft
+
+STATES = (ChessEngine.GameState, BitboardEngine.BitboardGameState)
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+@pytest.mark.parametrize("name", sorted(Perft.POSITIONS))
+def testFenRoundTrip(stateClass, name):
+    fen = Perft.POSITIONS[name][0]
+    assert stateClass(fen).getFen() == fen
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testFenRoundTripThroughAGame(stateClass):
+    rng = random.Random(7)
+    gs = stateClass()
+    fens = []
+    for _ in range(80):
+        moves = gs.getValidMoves()
+        if not moves:
+            break
+        fens.append(gs.getFen())
+        gs.makeMove(rng.choice(moves))
+        fen = gs.getFen()
+        loaded = stateClass(fen)
+        assert loaded.getFen() == fen
+        assert loaded.zobristKey == gs.zobristKey
+    for fen in reversed(fens):
+        gs.undoMove()
+        assert gs.getFen() == fen
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testMissingFieldsDefault(stateClass):
+    assert stateClass("4k3/8/8/8/8/8/8/4K3 w - -").getFen() == "4k3/8/8/8/8/8/8/4K3 w - - 0 1"
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testUnusableEnpassantSquareIsDropped(stateClass):
+    assert stateClass("4k3/8/8/8/4P3/8/8/4K3 b - e3 0 1").getFen() == "4k3/8/8/8/4P3/8/8/4K3 b - - 0 1"
+    fen = "4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1"
+    assert stateClass(fen).getFen() == fen
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+@pytest.mark.parametrize("fen", [
+    "garbage",
+    "8/8/8/8/8/8/8/8 w - - 0 1", #no kings
+    "4k3/8/8/8/8/8/8/8 w - - 0 1", #no white king
+    "4k3/8/8/8/8/8/8/3KK3 w - - 0 1", #two white kings
+    "4k3/8/8/8/8/8/8/4R1K1 w - - 0 1", #black, not to move, is in check
+    "4k3/8/8/8/8/8/8/4K3 x - - 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - z9 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - - x 1",
+    "4k3/8/8/8/8/8/4K3 w - - 0 1",
+    "4k3/8/8/8/8/8/8/4K2X w - - 0 1",
+])
+def testBadFenRaises(stateClass, fen):
+    with pytest.raises(ValueError):
+        stateClass(fen)
+
+
+def testSideToMoveMayBeInCheck():
+    board = ChessEngine.parseFen("4k3/8/8/8/8/8/8/4R1K1 b - - 0 1")[0]
+    assert ChessEngine.sqAttackedBy(board, 0, 4, "w")
+    assert not ChessEngine.sqAttackedBy(board, 7, 6, "b")
@@ -0,0 +1,124 @@
+import io
+import pytest
+from Chess import ChessEngine, GameDatabase, Pgn, TranspositionTable as TT, UciEngine
+
+GAMES = '''[White "a"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 1-0
+
+[White "b"]
+[Result "1/2-1/2"]
+
+1. e4 c5 2. Nf3 d6 1/2-1/2
+
+[White "c"]
+[Result "0-1"]
+
+1. e4 e4 0-1
+
+[White "d"]
+[Result "0-1"]
+[SetUp "1"]
+[FEN "4k3/8/8/8/8/8/8/R3K3 b Q - 0 1"]
+
+1... Kd7 2. O-O-O+ Kc6 0-1
+'''
+
+MORE_GAMES = '''[Result "*"]
+
+1. d4 d5 2. Nf3 *
+
+[Result "0-1"]
+
+1. e4 e5 2. Nf3 Nf6 0-1
+'''
+
+
+def keyAfter(moves, fen=ChessEngine.START_FEN):
+    gs = ChessEngine.GameState(fen)
+    for text in moves:
+        gs.makeMove(UciEngine.parseUciMove(gs, text))
+    return gs.zobristKey
+
+
+def code(fen, text):
+    return TT.encodeMove(UciEngine.parseUciMove(ChessEngine.GameState(fen), text))
+
+
+@pytest.fixture
+def database(tmp_path):
+    pgn = tmp_path / "games.pgn"
+    pgn.write_text(GAMES)
+    directory = str(tmp_path / "db")
+    totals = GameDatabase.buildDatabase([str(pgn)], directory, batchSize=1, segmentEntries=4)
+    return directory, totals
+
+
+def testBuildTotals(database):
+    directory, totals = database
+    #positions: 7 + 5 + 4 for the games that replay, counting the final position of each
+    assert (totals["games"], totals["errors"], totals["positions"]) == (4, 1, 16)
+    assert totals["segments"] >= 2
+    with GameDatabase.GameDatabase(directory) as db:
+        assert len(db) == 4
+
+
+def testMoveStats(database):
+    directory, _ = database
+    with GameDatabase.GameDatabase(directory) as db:
+        stats = db.moveStats(keyAfter([]))
+        assert stats == {code(ChessEngine.START_FEN, "e2e4"): [2, 1, 0, 1, 0]}
+        afterE4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+        assert db.moveStats(keyAfter(["e2e4"])) == {code(afterE4, "e7e5"): [1, 1, 0, 0, 0],
+                                                   code(afterE4, "c7c5"): [1, 0, 0, 1, 0]}
+        assert db.moveStats(keyAfter(["d2d4"])) == {}
+
+
+def testGamesReaching(database):
+    directory, _ = database
+    with GameDatabase.GameDatabase(directory) as db:
+        assert db.gamesReaching(keyAfter([])) == [(0, 0), (1, 0)]
+        assert db.gamesReaching(keyAfter(["e2e4", "e7e5", "g1f3"])) == [(0, 3)]
+        assert db.gamesReaching(keyAfter(["e2e4"]), limit=1) == [(0, 1)]
+        endgame = "4k3/8/8/8/8/8/8/R3K3 b Q - 0 1"
+        assert db.gamesReaching(keyAfter(["e8d7", "e1c1"], endgame)) == [(3, 2)]
+
+
+def testReadAndReplay(database):
+    directory, _ = database
+    with GameDatabase.GameDatabase(directory) as db:
+        games = list(Pgn.readGames(io.StringIO(GAMES)))
+        for game in (0, 1, 3):
+            gs, result = db.replay(game)
+            headers, movetext = games[game]
+            assert gs.getFen() == Pgn.replayGame(headers, movetext).getFen()
+            assert result == headers["Result"]
+        assert db.readGame(3)[0] == "4k3/8/8/8/8/8/8/R3K3 b Q - 0 1"
+        assert db.readGame(2) == (ChessEngine.START_FEN, [], None) #could not be replayed
+
+
+def testAppendRefreshAndCompact(database, tmp_path):
+    directory, _ = database
+    with GameDatabase.GameDatabase(directory) as db:
+        pgn = tmp_path / "more.pgn"
+        pgn.write_text(MORE_GAMES)
+        totals = GameDatabase.buildDatabase([str(pgn)], directory, workers=2, batchSize=1)
+        assert (totals["games"], totals["errors"]) == (2, 0)
+        assert len(db) == 4
+        db.refresh()
+        assert len(db) == 6
+        before = {key: db.moveStats(key) for key in (keyAfter([]), keyAfter(["e2e4"]), keyAfter(["e2e4", "e7e5"]))}
+        assert before[keyAfter([])][code(ChessEngine.START_FEN, "d2d4")] == [1, 0, 0, 0, 1]
+        assert db.gamesReaching(keyAfter(["e2e4", "e7e5", "g1f3"])) == [(0, 3), (5, 3)]
+        segments = len(db.segments)
+    assert GameDatabase.compact(directory) == segments
+    with GameDatabase.GameDatabase(directory) as db:
+        assert len(db.segments) == 1
+        assert {key: db.moveStats(key) for key in before} == before
+        assert db.replay(4)[0].getFen() == "rnbqkbnr/ppp1pppp/8/3p4/3P4/5N2/PPP1PPPP/RNBQKB1R b KQkq - 1 2"
+
+
+def testMissingDatabase(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        GameDatabase.GameDatabase(str(tmp_path))
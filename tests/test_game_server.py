@@ -0,0 +1,42 @@
+import pytest
+from Chess import GameServer, SelfPlay, UciEngine
+
+
+def playAll(session, moves):
+    for text in moves:
+        session.play(UciEngine.parseUciMove(session.gs, text))
+
+
+@pytest.mark.parametrize("fen, result", [
+    ("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1", ("1/2-1/2", "stalemate")),
+    ("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1", ("1-0", "checkmate")),
+    ("4k3/8/8/8/8/8/8/4KN2 w - - 0 1", ("1/2-1/2", "insufficient material")),
+    ("4k3/8/8/8/8/8/8/R3K3 w - - 100 80", ("1/2-1/2", "fifty moves")),
+    ("4k3/8/8/8/8/8/8/R3K3 w - - 99 80", None),
+])
+def testResultByTheRules(fen, result):
+    assert GameServer.Session(fen).result() == result
+
+
+def testRepetition():
+    session = GameServer.Session()
+    playAll(session, ["g1f3", "g8f6", "f3g1", "f6g8"] * 2)
+    assert session.result() == ("1/2-1/2", "repetition")
+    assert not session.engineTurn()
+
+
+def testLongGamesAreNotAdjudicated(monkeypatch):
+    monkeypatch.setattr(SelfPlay, "MAX_PLIES", 4)
+    session = GameServer.Session()
+    playAll(session, ["e2e4", "e7e5", "g1f3", "b8c6"])
+    assert SelfPlay.gameResult(session.gs, session.validMoves) == ("1/2-1/2", "adjudicated")
+    assert session.result() is None
+    assert not session.engineTurn() #the human, white, is to move
+    playAll(session, ["f1c4"])
+    assert session.engineTurn()
+
+
+def testMoveTime():
+    assert GameServer.Session(budget=0).moveTime() == GameServer.MIN_MOVE_TIME
+    assert GameServer.Session(budget=3).moveTime() == pytest.approx(3 / GameServer.EXPECTED_MOVES)
+    assert GameServer.Session(budget=1e6).moveTime() == GameServer.MAX_MOVE_TIME
@@ -0,0 +1,123 @@
+import random
+import pytest
+from Chess import ChessEngine, BitboardEngine, OpeningBook, Polyglot, UciEngine
+
+STATES = (ChessEngine.GameState, BitboardEngine.BitboardGameState)
+
+#keys from the Polyglot book format description
+POLYGLOT_KEYS = [
+    ([], 0x463B96181691FC9C),
+    (["e2e4"], 0x823C9B50FD114196),
+    (["e2e4", "d7d5"], 0x0756B94461C50FB0),
+    (["e2e4", "d7d5", "e4e5"], 0x662FAFB965DB29D4),
+    (["e2e4", "d7d5", "e4e5", "f7f5"], 0x22A48B5A8E47FF78),
+    (["e2e4", "d7d5", "e4e5", "f7f5", "e1e2"], 0x652A607CA3F242C1),
+    (["e2e4", "d7d5", "e4e5", "f7f5", "e1e2", "e8f7"], 0x00FDD303C946BDD9),
+    (["a2a4", "b7b5", "h2h4", "b5b4", "c2c4"], 0x3C8123EA7B067637),
+    (["a2a4", "b7b5", "h2h4", "b5b4", "c2c4", "b4c3", "a1a3"], 0x5C3F9B829B279560),
+]
+
+GAMES = '''[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Result "1/2-1/2"]
+
+1. e4 c5 1/2-1/2
+
+[Result "0-1"]
+
+1. d4 d5 0-1
+'''
+
+
+def play(gs, moves):
+    for text in moves:
+        gs.makeMove(UciEngine.parseUciMove(gs, text))
+    return gs
+
+
+def notations(moves):
+    return [(move.getChessNotation(), weight) for move, weight in moves]
+
+
+@pytest.fixture
+def pgnPath(tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text(GAMES)
+    return str(path)
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+@pytest.mark.parametrize("moves, key", POLYGLOT_KEYS)
+def testPolyglotKey(stateClass, moves, key):
+    assert Polyglot.polyglotKey(play(stateClass(), moves)) == key
+
+
+@pytest.mark.parametrize("polyglot", [False, True])
+def testBuildAndProbe(pgnPath, tmp_path, polyglot):
+    bookPath = str(tmp_path / "book.bin")
+    written = OpeningBook.buildBook([pgnPath], bookPath, polyglot=polyglot)
+    #e4 3, c5 1, Nf3 2 and d5 2; e5, Nc6 and d4 only lost, so they are dropped
+    assert written == 4
+    with OpeningBook.OpeningBook(bookPath) as book:
+        assert book.polyglot == polyglot and len(book) == written
+        assert notations(book.bookMoves(ChessEngine.GameState())) == [("e2e4", 3)]
+        assert notations(book.bookMoves(play(ChessEngine.GameState(), ["e2e4"]))) == [("c7c5", 1)]
+        assert notations(book.bookMoves(play(ChessEngine.GameState(), ["d2d4"]))) == [("d7d5", 2)]
+        assert book.bookMoves(play(ChessEngine.GameState(), ["g1f3"])) == []
+        assert book.pickMove(ChessEngine.GameState(), rng=random.Random(1)).getChessNotation() == "e2e4"
+
+
+def testMinCount(pgnPath, tmp_path):
+    bookPath = str(tmp_path / "book.bin")
+    assert OpeningBook.buildBook([pgnPath], bookPath, minCount=2) == 1
+
+
+def writePolyglot(path, entries):
+    with open(path, "wb") as out:
+        for entry in sorted(entries):
+            out.write(OpeningBook.ENTRY.pack(*entry))
+
+
+def testReadsAPolyglotBook(tmp_path):
+    path = str(tmp_path / "polyglot.bin")
+    castling = play(ChessEngine.GameState(), ["e2e4", "e7e5", "g1f3", "b8c6", "f1c4", "g8f6"])
+    e2e4 = 4 | 3 << 3 | 4 << 6 | 1 << 9
+    d2d4 = 3 | 3 << 3 | 3 << 6 | 1 << 9
+    e1h1 = 7 | 0 << 3 | 4 << 6 | 0 << 9
+    writePolyglot(path, [(POLYGLOT_KEYS[0][1], e2e4, 10, 0), (POLYGLOT_KEYS[0][1], d2d4, 30, 0),
+                         (Polyglot.polyglotKey(castling), e1h1, 1, 0), (1, e2e4, 5, 0)])
+    with OpeningBook.OpeningBook(path) as book:
+        assert book.polyglot
+        for stateClass in STATES:
+            assert notations(book.bookMoves(stateClass())) == [("d2d4", 30), ("e2e4", 10)]
+        move, = book.bookMoves(castling)
+        assert move[0].isCastleMove and move[0].getChessNotation() == "e1g1"
+
+
+def testPromotionCodes():
+    gs = ChessEngine.GameState("4k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+    codes = {move.getChessNotation(): OpeningBook.encodeMove(move) for move in gs.getValidMoves()}
+    a7a8 = 0 | 7 << 3 | 0 << 6 | 6 << 9
+    assert codes["a7a8q"] == a7a8 | 4 << 12 and codes["a7a8n"] == a7a8 | 1 << 12
+
+
+def testRejectsOtherFiles(tmp_path):
+    path = tmp_path / "bad.bin"
+    path.write_bytes(b"x" * 20)
+    with pytest.raises(ValueError):
+        OpeningBook.OpeningBook(str(path))
+    path.write_bytes(OpeningBook.HEADER.pack(OpeningBook.MAGIC, OpeningBook.VERSION + 1, 0))
+    with pytest.raises(ValueError):
+        OpeningBook.OpeningBook(str(path))
+
+
+def testEmptyBooks(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    with OpeningBook.OpeningBook(str(path)) as book:
+        assert book.polyglot and book.bookMoves(ChessEngine.GameState()) == []
+    path.write_bytes(OpeningBook.HEADER.pack(OpeningBook.MAGIC, OpeningBook.VERSION, 0))
+    with OpeningBook.OpeningBook(str(path)) as book:
+        assert not book.polyglot and book.pickMove(ChessEngine.GameState()) is None
@@ -0,0 +1,35 @@
+import pytest
+from Chess import ChessEngine, BitboardEngine, Perft
+
+STATES = (ChessEngine.GameState, BitboardEngine.BitboardGameState)
+MAX_DEPTH = 3
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+@pytest.mark.parametrize("name", sorted(Perft.POSITIONS))
+def testPerft(stateClass, name):
+    fen, counts = Perft.POSITIONS[name]
+    gs = stateClass(fen)
+    for depth, expected in enumerate(counts[:MAX_DEPTH], 1):
+        assert Perft.perft(gs, depth) == expected
+    assert gs.getFen() == fen
+
+
+@pytest.mark.parametrize("name", sorted(Perft.POSITIONS))
+def testBitboardsAgreeMoveByMove(name):
+    assert Perft.compare(Perft.POSITIONS[name][0], 2) == []
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testHashesAreRestoredByUndo(stateClass):
+    gs = stateClass(Perft.POSITIONS["kiwipete"][0])
+    before = (gs.zobristKey, gs.pawnKey, gs.mgScore, gs.egScore, gs.phase, gs.pieceCount)
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        for reply in gs.getValidMoves():
+            gs.makeMove(reply)
+            assert gs.zobristKey == ChessEngine.computeZobristKey(gs)
+            assert gs.pawnKey == ChessEngine.computePawnKey(gs)
+            gs.undoMove()
+        gs.undoMove()
+    assert (gs.zobristKey, gs.pawnKey, gs.mgScore, gs.egScore, gs.phase, gs.pieceCount) == before
@@ -0,0 +1,94 @@
+import io
+import random
+import pytest
+from Chess import ChessEngine, BitboardEngine, Pgn, Perft
+
+STATES = (ChessEngine.GameState, BitboardEngine.BitboardGameState)
+
+OPERA_GAME = '''[Event "Paris"]
+[Site "Paris FRA"]
+[Date "1858.??.??"]
+[White "Paul Morphy"]
+[Black "Duke Karl / Count Isouard"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 d6 3. d4 Bg4 {This is a weak move already.} 4. dxe5 Bxf3 5. Qxf3 dxe5
+6. Bc4 Nf6 7. Qb3 qe7 8. Nc3 c6 9. Bg5 b5 10. Nxb5 cxb5 11. Bxb5+ Nbd7 12. O-O-O Rd8
+13. Rxd7 Rxd7 14. Rd1 Qe6 15. Bxd7+ Nxd7 16. Qb8+ Nxb8 17. Rd8# 1-0
+'''.replace("qe7", "Qe7")
+
+
+def randomGame(stateClass, fen, plies, seed):
+    rng = random.Random(seed)
+    gs = stateClass(fen)
+    for _ in range(plies):
+        moves = gs.getValidMoves()
+        if not moves:
+            break
+        gs.makeMove(rng.choice(moves))
+    return gs
+
+
+@pytest.mark.parametrize("bitboard", [False, True])
+def testReplayAndExportTheOperaGame(bitboard):
+    (headers, movetext), = list(Pgn.readGames(io.StringIO(OPERA_GAME)))
+    assert headers["White"] == "Paul Morphy"
+    gs = Pgn.replayGame(headers, movetext, bitboard)
+    assert len(gs.moveLog) == 33
+    assert gs.getValidMoves() == [] and gs.checkMate
+    pgn = Pgn.gameToPgn(gs, headers)
+    assert pgn.rstrip().endswith("17. Rd8# 1-0")
+    assert Pgn.sanTokens(pgn.split("\n\n", 1)[1]) == Pgn.sanTokens(movetext)
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+@pytest.mark.parametrize("name", ["startpos", "kiwipete", "position3", "position4", "position5"])
+def testSanRoundTrip(stateClass, name):
+    gs = stateClass(Perft.POSITIONS[name][0])
+    for move in gs.getValidMoves():
+        san = Pgn.moveToSan(gs, move)
+        assert Pgn.parseSan(gs, san) == move
+        assert Pgn.parseSan(gs, san).promotionChoice == move.promotionChoice
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+@pytest.mark.parametrize("seed", range(4))
+def testPgnRoundTrip(stateClass, seed):
+    fen = ChessEngine.START_FEN if seed % 2 == 0 else Perft.POSITIONS["kiwipete"][0]
+    gs = randomGame(stateClass, fen, 120, seed)
+    finalFen = gs.getFen()
+    pgn = Pgn.gameToPgn(gs, {"Result": "*"})
+    assert gs.getFen() == finalFen
+    (headers, movetext), = list(Pgn.readGames(io.StringIO(pgn)))
+    assert ("FEN" in headers) == (fen != ChessEngine.START_FEN)
+    replayed = Pgn.replayGame(headers, movetext, stateClass is BitboardEngine.BitboardGameState)
+    assert replayed.getFen() == finalFen
+    assert [move.getChessNotation() for move in replayed.moveLog] == [move.getChessNotation() for move in gs.moveLog]
+
+
+def testSanDisambiguation():
+    gs = ChessEngine.GameState("4k3/8/8/R7/8/8/1N3N2/R3K2R w KQ - 0 1")
+    sans = {Pgn.moveToSan(gs, move) for move in gs.getValidMoves()}
+    assert {"Nbd3", "Nfd3", "R1a3", "R5a3", "O-O", "O-O-O"} <= sans
+    gs = ChessEngine.GameState("8/8/7k/8/Q7/8/8/Q2QK3 w - - 0 1")
+    assert {"Qa1d4", "Q4d4", "Qdd4"} <= {Pgn.moveToSan(gs, move) for move in gs.getValidMoves()}
+
+
+@pytest.mark.parametrize("san", ["Nd5", "e5", "O-O", "Qe9", "Nd3"])
+def testParseSanRejects(san):
+    with pytest.raises(ValueError):
+        Pgn.parseSan(ChessEngine.GameState("4k3/8/8/8/8/8/1N3N2/4K3 w - - 0 1"), san)
+
+
+def testSanTokensDropCommentsAndVariations():
+    movetext = "1. e4 {best by test} e5 (1... c5 2. Nf3 (2. c3) d6) 2. Nf3 $1 Nc6 ; a comment\n3. Bb5 1/2-1/2"
+    assert Pgn.sanTokens(movetext) == ["e4", "e5", "Nf3", "Nc6", "Bb5"]
+
+
+def testIngestCountsErrors(tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text(OPERA_GAME + "\n" + '[White "a"]\n[Black "b"]\n\n1. e4 e4 *\n')
+    errors = []
+    totals = Pgn.ingest([str(path)], onError=lambda *error: errors.append(error))
+    assert (totals["games"], totals["plies"], totals["errors"]) == (2, 33, 1)
+    assert errors[0][:2] == (1, "a - b")
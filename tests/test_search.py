@@ -0,0 +1,51 @@
+import pytest
+from Chess import ChessEngine, BitboardEngine, SmartMoveFinder
+
+STATES = (ChessEngine.GameState, BitboardEngine.BitboardGameState)
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testSearchFindsALegalMove(stateClass):
+    gs = stateClass()
+    fen = gs.getFen()
+    finder = SmartMoveFinder.MoveFinder(None, 3)
+    move = finder.search(gs)
+    assert move in gs.getValidMoves()
+    assert finder.depth == 3
+    assert gs.getFen() == fen
+    assert finder.principalVariation(gs)[0] == move
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testSearchFindsMateInOne(stateClass):
+    gs = stateClass("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+    finder = SmartMoveFinder.MoveFinder(None, 3)
+    assert finder.search(gs).getChessNotation() == "a1a8"
+    assert finder.score >= SmartMoveFinder.MATE_BOUND
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testTimedSearchStops(stateClass):
+    finder = SmartMoveFinder.MoveFinder(0.2)
+    assert finder.search(stateClass()) is not None
+    assert finder.elapsed() < 2
+
+
+@pytest.mark.parametrize("fen", ["r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                                 "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"])
+def testStagedMovesMatchValidMovesOnBitboards(fen):
+    gs = BitboardEngine.BitboardGameState(fen)
+    valid = sorted(move.moveID for move in gs.getValidMoves())
+    staged = sorted(move.moveID for move in gs.generateMovesStaged(gs.getValidMoves()[0]))
+    assert staged == valid
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testProfiledSearchTimesEveryStage(stateClass):
+    gs = stateClass()
+    finder = SmartMoveFinder.MoveFinder(None, 3)
+    finder.profile = True
+    finder.search(gs)
+    times = finder.stats.toDict()["times"]
+    assert times["movegen"] > 0 and times["pins"] > 0 and times["eval"] > 0
+    assert "generateMovesStaged" not in vars(gs) and "evaluate" not in vars(finder)
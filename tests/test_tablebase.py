@@ -0,0 +1,103 @@
+import pytest
+from Chess import ChessEngine, BitboardEngine, Tablebase
+
+STATES = (ChessEngine.GameState, BitboardEngine.BitboardGameState)
+
+
+def sq(name):
+    return ChessEngine.Move.ranksToRows[name[1]] * 8 + ChessEngine.Move.filesToCols[name[0]]
+
+
+def tableIndex(whiteToMove, squares):
+    index = 0 if whiteToMove else 1
+    for square in squares:
+        index = index * 64 + sq(square)
+    return index
+
+'''
+Writes a table for signature holding values at the given indexes and 0 elsewhere; the file is
+sparse, so even a four piece table costs next to nothing to make
+'''
+def writeTable(directory, signature, values):
+    pieces = Tablebase.signaturePieces(signature)
+    with open(str(directory / (signature + ".tb")), "wb") as out:
+        out.write(Tablebase.HEADER.pack(Tablebase.MAGIC, Tablebase.VERSION, len(pieces), signature.encode()))
+        out.truncate(Tablebase.HEADER.size + 2 * 64 ** len(pieces))
+        for index, value in values.items():
+            out.seek(Tablebase.HEADER.size + index)
+            out.write(bytes([value & 0xFF]))
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testProbeReadsTheIndexedByte(tmp_path, stateClass):
+    writeTable(tmp_path, "KRvK", {tableIndex(True, ["e1", "e8", "a1"]): 7, tableIndex(False, ["e1", "e8", "a1"]): -4})
+    tables = Tablebase.Tablebases(str(tmp_path))
+    assert tables.probe(stateClass("4k3/8/8/8/8/8/8/R3K3 w - - 0 1")) == 7
+    assert tables.probe(stateClass("4k3/8/8/8/8/8/8/R3K3 b - - 0 1")) == -4
+    assert tables.probe(stateClass("4k3/8/8/8/8/8/8/1R2K3 w - - 0 1")) == 0
+    assert (tables.probes, tables.hits) == (3, 3)
+    tables.close()
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testProbeFlipsColours(tmp_path, stateClass):
+    #black's rook is looked up as white's in the KRvK table, mirrored top to bottom with the sides swapped
+    writeTable(tmp_path, "KRvK", {tableIndex(False, ["e1", "e8", "a1"]): 9})
+    tables = Tablebase.Tablebases(str(tmp_path))
+    assert tables.probe(stateClass("r3k3/8/8/8/8/8/8/4K3 w - - 0 1")) == 9
+    tables.close()
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testPositionsTheTablesDoNotCover(tmp_path, stateClass):
+    writeTable(tmp_path, "KRvK", {})
+    tables = Tablebase.Tablebases(str(tmp_path))
+    assert tables.probe(stateClass("4k3/8/8/8/8/8/8/4K3 w - - 0 1")) == 0
+    assert tables.probe(stateClass("4k3/8/8/8/8/8/8/R3K3 w Q - 0 1")) is None
+    assert tables.probe(stateClass("4k3/8/8/8/8/8/8/Q3K3 w - - 0 1")) is None #no KQvK table
+    assert tables.probe(stateClass(ChessEngine.START_FEN)) is None
+    assert tables.hits == 0
+    tables.close()
+
+
+ENPASSANT = [
+    ("8/8/8/3k4/4Pp2/8/8/4K3 b - e3 0 1", True),
+    ("7k/8/8/4Pp2/4K3/8/8/8 w - f6 0 2", True), #the capture takes the checking pawn
+    ("8/8/8/K2pP2r/8/8/8/7k w - d6 0 2", False), #both pawns leave the king's rank
+    ("1b5k/8/8/4Pp2/8/8/7K/8 w - f6 0 2", False), #the capturer is pinned
+    ("k7/8/8/4Pp2/8/5n2/7K/8 w - f6 0 2", False), #the capture does not answer the knight's check
+    ("8/8/8/2k5/3Pp3/8/8/4K2B b - d3 0 1", True),
+]
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+@pytest.mark.parametrize("fen, legal", ENPASSANT)
+def testEnpassantLegal(stateClass, fen, legal):
+    gs = stateClass(fen)
+    assert gs.enpassantPossible != ()
+    assert Tablebase.enpassantLegal(gs) == legal
+    assert gs.getFen() == fen
+    assert any(move.isEnpassantMove for move in gs.getValidMoves()) == legal
+
+
+@pytest.mark.parametrize("stateClass", STATES)
+def testProbeSkipsLegalEnpassant(tmp_path, stateClass):
+    writeTable(tmp_path, "KPvKP", {tableIndex(True, ["a5", "h8", "e5", "d5"]): 5})
+    tables = Tablebase.Tablebases(str(tmp_path))
+    assert tables.probe(stateClass("7k/8/8/K2pP3/8/8/8/8 w - d6 0 2")) is None
+    assert tables.probe(stateClass("7k/8/8/K2pP3/8/8/8/8 w - - 0 2")) == 5
+    tables.close()
+
+
+def testSignatures():
+    assert Tablebase.makeSignature(["P"], ["Q"]) == ("KQvKP", True)
+    assert Tablebase.makeSignature(["R", "N"], []) == ("KRNvK", False)
+    assert Tablebase.signaturePieces("KRvKN") == ["wK", "bK", "wR", "bN"]
+    assert Tablebase.dependencies("KPvK") == {"KQvK", "KRvK", "KBvK", "KNvK"}
+    assert all(len(sig) - 2 <= Tablebase.MAX_PIECES for sig in Tablebase.allSignatures())
+
+
+def testRejectsOtherFiles(tmp_path):
+    (tmp_path / "KRvK.tb").write_bytes(b"XXXX" + bytes(100))
+    with pytest.raises(ValueError):
+        Tablebase.Tablebases(str(tmp_path)).probe(ChessEngine.GameState("4k3/8/8/8/8/8/8/R3K3 w - - 0 1"))
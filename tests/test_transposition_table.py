@@ -0,0 +1,85 @@
+from Chess import ChessEngine, TranspositionTable as TT
+
+
+def newTable():
+    return TT.TranspositionTable(1)
+
+
+def sameBucket(tt, key, n):
+    return key + n * (tt.bucketMask + 1)
+
+
+def testStoreAndProbe():
+    tt = newTable()
+    assert tt.probe(12345) is None
+    tt.store(12345, 7, -250, TT.LOWER_BOUND, 999)
+    assert tt.probe(12345) == (7, -250, TT.LOWER_BOUND, 999)
+    assert tt.probe(sameBucket(tt, 12345, 1)) is None
+
+
+def testFullWidthKeysAndMateScores():
+    tt = newTable()
+    key = (1 << 64) - 3
+    tt.store(key, 40, 99990, TT.EXACT)
+    assert tt.probe(key) == (40, 99990, TT.EXACT, 0)
+
+
+def testDeeperEntryIsPreferredAndShallowerGoesToSecondSlot():
+    tt = newTable()
+    deep, shallow = 5, sameBucket(tt, 5, 1)
+    tt.store(deep, 8, 10, TT.EXACT)
+    tt.store(shallow, 2, 20, TT.EXACT)
+    assert tt.probe(deep)[0] == 8
+    assert tt.probe(shallow)[0] == 2
+    tt.store(sameBucket(tt, 5, 2), 1, 30, TT.EXACT)
+    assert tt.probe(deep) is not None
+    assert tt.probe(shallow) is None
+
+
+def testEntriesFromEarlierSearchesAreReplacedFirst():
+    tt = newTable()
+    old, new = 9, sameBucket(tt, 9, 1)
+    tt.store(old, 10, 0, TT.EXACT)
+    tt.newSearch()
+    tt.store(new, 1, 0, TT.EXACT)
+    #the new entry takes the preferred slot and the old one is demoted rather than lost
+    assert tt.probe(new)[0] == 1
+    assert tt.probe(old)[0] == 10
+    tt.store(sameBucket(tt, 9, 2), 1, 0, TT.EXACT)
+    assert tt.probe(old) is None
+
+
+def testRestoringWithoutAMoveKeepsTheKnownMove():
+    tt = newTable()
+    tt.store(77, 3, 0, TT.LOWER_BOUND, 321)
+    tt.store(77, 4, 5, TT.UPPER_BOUND, 0)
+    assert tt.probe(77) == (4, 5, TT.UPPER_BOUND, 321)
+
+
+def testHashfullCountsOnlyTheCurrentSearch():
+    tt = newTable()
+    for key in range(1, 2001):
+        tt.store(key, 1, 0, TT.EXACT)
+    assert tt.hashfull() > 0
+    tt.newSearch()
+    assert tt.hashfull() == 0
+    tt.clear()
+    assert tt.probe(1) is None
+
+
+def testTablesOnOneBufferShareEntries():
+    buffer = bytearray(TT.tableBytes(1))
+    writer = TT.TranspositionTable(buffer=buffer)
+    reader = TT.TranspositionTable(buffer=buffer)
+    writer.store(4242, 6, 17, TT.EXACT, 1)
+    assert reader.probe(4242) == (6, 17, TT.EXACT, 1)
+
+
+def testMoveEncodingRoundTrips():
+    gs = ChessEngine.GameState("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1")
+    for move in gs.getValidMoves():
+        code = TT.encodeMove(move)
+        assert code != 0
+        assert TT.decodeMove(code, gs.board) == move
+    assert TT.encodeMove(None) == 0
+    assert TT.decodeMove(0, gs.board) is None
@@ -0,0 +1,152 @@
+import io
+import pytest
+from Chess import ChessEngine, SmartMoveFinder, UciEngine
+
+AFTER_E4 = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+
+def newEngine():
+    out = io.StringIO()
+    return UciEngine.UciEngine(out), out
+
+
+def lines(out):
+    return out.getvalue().splitlines()
+
+
+def finish(engine):
+    engine.searchThread.join(30)
+    assert not engine.searchThread.is_alive()
+
+
+def testUciListsOptions():
+    engine, out = newEngine()
+    engine.handle("uci")
+    sent = lines(out)
+    assert sent[0] == "id name " + UciEngine.ENGINE_NAME
+    assert sent[-1] == "uciok"
+    assert any(line.startswith("option name Hash type spin") for line in sent)
+
+
+def testPositionWithMoves():
+    engine, out = newEngine()
+    engine.handle("position startpos moves e2e4")
+    assert engine.gs.getFen() == AFTER_E4
+    engine.handle("position fen " + AFTER_E4 + " moves e7e5 g1f3")
+    assert engine.gs.getFen() == "rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2"
+
+
+def testPositionStopsAtAnIllegalMove():
+    engine, out = newEngine()
+    engine.handle("position startpos moves e2e4 e2e4 d7d5")
+    assert engine.gs.getFen() == AFTER_E4
+    assert "info string illegal move e2e4" in lines(out)
+
+
+def testUciMovePromotesToAQueenByDefault():
+    gs = ChessEngine.GameState("4k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+    assert UciEngine.parseUciMove(gs, "a7a8").getChessNotation() == "a7a8q"
+    assert UciEngine.parseUciMove(gs, "a7a8n").getChessNotation() == "a7a8n"
+    assert UciEngine.parseUciMove(gs, "a7a6") is None
+
+
+def testGoSendsALegalBestmove():
+    engine, out = newEngine()
+    engine.handle("position startpos moves e2e4")
+    engine.handle("go depth 2")
+    finish(engine)
+    sent = lines(out)
+    assert any(line.startswith("info depth 2 ") for line in sent)
+    best = sent[-1].split()
+    assert best[0] == "bestmove"
+    assert UciEngine.parseUciMove(ChessEngine.GameState(AFTER_E4), best[1]) is not None
+
+
+def testGoWithoutLegalMoves():
+    engine, out = newEngine()
+    engine.handle("position fen 7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+    engine.handle("go depth 1")
+    finish(engine)
+    assert lines(out)[-1] == "bestmove 0000"
+
+
+def testPonderWaitsForPonderhit():
+    engine, out = newEngine()
+    engine.handle("position startpos")
+    engine.handle("go ponder wtime 1000 btime 1000")
+    engine.searchThread.join(0.3)
+    assert engine.searchThread.is_alive()
+    engine.handle("ponderhit")
+    finish(engine)
+    assert lines(out)[-1].startswith("bestmove ")
+
+
+def testStopEndsAnInfiniteSearch():
+    engine, out = newEngine()
+    engine.handle("position startpos")
+    engine.handle("go infinite")
+    engine.handle("stop")
+    assert engine.searchThread is None
+    assert lines(out)[-1].startswith("bestmove ")
+
+
+@pytest.mark.parametrize("command", ["position fen garbage", "position fen 8/8/8/8/8/8/8/8 w - - 0 1",
+                                     "position fen rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1"])
+def testBadFenKeepsThePosition(command):
+    engine, out = newEngine()
+    engine.handle("position startpos moves e2e4")
+    assert engine.handle(command)
+    assert engine.gs.getFen() == AFTER_E4
+    assert lines(out)[-1].startswith("info string bad command")
+
+
+def testBadFenLeavesTheSearchRunning():
+    engine, out = newEngine()
+    engine.handle("position startpos")
+    engine.handle("go infinite")
+    thread = engine.searchThread
+    engine.handle("position fen garbage")
+    assert engine.searchThread is thread and thread.is_alive()
+    engine.handle("stop")
+    assert lines(out)[-1].startswith("bestmove ")
+
+
+@pytest.mark.parametrize("option", ["Hash", "Threads"])
+def testBadSpinValueKeepsTheOption(option):
+    engine, out = newEngine()
+    engine.handle("setoption name Hash value 2")
+    tt = engine.tt
+    assert engine.handle("setoption name %s value big" % option)
+    assert (engine.hashMB, engine.threads, engine.tt) == (2, 1, tt)
+    assert lines(out)[-1].startswith("info string bad command")
+
+
+@pytest.mark.parametrize("command", ["go wtime x", "go movetime 1.5"])
+def testBadGoDoesNotSearch(command):
+    engine, out = newEngine()
+    assert engine.handle(command)
+    assert engine.searchThread is None
+    assert lines(out)[-1].startswith("info string bad command")
+
+
+def testLoopSurvivesBadInput():
+    engine, out = newEngine()
+    engine.loop(io.StringIO("position fen garbage\nsetoption name Hash value big\ngo wtime x\nisready\nquit\n"))
+    sent = lines(out)
+    assert sum(line.startswith("info string bad command") for line in sent) == 3
+    assert sent[-1] == "readyok"
+
+
+@pytest.mark.parametrize("score, text", [(35, "cp 35"), (-120, "cp -120"),
+                                         (SmartMoveFinder.CHECKMATE - 1, "mate 1"),
+                                         (-(SmartMoveFinder.CHECKMATE - 2), "mate -1"),
+                                         (SmartMoveFinder.MATE_BOUND - 5, "mate 3")])
+def testScoreToUci(score, text):
+    assert UciEngine.scoreToUci(score) == text
+
+
+def testMoveTime():
+    assert UciEngine.moveTime({}, True) is None
+    assert UciEngine.moveTime({"movetime": 500}, True) == pytest.approx(0.5 - UciEngine.MOVE_OVERHEAD)
+    assert UciEngine.moveTime({"wtime": 30000, "btime": 1000}, True) == pytest.approx(1 - UciEngine.MOVE_OVERHEAD)
+    assert UciEngine.moveTime({"wtime": 30000, "btime": 1000}, False) < 0.5